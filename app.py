@@ -1,15 +1,23 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import time
-import random
-import yaml
-import os
-import json
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from collections import Counter
+
+from skyfracture import DetectionEngine, EventLog, ExportPipeline, IngestWorker, PackLoader, PackWatcher
+from skyfracture.metrics import serve_prometheus, write_prometheus
+from skyfracture.render import (
+    ENTITY_LABELS,
+    RenderCache,
+    alert_cards_html,
+    count_bar_figure,
+    distribution_counts,
+    entity_scores_figure,
+    entity_scores_frame,
+    event_cards_html,
+    event_type_pie_figure,
+    pattern_stats_frame,
+    score_trend_figure,
+    stage_latency_frame,
+)
 
 # Set page configuration
 st.set_page_config(
@@ -82,226 +90,100 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'events' not in st.session_state:
-    st.session_state.events = []
-if 'alerts' not in st.session_state:
-    st.session_state.alerts = []
-if 'fracture_scores' not in st.session_state:
-    st.session_state.fracture_scores = []
-if 'detection_packs' not in st.session_state:
-    st.session_state.detection_packs = []
-if 'simulation_running' not in st.session_state:
-    st.session_state.simulation_running = False
-if 'last_update' not in st.session_state:
-    st.session_state.last_update = datetime.now()
-if 'current_fracture_score' not in st.session_state:
-    st.session_state.current_fracture_score = 0.0
-if 'total_events' not in st.session_state:
-    st.session_state.total_events = 0
-if 'total_alerts' not in st.session_state:
-    st.session_state.total_alerts = 0
-if 'alert_by_pattern' not in st.session_state:
-    st.session_state.alert_by_pattern = {}
-if 'events_by_user' not in st.session_state:
-    st.session_state.events_by_user = {}
-if 'events_by_type' not in st.session_state:
-    st.session_state.events_by_type = {}
-if 'events_by_location' not in st.session_state:
-    st.session_state.events_by_location = {}
+EVENT_LOG_DIR = "./event_log/"
+PACK_CACHE_DIR = "./.pack_cache/"
+EXPORT_SPILL_DIR = "./export_spill/"
+DEFAULT_EXPORT_SINKS = "file:./export/alerts.ndjson.gz"
+REVIEW_LIMIT = 1000
+TIME_RANGES = {
+    "Live": None,
+    "Last Hour": 3600,
+    "Last Day": 24 * 3600,
+    "Last Week": 7 * 24 * 3600,
+}
 
-# Constants for simulation
-USERS = [
-    {"user_id": "alice", "normal_location": "New York", "role": "user"},
-    {"user_id": "bob", "normal_location": "Chicago", "role": "user"},
-    {"user_id": "charlie", "normal_location": "San Francisco", "role": "admin"},
-    {"user_id": "dave", "normal_location": "Boston", "role": "user"},
-    {"user_id": "eve", "normal_location": "London", "role": "executive"},
-]
+# One event log per server process, shared by all sessions writing to it
+@st.cache_resource
+def get_event_log(directory):
+    return EventLog(directory)
 
-LOCATIONS = ["New York", "Chicago", "San Francisco", "Boston", "London", "Beijing", "Tokyo", "Sydney"]
-EVENT_TYPES = [
-    "successful_login",
-    "failed_login",
-    "admin_access",
-    "file_access",
-    "vpn_connection",
-    "database_query",
-    "config_change",
-    "data_export"
-]
+# One detection engine, ingestion worker and render cache per server process.
+# Every session reads the same versioned snapshots, so an extra viewer costs
+# a rerun of the script but no extra ingestion or detection work.
+@st.cache_resource
+def get_engine():
+    return DetectionEngine(event_log=get_event_log(EVENT_LOG_DIR))
 
-# Function to load detection packs
-def load_detection_packs(directory_or_file):
-    """Load detection packs from a directory or a single YAML file."""
-    packs = []
-    if os.path.isdir(directory_or_file):
-        for file in os.listdir(directory_or_file):
-            if file.endswith('.yaml') or file.endswith('.yml'):
-                try:
-                    with open(os.path.join(directory_or_file, file), 'r') as f:
-                        pack = yaml.safe_load(f)
-                        packs.append(pack)
-                except Exception as e:
-                    st.error(f"Error loading detection pack {file}: {e}")
-    elif os.path.isfile(directory_or_file) and (directory_or_file.endswith('.yaml') or directory_or_file.endswith('.yml')):
-        try:
-            with open(directory_or_file, 'r') as f:
-                pack = yaml.safe_load(f)
-                packs.append(pack)
-        except Exception as e:
-            st.error(f"Error loading detection pack {directory_or_file}: {e}")
-    return packs
+@st.cache_resource
+def get_worker():
+    return IngestWorker(get_engine())
 
-# Function to check if a pattern matches an event
-def pattern_matches(event, pattern):
-    # Simplified pattern matching for demo
-    for cond in pattern.get('conditions', []):
-        if cond['type'] == "time_window":
-            hour = event['hour']
-            start, end = [int(t.split(":")[0]) for t in cond['not_between']]
-            if start <= hour <= end:
-                return False  # Not after hours
-        if cond['type'] == "geo_location":
-            if event['location'] in cond.get('not_in_locations', []):
-                return False
-        if cond['type'] == "ip_range":
-            if event['ip_address'].startswith('10.') or event['ip_address'].startswith('192.168.'):
-                return False
-        if cond['type'] == "role_check":
-            if event['role'] not in cond.get('roles', []):
-                return False
-    return True  # All conditions pass
+# Loaders remember what they parsed, so reloading a path only re-reads changed files
+@st.cache_resource
+def get_pack_loader(path):
+    return PackLoader(path, cache_dir=PACK_CACHE_DIR)
 
-# Function to find matching pattern
-def find_matching_pattern(event, patterns):
-    for pattern in patterns:
-        if pattern_matches(event, pattern):
-            return pattern
-    return None
+@st.cache_resource
+def get_pack_watcher():
+    return PackWatcher(get_engine())
 
-# Function to generate a simulated security event
-def generate_security_event(patterns):
-    user = random.choice(USERS)
-    location = random.choice(LOCATIONS)
-    hour = random.randint(0, 23)
-    event_type = random.choice(EVENT_TYPES)
-    ip = f"10.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}" \
-        if random.random() < 0.7 else f"203.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}"
+@st.cache_resource
+def get_render_cache():
+    return RenderCache(get_engine().metrics)
 
-    base_score = 0.1 + 0.4 * (event_type in ["admin_access", "vpn_connection", "data_export"])
-    matched_pattern = None
-    recommendations = []
-    score = base_score
-    severity = "low"
+# One export pipeline per set of sinks; its threads outlive the sessions
+@st.cache_resource
+def get_export_pipeline(urls):
+    return ExportPipeline(list(urls), spill_dir=EXPORT_SPILL_DIR)
 
-    # Pattern matching
-    pattern = find_matching_pattern(
-        {
-            "hour": hour,
-            "location": location,
-            "ip_address": ip,
-            "event_type": event_type,
-            "role": user["role"]
-        }, patterns
-    )
-    
-    if pattern:
-        matched_pattern = pattern["name"]
-        score += pattern.get("score_modifier", 0.6)
-        recommendations = pattern.get("recommended_actions", [])
-        severity = pattern.get("severity", "medium")
+# One Prometheus endpoint per port for the server process
+@st.cache_resource
+def get_metrics_server(port):
+    return serve_prometheus(get_engine().collect_metrics, port)
 
-    # Clamp score
-    score = min(score, 1.0)
-    
-    event = {
-        "event_id": st.session_state.total_events + 1,
-        "timestamp": datetime.now(),
-        "user_id": user["user_id"],
-        "event_type": event_type,
-        "location": location,
-        "ip_address": ip,
-        "hour": hour,
-        "role": user["role"],
-        "score": round(score, 3),
-        "matched_pattern": matched_pattern,
-        "recommendations": recommendations,
-        "severity": severity
-    }
-    
-    st.session_state.total_events += 1
-    
-    # Update statistics
-    if user["user_id"] in st.session_state.events_by_user:
-        st.session_state.events_by_user[user["user_id"]] += 1
-    else:
-        st.session_state.events_by_user[user["user_id"]] = 1
-        
-    if event_type in st.session_state.events_by_type:
-        st.session_state.events_by_type[event_type] += 1
-    else:
-        st.session_state.events_by_type[event_type] = 1
-        
-    if location in st.session_state.events_by_location:
-        st.session_state.events_by_location[location] += 1
-    else:
-        st.session_state.events_by_location[location] = 1
-    
-    # Create alert if score is high enough
-    if score > 0.7:
-        alert = event.copy()
-        st.session_state.alerts.insert(0, alert)
-        st.session_state.total_alerts += 1
-        
-        # Update alert by pattern stats
-        if matched_pattern:
-            if matched_pattern in st.session_state.alert_by_pattern:
-                st.session_state.alert_by_pattern[matched_pattern] += 1
-            else:
-                st.session_state.alert_by_pattern[matched_pattern] = 1
-    
-    # Update fracture score (moving average)
-    st.session_state.current_fracture_score = 0.7 * st.session_state.current_fracture_score + 0.3 * score
-    st.session_state.fracture_scores.append({
-        "timestamp": datetime.now(),
-        "score": st.session_state.current_fracture_score
-    })
-    
-    # Keep only the last 100 events and scores for performance
-    st.session_state.events.insert(0, event)
-    if len(st.session_state.events) > 100:
-        st.session_state.events = st.session_state.events[:100]
-    if len(st.session_state.alerts) > 50:
-        st.session_state.alerts = st.session_state.alerts[:50]
-    if len(st.session_state.fracture_scores) > 100:
-        st.session_state.fracture_scores = st.session_state.fracture_scores[-100:]
-    
-    st.session_state.last_update = datetime.now()
-    return event
+engine = get_engine()
+worker = get_worker()
+pack_watcher = get_pack_watcher()
 
 # Function to start simulation
 def start_simulation():
-    st.session_state.simulation_running = True
+    worker.start()
 
 # Function to stop simulation
 def stop_simulation():
-    st.session_state.simulation_running = False
+    worker.stop()
 
 # Function to reset simulation
 def reset_simulation():
-    st.session_state.events = []
-    st.session_state.alerts = []
-    st.session_state.fracture_scores = []
-    st.session_state.simulation_running = False
-    st.session_state.last_update = datetime.now()
-    st.session_state.current_fracture_score = 0.0
-    st.session_state.total_events = 0
-    st.session_state.total_alerts = 0
-    st.session_state.alert_by_pattern = {}
-    st.session_state.events_by_user = {}
-    st.session_state.events_by_type = {}
-    st.session_state.events_by_location = {}
+    worker.reset()
+
+# Function to apply the event rate slider to the shared worker
+def set_event_rate():
+    worker.events_per_second = st.session_state.event_rate
+
+# Function to start or stop watching the detection pack path for changes
+def set_pack_watching():
+    if st.session_state.watch_packs:
+        pack_watcher.start(get_pack_loader(st.session_state.pack_path))
+    else:
+        pack_watcher.stop()
+
+# Function to start or stop exporting alerts to the configured sinks
+def set_export():
+    urls = tuple(url.strip() for url in st.session_state.export_sinks.split(",") if url.strip())
+    if worker.export is not None:
+        worker.export.stop()
+        worker.export = None
+    if st.session_state.export_alerts and urls:
+        pipeline = get_export_pipeline(urls)
+        pipeline.start()
+        engine.metrics.register_gauge("export_queue_depth", pipeline.queued,
+                                      "Records waiting in the export queues.")
+        worker.export = pipeline
+
+# Function to toggle engine instrumentation for all viewers
+def set_instrumentation():
+    engine.metrics.enabled = st.session_state.instrumentation
 
 # Sidebar
 with st.sidebar:
@@ -310,43 +192,76 @@ with st.sidebar:
     
     # Detection pack selection
     st.subheader("Detection Packs")
-    detection_pack_path = st.text_input("Detection Pack Path", value="./detection_packs/")
+    detection_pack_path = st.text_input("Detection Pack Path", value="./detection_packs/", key="pack_path")
     
     if st.button("Load Detection Packs"):
-        packs = load_detection_packs(detection_pack_path)
+        packs, _ = get_pack_loader(detection_pack_path).scan(on_error=st.error)
         if packs:
-            st.session_state.detection_packs = packs
-            all_patterns = []
-            for pack in packs:
-                all_patterns.extend(pack.get("patterns", []))
-            st.session_state.all_patterns = all_patterns
+            all_patterns = engine.load_packs(packs)
             st.success(f"Loaded {len(packs)} detection packs with {len(all_patterns)} patterns")
         else:
             st.error("No detection packs found at the specified path")
     
+    # Hot reload: changed pack files are swapped in while ingestion continues
+    st.checkbox("Watch for Pack Changes", value=pack_watcher.running, key="watch_packs",
+                on_change=set_pack_watching)
+    if pack_watcher.running and pack_watcher.last_reload:
+        st.caption(f"Reloaded {', '.join(pack_watcher.last_changed)} at "
+                   f"{pack_watcher.last_reload.strftime('%H:%M:%S')}")
+    
     # Simulation controls
     st.subheader("Simulation Controls")
     
     col1, col2 = st.columns(2)
     with col1:
-        if st.button("Start Simulation", disabled=st.session_state.simulation_running):
+        if st.button("Start Simulation", disabled=worker.running or not engine.packs):
             start_simulation()
     with col2:
-        if st.button("Stop Simulation", disabled=not st.session_state.simulation_running):
+        if st.button("Stop Simulation", disabled=not worker.running):
             stop_simulation()
     
+    if worker.errors:
+        st.error(f"{worker.errors} batches ({worker.failed_events} events) failed to process. Last error at "
+                 f"{worker.last_error_at.strftime('%H:%M:%S')}: {worker.last_error}")
+    
     if st.button("Reset Simulation"):
         reset_simulation()
     
-    # Simulation speed
-    simulation_speed = st.slider("Simulation Speed", min_value=0.1, max_value=5.0, value=1.0, step=0.1)
+    # Event processing rate (shared by all viewers) and this viewer's refresh rate are independent
+    st.slider(
+        "Event Rate (events/s)", min_value=1, max_value=10000, value=int(worker.events_per_second), step=1,
+        key="event_rate", on_change=set_event_rate
+    )
+    refresh_interval = st.slider("Refresh Interval (s)", min_value=0.5, max_value=10.0, value=1.0, step=0.5)
+    
+    # Per-stage and per-pattern timing, off by default
+    st.checkbox("Enable Instrumentation", value=engine.metrics.enabled, key="instrumentation",
+                on_change=set_instrumentation)
+    
+    # SIEM and alert export, configured by the packs' integrations settings
+    st.subheader("Alert Export")
+    st.text_input("Export Sinks", value=DEFAULT_EXPORT_SINKS, key="export_sinks",
+                  help="Comma-separated file:, unix: or http(s):// destinations")
+    st.checkbox("Export Alerts", value=worker.export is not None, key="export_alerts", on_change=set_export)
+    if worker.export is not None:
+        for stats in worker.export.stats():
+            st.caption(f"{stats['sink']}: {stats['sent_records']} sent, {stats['queued']} queued, "
+                       f"{stats['spilled']} spilled, {stats['dropped']} dropped")
+            if stats["last_error"]:
+                st.caption(f"Last error: {stats['last_error']}")
+    
+    # Time range for the trend and distribution charts, served from rollups
+    time_range = st.selectbox("Time Range", list(TIME_RANGES.keys()))
+    
+    # Everything below renders from one consistent snapshot of the engine
+    snapshot = engine.snapshot(rollup_window=TIME_RANGES[time_range])
     
     # Display stats
     st.subheader("Statistics")
-    st.metric("Total Events", st.session_state.total_events)
-    st.metric("Total Alerts", st.session_state.total_alerts)
-    st.metric("Current Fracture Score", f"{st.session_state.current_fracture_score:.3f}")
-    st.text(f"Last Update: {st.session_state.last_update.strftime('%H:%M:%S')}")
+    st.metric("Total Events", snapshot.total_events)
+    st.metric("Total Alerts", snapshot.total_alerts)
+    st.metric("Current Fracture Score", f"{snapshot.current_fracture_score:.3f}")
+    st.text(f"Last Update: {snapshot.last_update.strftime('%H:%M:%S')}")
 
 # Main dashboard
 st.markdown("<h1 class='dashboard-title'>SKYFRACTURE™ Enterprise Security Dashboard</h1>", unsafe_allow_html=True)
@@ -355,58 +270,33 @@ st.markdown("<h1 class='dashboard-title'>SKYFRACTURE™ Enterprise Security Dash
 col1, col2, col3, col4 = st.columns(4)
 with col1:
     st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
-    st.metric("Fracture Score", f"{st.session_state.current_fracture_score:.3f}")
+    st.metric("Fracture Score", f"{snapshot.current_fracture_score:.3f}")
     st.markdown("</div>", unsafe_allow_html=True)
 with col2:
     st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
-    st.metric("Active Alerts", len(st.session_state.alerts))
+    st.metric("Active Alerts", len(snapshot.alerts))
     st.markdown("</div>", unsafe_allow_html=True)
 with col3:
     st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
-    st.metric("Events Today", st.session_state.total_events)
+    st.metric("Events Today", snapshot.total_events)
     st.markdown("</div>", unsafe_allow_html=True)
 with col4:
     st.markdown("<div class='metric-card'>", unsafe_allow_html=True)
-    st.metric("Detection Patterns", len(st.session_state.all_patterns) if hasattr(st.session_state, 'all_patterns') else 0)
+    st.metric("Detection Patterns", snapshot.pattern_count)
     st.markdown("</div>", unsafe_allow_html=True)
 
+# Panels are rebuilt only when the data version they depend on changes
+render_cache = get_render_cache()
+events_by_user, events_by_type, events_by_location = distribution_counts(snapshot)
+
 # Main content
 col1, col2 = st.columns([2, 1])
 
 with col1:
     # Fracture Score Chart
     st.subheader("Fracture Score Trend")
-    if st.session_state.fracture_scores:
-        df_scores = pd.DataFrame([
-            {"timestamp": score["timestamp"], "score": score["score"]} 
-            for score in st.session_state.fracture_scores
-        ])
-        
-        fig = px.line(
-            df_scores, 
-            x="timestamp", 
-            y="score", 
-            title="System Fracture Score Over Time",
-            labels={"timestamp": "Time", "score": "Fracture Score"},
-            line_shape="spline"
-        )
-        fig.update_layout(
-            xaxis_title="Time",
-            yaxis_title="Fracture Score",
-            yaxis_range=[0, 1],
-            plot_bgcolor="#1e2130",
-            paper_bgcolor="#1e2130",
-            font=dict(color="#ffffff"),
-            margin=dict(l=20, r=20, t=30, b=20),
-        )
-        fig.add_shape(
-            type="line",
-            x0=df_scores["timestamp"].min(),
-            x1=df_scores["timestamp"].max(),
-            y0=0.7,
-            y1=0.7,
-            line=dict(color="red", width=2, dash="dash"),
-        )
+    fig = render_cache.get(("score_trend", time_range), snapshot.version, lambda: score_trend_figure(snapshot))
+    if fig is not None:
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No data available yet. Start the simulation to see the fracture score trend.")
@@ -414,155 +304,144 @@ with col1:
     # Event Distribution Charts
     st.subheader("Event Distribution")
     
-    tab1, tab2, tab3 = st.tabs(["By User", "By Event Type", "By Location"])
+    tab1, tab2, tab3, tab4 = st.tabs(["By User", "By Event Type", "By Location", "By Source IP"])
     
     with tab1:
-        if st.session_state.events_by_user:
-            df_users = pd.DataFrame([
-                {"user": user, "events": count} 
-                for user, count in st.session_state.events_by_user.items()
-            ])
-            fig = px.bar(
-                df_users, 
-                x="user", 
-                y="events", 
-                title="Events by User",
-                color="events",
-                color_continuous_scale="Viridis"
-            )
-            fig.update_layout(
-                xaxis_title="User",
-                yaxis_title="Event Count",
-                plot_bgcolor="#1e2130",
-                paper_bgcolor="#1e2130",
-                font=dict(color="#ffffff"),
-                margin=dict(l=20, r=20, t=30, b=20),
-            )
+        fig = render_cache.get(("events_by_user", time_range), snapshot.version, lambda: count_bar_figure(
+            events_by_user, "user", "events", "Events by User", "User", "Event Count"
+        ))
+        if fig is not None:
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No user data available yet.")
     
     with tab2:
-        if st.session_state.events_by_type:
-            df_types = pd.DataFrame([
-                {"type": event_type, "events": count} 
-                for event_type, count in st.session_state.events_by_type.items()
-            ])
-            fig = px.pie(
-                df_types, 
-                values="events", 
-                names="type", 
-                title="Events by Type",
-                hole=0.4,
-                color_discrete_sequence=px.colors.sequential.Viridis
-            )
-            fig.update_layout(
-                plot_bgcolor="#1e2130",
-                paper_bgcolor="#1e2130",
-                font=dict(color="#ffffff"),
-                margin=dict(l=20, r=20, t=30, b=20),
-            )
+        fig = render_cache.get(("events_by_type", time_range), snapshot.version,
+                               lambda: event_type_pie_figure(events_by_type))
+        if fig is not None:
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No event type data available yet.")
     
     with tab3:
-        if st.session_state.events_by_location:
-            df_locations = pd.DataFrame([
-                {"location": location, "events": count} 
-                for location, count in st.session_state.events_by_location.items()
-            ])
-            fig = px.bar(
-                df_locations, 
-                x="location", 
-                y="events", 
-                title="Events by Location",
-                color="events",
-                color_continuous_scale="Viridis"
-            )
-            fig.update_layout(
-                xaxis_title="Location",
-                yaxis_title="Event Count",
-                plot_bgcolor="#1e2130",
-                paper_bgcolor="#1e2130",
-                font=dict(color="#ffffff"),
-                margin=dict(l=20, r=20, t=30, b=20),
-            )
+        fig = render_cache.get(("events_by_location", time_range), snapshot.version, lambda: count_bar_figure(
+            events_by_location, "location", "events", "Events by Location", "Location", "Event Count"
+        ))
+        if fig is not None:
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No location data available yet.")
+    
+    with tab4:
+        # Source IPs are only tracked as since-start heavy hitters
+        fig = render_cache.get("events_by_ip", snapshot.version, lambda: count_bar_figure(
+            snapshot.events_by_ip, "ip_address", "events", "Top Source IPs", "Source IP", "Event Count", sort=True
+        ))
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No source IP data available yet.")
+    
+    # Per-entity fracture scores, to see which user, location or source IP drives a spike
+    st.subheader("Most Fractured Entities")
+    entity_col1, entity_col2 = st.columns(2)
+    with entity_col1:
+        entity_type = st.selectbox("Entity Type", ["All"] + list(ENTITY_LABELS.values()))
+    with entity_col2:
+        entity_count = st.slider("Entities Shown", min_value=5, max_value=50, value=10, step=5)
+    entity_field = {label: field for field, label in ENTITY_LABELS.items()}.get(entity_type)
+    df_entities = entity_scores_frame(snapshot.entity_scores, entity_field, entity_count)
+    fig = render_cache.get(("entity_scores", entity_field, entity_count), snapshot.version,
+                           lambda: entity_scores_figure(df_entities))
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No entity scores available yet.")
 
 with col2:
     # Active Alerts
     st.subheader("Active Alerts")
-    if st.session_state.alerts:
-        for alert in st.session_state.alerts[:10]:  # Show only top 10 alerts
-            severity_class = alert.get("severity", "medium").lower()
-            st.markdown(f"""
-            <div class='alert-card'>
-                <span class='{severity_class}'>{alert.get("severity", "Medium").upper()}</span>: {alert.get("matched_pattern", "Unknown Pattern")}
-                <br><strong>User:</strong> {alert.get("user_id")} | <strong>Type:</strong> {alert.get("event_type")}
-                <br><strong>Location:</strong> {alert.get("location")} | <strong>Score:</strong> {alert.get("score")}
-                <br><strong>Time:</strong> {alert.get("timestamp").strftime('%H:%M:%S')}
-            </div>
-            """, unsafe_allow_html=True)
+    if snapshot.alerts:
+        # Show only top 10 alerts
+        cards = render_cache.get("alerts", snapshot.alert_version,
+                                 lambda: alert_cards_html(snapshot.alerts.records(10)))
+        st.markdown(cards, unsafe_allow_html=True)
     else:
         st.info("No active alerts.")
     
     # Top Detection Patterns
     st.subheader("Top Detection Patterns")
-    if st.session_state.alert_by_pattern:
-        df_patterns = pd.DataFrame([
-            {"pattern": pattern, "alerts": count} 
-            for pattern, count in st.session_state.alert_by_pattern.items()
-        ]).sort_values("alerts", ascending=False)
-        
-        fig = px.bar(
-            df_patterns, 
-            x="pattern", 
-            y="alerts", 
-            title="Alerts by Pattern",
-            color="alerts",
-            color_continuous_scale="Reds"
-        )
-        fig.update_layout(
-            xaxis_title="Pattern",
-            yaxis_title="Alert Count",
-            plot_bgcolor="#1e2130",
-            paper_bgcolor="#1e2130",
-            font=dict(color="#ffffff"),
-            margin=dict(l=20, r=20, t=30, b=20),
-        )
+    fig = render_cache.get("alert_by_pattern", snapshot.alert_version, lambda: count_bar_figure(
+        snapshot.alert_by_pattern, "pattern", "alerts", "Alerts by Pattern", "Pattern", "Alert Count",
+        color_scale="Reds", sort=True
+    ))
+    if fig is not None:
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No pattern data available yet.")
     
     # Recent Events
     st.subheader("Recent Events")
-    if st.session_state.events:
-        for event in st.session_state.events[:5]:  # Show only top 5 events
-            if event.get("matched_pattern"):
-                st.markdown(f"""
-                <div class='anomaly-card'>
-                    <strong>{event.get("event_type")}</strong> by {event.get("user_id")} ({event.get("role")})
-                    <br><strong>Pattern:</strong> {event.get("matched_pattern")}
-                    <br><strong>Score:</strong> {event.get("score")} | <strong>Location:</strong> {event.get("location")}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class='event-card'>
-                    <strong>{event.get("event_type")}</strong> by {event.get("user_id")} ({event.get("role")})
-                    <br><strong>Score:</strong> {event.get("score")} | <strong>Location:</strong> {event.get("location")}
-                </div>
-                """, unsafe_allow_html=True)
+    if snapshot.events:
+        # Show only top 5 events
+        cards = render_cache.get("events", snapshot.version, lambda: event_cards_html(snapshot.events.records(5)))
+        st.markdown(cards, unsafe_allow_html=True)
     else:
         st.info("No events recorded yet.")
 
-# Run simulation if active
-if st.session_state.simulation_running and hasattr(st.session_state, 'all_patterns'):
-    event = generate_security_event(st.session_state.all_patterns)
-    time.sleep(1.0 / simulation_speed)
+# Incident review over the persistent event log
+with st.expander("Incident Review"):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        lookback_hours = st.number_input("Lookback (hours)", min_value=1, max_value=24 * 30, value=24)
+    with col2:
+        review_min_score = st.slider("Minimum Score", min_value=0.0, max_value=1.0, value=0.7, step=0.05)
+    with col3:
+        review_user = st.text_input("User (optional)")
+    
+    if st.button("Query Event Log"):
+        filters = {"min_score": review_min_score}
+        if review_user:
+            filters["user_id"] = review_user
+        review_end = datetime.now()
+        results = get_event_log(EVENT_LOG_DIR).query(review_end - timedelta(hours=lookback_hours), review_end, filters,
+                                                     limit=REVIEW_LIMIT)
+        if len(results) < REVIEW_LIMIT:
+            st.write(f"{len(results)} matching events")
+        else:
+            st.write(f"Latest {REVIEW_LIMIT} matching events")
+        if len(results):
+            st.dataframe(results.to_frame().iloc[::-1], use_container_width=True)
+
+# Engine diagnostics from the instrumentation
+with st.expander("Diagnostics"):
+    if not engine.metrics.enabled:
+        st.info("Instrumentation is disabled. Enable it in the control panel to collect timings.")
+    metrics = engine.collect_metrics()
+    st.metric("Queue Depth", worker.queue.qsize())
+    st.subheader("Stage Latency")
+    st.dataframe(stage_latency_frame(metrics), use_container_width=True, hide_index=True)
+    st.subheader("Slowest Patterns")
+    st.dataframe(pattern_stats_frame(metrics), use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        metrics_path = st.text_input("Prometheus File", value="./skyfracture.prom")
+        if st.button("Write Metrics File"):
+            write_prometheus(metrics, metrics_path)
+            st.success(f"Wrote {metrics_path}")
+    with col2:
+        metrics_port = st.number_input("Metrics Port", min_value=1024, max_value=65535, value=9464)
+        if st.button("Serve /metrics"):
+            try:
+                get_metrics_server(int(metrics_port))
+                st.success(f"Serving http://127.0.0.1:{int(metrics_port)}/metrics")
+            except OSError as e:
+                st.error(f"Could not serve metrics on port {int(metrics_port)}: {e}")
+
+# Refresh the dashboard while the background worker is ingesting
+if worker.running:
+    time.sleep(refresh_interval)
     st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
 
 # Footer
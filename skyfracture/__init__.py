@@ -0,0 +1,65 @@
+"""SKYFRACTURE detection engine components shared by the dashboard."""
+
+from skyfracture.baselines import BaselineEngine, BaselineStore
+from skyfracture.batch import BatchMatcher, BatchResult, Vocabulary
+from skyfracture.engine import DetectionEngine, EngineSnapshot
+from skyfracture.entities import EntityScores
+from skyfracture.eventlog import EventLog
+from skyfracture.export import ExportPipeline, ExportRules
+from skyfracture.iprange import IPRangeIndex, int_to_ip, ip_to_int
+from skyfracture.loadgen import GeneratedBatch, LoadGenerator
+from skyfracture.matching import (
+    CompiledPattern,
+    compile_pattern,
+    compile_patterns,
+    find_matching_pattern,
+    pattern_matches,
+    PatternIndex,
+)
+from skyfracture.metrics import EngineMetrics
+from skyfracture.network import ConditionNetwork
+from skyfracture.packs import load_detection_packs, PackLoader, PackWatcher
+from skyfracture.rollups import MultiResolutionRollup
+from skyfracture.sequences import SequenceEngine
+from skyfracture.sharded import ShardedEngine
+from skyfracture.store import EventStore, EventTable, RingBuffer
+from skyfracture.topk import SpaceSaving
+from skyfracture.worker import IngestWorker
+
+__all__ = [
+    "BaselineEngine",
+    "BaselineStore",
+    "BatchMatcher",
+    "BatchResult",
+    "CompiledPattern",
+    "compile_pattern",
+    "compile_patterns",
+    "ConditionNetwork",
+    "DetectionEngine",
+    "EngineMetrics",
+    "EngineSnapshot",
+    "EntityScores",
+    "EventLog",
+    "EventStore",
+    "EventTable",
+    "ExportPipeline",
+    "ExportRules",
+    "find_matching_pattern",
+    "GeneratedBatch",
+    "IngestWorker",
+    "int_to_ip",
+    "IPRangeIndex",
+    "load_detection_packs",
+    "LoadGenerator",
+    "MultiResolutionRollup",
+    "ip_to_int",
+    "PackLoader",
+    "PackWatcher",
+    "pattern_matches",
+    "PatternIndex",
+    "RingBuffer",
+    "SequenceEngine",
+    "ShardedEngine",
+    "SpaceSaving",
+    "Vocabulary",
+]
@@ -0,0 +1,258 @@
+"""Streaming per-user behavioral baselines for ``behavioral_baseline``.
+
+``BaselineStore`` keeps, for every user and factor, a running weighted mean
+and variance updated with Welford's algorithm (West's weighted form when
+exponential decay is enabled). State lives in preallocated NumPy arrays
+indexed by a per-user row, so updating and checking an event are constant
+time lookups regardless of how much history a user has. Events carry only a
+factor or two, so both work factor by factor on the values present, and
+events with no baselined factor (all but logins for ``login_time``) only
+register the user.
+"""
+
+import math
+
+import numpy as np
+
+from skyfracture.sequences import event_time
+
+SECONDS_PER_DAY = 86400.0
+MIN_SAMPLES = 10
+
+# How each baseline factor is read from an event; None means "not observed"
+FACTOR_EXTRACTORS = {
+    "login_time": lambda event: event["hour"] if event["event_type"] == "successful_login" else None,
+    "session_duration": lambda event: event.get("session_duration"),
+    "data_access_volume": lambda event: event.get("data_access_volume"),
+    "application_usage": lambda event: event.get("application_usage"),
+}
+
+
+class BaselineStore:
+    """Per-user running mean and variance for a fixed list of factors.
+
+    With ``half_life_days`` set, older observations are exponentially
+    down-weighted so the baseline follows gradual changes in behavior.
+    """
+
+    def __init__(self, factors, half_life_days=None, initial_capacity=1024):
+        self.factors = list(factors)
+        self.half_life_days = half_life_days
+        self.extractors = [(i, FACTOR_EXTRACTORS[factor]) for i, factor in enumerate(self.factors)
+                           if factor in FACTOR_EXTRACTORS]
+        self.rows = {}
+        n_factors = len(self.factors)
+        self.weight = np.zeros((initial_capacity, n_factors))
+        self.mean = np.zeros((initial_capacity, n_factors))
+        self.m2 = np.zeros((initial_capacity, n_factors))
+        self.last_update = np.zeros((initial_capacity, n_factors))
+        self.first_seen = np.zeros(initial_capacity)
+
+    def _row(self, user_id, now):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.first_seen):
+                self._grow()
+            self.rows[user_id] = row
+            self.first_seen[row] = now
+        return row
+
+    def _grow(self):
+        capacity = 2 * len(self.first_seen)
+        for name in ("weight", "mean", "m2", "last_update"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity, array.shape[1]))
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        first_seen = np.zeros(capacity)
+        first_seen[:len(self.first_seen)] = self.first_seen
+        self.first_seen = first_seen
+
+    def values(self, event):
+        """Observed factor values of an event as ``{factor index: value}``."""
+        values = {}
+        for i, extractor in self.extractors:
+            value = extractor(event)
+            if value is not None:
+                values[i] = float(value)
+        return values
+
+    def deviations(self, user_id, values, now, min_baseline_days=0.0):
+        """Return ``{factor index: |value - mean| / std}`` for judgeable factors.
+
+        A factor is judged only once the user has ``min_baseline_days`` of
+        history and at least ``MIN_SAMPLES`` observations of it.
+        """
+        row = self.rows.get(user_id)
+        if row is None or now - self.first_seen[row] < min_baseline_days * SECONDS_PER_DAY:
+            return {}
+        deviations = {}
+        for i, x in values.items():
+            weight = float(self.weight[row, i])
+            if weight < MIN_SAMPLES:
+                continue
+            std = math.sqrt(float(self.m2[row, i]) / weight)
+            if std > 0:
+                deviations[i] = abs(x - float(self.mean[row, i])) / std
+        return deviations
+
+    def track(self, user_id, now):
+        """Start the user's history at ``now`` if it has not started yet."""
+        self._row(user_id, now)
+
+    def update(self, user_id, values, now):
+        """Fold an event's observed factor values into the user's baseline."""
+        row = self._row(user_id, now)
+        decay_seconds = self.half_life_days * SECONDS_PER_DAY if self.half_life_days else None
+        for i, x in values.items():
+            weight = float(self.weight[row, i])
+            m2 = float(self.m2[row, i])
+            if decay_seconds:
+                elapsed = now - float(self.last_update[row, i])
+                if elapsed > 0:
+                    decay = 0.5 ** (elapsed / decay_seconds)
+                    weight *= decay
+                    m2 *= decay
+            self.last_update[row, i] = now
+            weight += 1.0
+            mean = float(self.mean[row, i])
+            delta = x - mean
+            mean += delta / weight
+            self.weight[row, i] = weight
+            self.mean[row, i] = mean
+            self.m2[row, i] = m2 + delta * (x - mean)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def with_factors(self, factors):
+        """A store for ``factors`` keeping this store's users and the
+        baselines of the factors both have in common."""
+        store = BaselineStore(factors, self.half_life_days, initial_capacity=len(self.first_seen))
+        n = len(self.rows)
+        store.rows = dict(self.rows)
+        store.first_seen[:n] = self.first_seen[:n]
+        for new, factor in enumerate(store.factors):
+            if factor in self.factors:
+                old = self.factors.index(factor)
+                for name in ("weight", "mean", "m2", "last_update"):
+                    getattr(store, name)[:n, new] = getattr(self, name)[:n, old]
+        return store
+
+    def save(self, path):
+        """Write a snapshot of all baselines to an ``.npz`` file.
+
+        User IDs are stored as a fixed-width string array, so the file
+        loads without pickle.
+        """
+        n = len(self.rows)
+        users = np.array([str(user) for user in sorted(self.rows, key=self.rows.get)], dtype=str)
+        np.savez_compressed(
+            path,
+            factors=np.array(self.factors),
+            half_life_days=np.array(np.nan if self.half_life_days is None else self.half_life_days),
+            users=users,
+            weight=self.weight[:n],
+            mean=self.mean[:n],
+            m2=self.m2[:n],
+            last_update=self.last_update[:n],
+            first_seen=self.first_seen[:n],
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Restore a store saved with ``save()``."""
+        with np.load(path, allow_pickle=False) as data:
+            half_life = float(data["half_life_days"])
+            users = data["users"].tolist()
+            store = cls(data["factors"].tolist(), None if math.isnan(half_life) else half_life,
+                        initial_capacity=max(len(users), 1))
+            n = len(users)
+            store.rows = {user: row for row, user in enumerate(users)}
+            store.weight[:n] = data["weight"]
+            store.mean[:n] = data["mean"]
+            store.m2[:n] = data["m2"]
+            store.last_update[:n] = data["last_update"]
+            store.first_seen[:n] = data["first_seen"]
+        return store
+
+
+class BaselineEngine:
+    """Evaluate the ``behavioral_baseline`` conditions of compiled patterns.
+
+    All conditions share one ``BaselineStore`` covering the union of their
+    factors. Each event is checked against the baseline as it was before
+    the event, then folded into it. With ``include``, only patterns for
+    which it returns True are evaluated.
+    """
+
+    def __init__(self, packs, half_life_days=None, store=None, include=None):
+        self.conditions = []
+        factors = []
+        for pack in packs:
+            for compiled in pack.get("compiled_patterns", []):
+                if include is not None and not include(compiled):
+                    continue
+                for cond in compiled.baseline_conditions:
+                    for factor in cond.get("factors", []):
+                        if factor not in factors:
+                            factors.append(factor)
+                    self.conditions.append((compiled, cond))
+        self.factor_index = {factor: i for i, factor in enumerate(factors)}
+        # (compiled, min_baseline_days, deviation_threshold, factor indexes) per condition
+        self.checks = [
+            (compiled, float(cond.get("min_baseline_days", 0)), float(cond.get("deviation_threshold", 3.0)),
+             [self.factor_index[factor] for factor in cond.get("factors", [])])
+            for compiled, cond in self.conditions
+        ]
+        if store is None:
+            store = BaselineStore(factors, half_life_days)
+        elif store.factors != factors:
+            store = store.with_factors(factors)
+        self.store = store
+
+    def observe(self, event):
+        """Update baselines with an event and return deviating patterns.
+
+        Returns a dict mapping each compiled pattern whose baseline
+        conditions all fired to the largest deviation seen, in standard
+        deviations.
+        """
+        if not self.conditions:
+            return {}
+        now = event_time(event)
+        user_id = event["user_id"]
+        values = self.store.values(event)
+        if not values:
+            # Nothing to judge or learn from; the user's history still starts here
+            self.store.track(user_id, now)
+            return {}
+        hits = {}
+        failed = set()
+        deviations_by_days = {}
+        for compiled, min_days, threshold, columns in self.checks:
+            if compiled in failed:
+                continue
+            deviations = deviations_by_days.get(min_days)
+            if deviations is None:
+                deviations = deviations_by_days[min_days] = self.store.deviations(user_id, values, now, min_days)
+            deviation = max((deviations[i] for i in columns if i in deviations), default=0.0)
+            if deviation >= threshold:
+                hits[compiled] = max(deviation, hits.get(compiled, 0.0))
+            else:
+                failed.add(compiled)
+                hits.pop(compiled, None)
+        self.store.update(user_id, values, now)
+        return hits
+
+
+def baseline_bonus(pattern, deviation):
+    """Extra score for a baseline match: per standard deviation beyond the threshold."""
+    per_std = pattern.get("score_multiplier_per_std_deviation", 0.0)
+    threshold = max(
+        (float(cond.get("deviation_threshold", 3.0)) for cond in pattern.get("conditions", [])
+         if cond.get("type") == "behavioral_baseline"),
+        default=0.0,
+    )
+    return per_std * max(deviation - threshold, 0.0)
@@ -0,0 +1,226 @@
+"""Vectorized evaluation of event batches against compiled patterns.
+
+Events are passed as column arrays rather than dicts: the hour, dictionary
+encoded location / event type / role codes and the source IP as a uint32.
+Every pattern is evaluated against every event with NumPy, producing an
+events x patterns match matrix, the first matching pattern per event and
+the final event score, mirroring ``find_matching_pattern()`` and the scoring
+in ``generate_security_event()``.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from skyfracture.iprange import IPRangeIndex
+from skyfracture.matching import HIGH_RISK_EVENT_TYPES, _hour_of
+from skyfracture.network import pattern_modifier
+
+BatchResult = namedtuple("BatchResult", ["match_matrix", "first_match", "scores"])
+
+
+def _combine_columns(operator, results, n):
+    """Column-wise ``combine()`` of (value, known) mask pairs."""
+    is_or = str(operator).upper() == "OR"
+    value = np.zeros(n, dtype=bool) if is_or else np.ones(n, dtype=bool)
+    known = np.zeros(n, dtype=bool)
+    for child_value, child_known in results:
+        if is_or:
+            value |= child_value & child_known
+        else:
+            value &= child_value | ~child_known
+        known |= child_known
+    return value & known, known
+
+
+class Vocabulary:
+    """Dictionary encoding of strings to dense integer codes."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        """Return the code for a value, assigning a new one if needed."""
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode(self, values):
+        """Encode an iterable of values into an int32 array."""
+        return np.fromiter((self.code(v) for v in values), dtype=np.int32)
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class BatchMatcher:
+    """Evaluate column batches of events against a list of compiled patterns.
+
+    Each compiled condition becomes a lookup table indexed by event column
+    codes. Codes that were not in the vocabularies when the matcher was built
+    are treated as values no pattern mentions. ``compound`` conditions are
+    evaluated column-wise as (value, known) masks, with the same three-valued
+    logic as ``combine()``.
+    """
+
+    def __init__(self, compiled_patterns, locations, event_types, roles):
+        self.patterns = list(compiled_patterns)
+        self.locations = locations
+        self.event_types = event_types
+        self.roles = roles
+        for compiled in self.patterns:
+            for location in compiled.denied_locations:
+                locations.code(location)
+            for role in compiled.roles or ():
+                roles.code(role)
+            for event_type in compiled.event_types or ():
+                event_types.code(event_type)
+        for event_type in HIGH_RISK_EVENT_TYPES:
+            event_types.code(event_type)
+        self.compounds = []
+        for i, compiled in enumerate(self.patterns):
+            for cond in compiled.pattern.get("conditions", []):
+                if cond["type"] == "compound":
+                    children = [self._compile_columns(child) for child in cond.get("conditions", [])]
+                    self.compounds.append((i, cond.get("operator", "AND"), children))
+
+        n_patterns = len(self.patterns)
+        self.hour_masks = np.array([c.hour_mask for c in self.patterns], dtype=np.uint32)
+        # Patterns sharing a range index are grouped so each index is searched once per batch
+        self.range_groups = {}
+        for i, compiled in enumerate(self.patterns):
+            if compiled.denied_ranges is not None:
+                group = self.range_groups.setdefault(id(compiled.denied_ranges), (compiled.denied_ranges, []))
+                group[1].append(i)
+        self.stateful = np.array([c.stateful for c in self.patterns], dtype=bool)
+        self.score_modifiers = np.array([pattern_modifier(c.pattern) for c in self.patterns], dtype=np.float64)
+
+        # Last column of each table stands for "unknown code"
+        self.location_allowed = np.ones((n_patterns, len(locations) + 1), dtype=bool)
+        self.role_allowed = np.ones((n_patterns, len(roles) + 1), dtype=bool)
+        self.event_type_allowed = np.ones((n_patterns, len(event_types) + 1), dtype=bool)
+        for i, compiled in enumerate(self.patterns):
+            for location in compiled.denied_locations:
+                self.location_allowed[i, locations.codes[location]] = False
+            if compiled.roles is not None:
+                self.role_allowed[i, :] = False
+                for role in compiled.roles:
+                    self.role_allowed[i, roles.codes[role]] = True
+            if compiled.event_types is not None:
+                self.event_type_allowed[i, :] = False
+                for event_type in compiled.event_types:
+                    self.event_type_allowed[i, event_types.codes[event_type]] = True
+
+        self.base_scores = np.full(len(event_types) + 1, 0.1)
+        for event_type in HIGH_RISK_EVENT_TYPES:
+            self.base_scores[event_types.codes[event_type]] = 0.5
+
+    def _compile_columns(self, cond):
+        """Compile a condition into a function of the batch columns.
+
+        The function returns boolean ``(value, known)`` arrays; ``known`` is
+        False where the condition cannot be evaluated.
+        """
+        cond_type = cond["type"]
+        if cond_type == "compound":
+            operator = cond.get("operator", "AND")
+            children = [self._compile_columns(child) for child in cond.get("conditions", [])]
+            return lambda columns: _combine_columns(operator, [child(columns) for child in children],
+                                                    len(columns["hour"]))
+
+        def known_everywhere(test):
+            return lambda columns: (test(columns), np.ones(len(columns["hour"]), dtype=bool))
+
+        if cond_type == "time_window":
+            start, end = [_hour_of(t) for t in cond["not_between"]]
+            return known_everywhere(lambda columns: ~((columns["hour"] >= start) & (columns["hour"] <= end)))
+        if cond_type == "geo_location":
+            codes = [self.locations.code(location) for location in cond.get("not_in_locations", [])]
+            return known_everywhere(lambda columns: ~np.isin(columns["location"], codes))
+        if cond_type == "ip_range":
+            index = IPRangeIndex(cond.get("not_in_ranges", []))
+            return known_everywhere(lambda columns: ~index.contains_many(columns["ip"]))
+        if cond_type == "role_check":
+            codes = [self.roles.code(role) for role in cond.get("roles", [])]
+            return known_everywhere(lambda columns: np.isin(columns["role"], codes))
+        if cond_type == "event_type":
+            codes = [self.event_types.code(event_type) for event_type in cond.get("types", [])]
+
+            return known_everywhere(lambda columns: np.isin(columns["event_type"], codes))
+        return lambda columns: (np.zeros(len(columns["hour"]), dtype=bool),
+                                np.zeros(len(columns["hour"]), dtype=bool))
+
+    def _clip_codes(self, codes, table_width):
+        return np.minimum(np.asarray(codes, dtype=np.int64), table_width - 1)
+
+    def match_matrix(self, hour, location, ip, event_type, role, stateful_hits=None):
+        """Return the (events, patterns) boolean match matrix.
+
+        Takes the same columns as ``evaluate()``. ``stateful_hits`` is an
+        optional (events, patterns) boolean matrix of fired
+        history-dependent (sequence / baseline) conditions; without it,
+        patterns with such conditions never match, as in the scalar path.
+        """
+        return self._match(hour, location, ip, event_type, role, stateful_hits)[0]
+
+    def _match(self, hour, location, ip, event_type, role, stateful_hits):
+        # Also returns, per pattern with compound conditions, how many
+        # compound subconditions matched for every event
+        hour = np.asarray(hour, dtype=np.uint32)
+        location = self._clip_codes(location, self.location_allowed.shape[1])
+        role = self._clip_codes(role, self.role_allowed.shape[1])
+        event_type = self._clip_codes(event_type, self.event_type_allowed.shape[1])
+
+        matrix = ((self.hour_masks[None, :] >> hour[:, None]) & 1).astype(bool)
+        matrix &= self.location_allowed[:, location].T
+        matrix &= self.role_allowed[:, role].T
+        matrix &= self.event_type_allowed[:, event_type].T
+        ip = np.asarray(ip, dtype=np.uint32)
+        for index, columns in self.range_groups.values():
+            matrix[:, columns] &= ~index.contains_many(ip)[:, None]
+        if stateful_hits is None:
+            matrix &= ~self.stateful[None, :]
+        else:
+            matrix &= ~self.stateful[None, :] | np.asarray(stateful_hits, dtype=bool)
+
+        columns = {"hour": hour, "location": location, "ip": ip, "role": role, "event_type": event_type}
+        matched_counts = {}
+        for i, operator, children in self.compounds:
+            results = [child(columns) for child in children]
+            value, known = _combine_columns(operator, results, len(hour))
+            matrix[:, i] &= value | ~known
+            counts = matched_counts.setdefault(i, np.zeros(len(hour), dtype=np.int64))
+            for child_value, child_known in results:
+                counts += child_value & child_known
+        return matrix, matched_counts
+
+    def evaluate(self, hour, location, ip, event_type, role, stateful_hits=None):
+        """Match a batch and compute first-match indices and final scores.
+
+        ``first_match`` is -1 for events no pattern matched.
+        """
+        matrix, matched_counts = self._match(hour, location, ip, event_type, role, stateful_hits)
+        any_match = matrix.any(axis=1)
+        first_match = np.where(any_match, matrix.argmax(axis=1), -1)
+
+        event_type = self._clip_codes(event_type, len(self.base_scores))
+        scores = self.base_scores[event_type]
+        if len(self.patterns):
+            modifiers = np.where(any_match, self.score_modifiers[np.maximum(first_match, 0)], 0.0)
+            for i, counts in matched_counts.items():
+                multiplier = self.patterns[i].pattern.get("score_multiplier_per_condition")
+                if multiplier:
+                    extra = np.where(first_match == i, np.maximum(counts - 1, 0), 0)
+                    modifiers = modifiers * np.power(float(multiplier), extra)
+            scores = scores + modifiers
+        scores = np.minimum(scores, 1.0)
+        return BatchResult(matrix, first_match, scores)
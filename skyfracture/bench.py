@@ -0,0 +1,452 @@
+"""Headless benchmarks of the detection and dashboard hot paths.
+
+Each benchmark builds its inputs once for every size it is run at, then
+times a callable ``repeat`` times with ``time.perf_counter``. Workloads
+come from seeded ``LoadGenerator`` events and synthetic patterns, so two
+runs of the same suite measure the same work. Results are plain dicts,
+written as JSON by ``python -m skyfracture bench`` and compared against a
+previous run's file with ``compare()``::
+
+    python -m skyfracture bench --output before.json
+    python -m skyfracture bench --output after.json --compare before.json
+
+Dashboard panel benchmarks need pandas and Plotly, which are imported only
+when they run.
+"""
+
+import functools
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import cycle
+
+import numpy as np
+import yaml
+
+from skyfracture.engine import DetectionEngine
+from skyfracture.entities import EntityScores
+from skyfracture.loadgen import LoadGenerator
+from skyfracture.matching import compile_patterns, find_matching_pattern, pattern_matches
+from skyfracture.network import ConditionNetwork
+from skyfracture.packs import PackLoader, load_detection_packs
+from skyfracture.sharded import ShardedEngine
+from skyfracture.simulation import EVENT_TYPES, LOCATIONS
+
+PRIVATE_RANGES = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+ROLES = ["user", "admin", "executive"]
+PATTERNS_PER_PACK = 50
+
+# Sizes each benchmark runs at, per suite
+SUITES = {
+    "quick": {
+        "load_packs": [100, 1000],
+        "load_packs_cached": [100, 1000],
+        "pattern_matches": [10, 100],
+        "find_matching_pattern": [10, 100, 1000],
+        "condition_network": [10, 100, 1000],
+        "engine_batch": [1000, 10_000],
+        "engine_batch_instrumented": [1000, 10_000],
+        "engine_event": [10, 100],
+        "sharded_batch": [1, 2, 4],
+        "entity_scores": [1000, 100_000],
+        "panel_trend": [1000, 10_000],
+        "panel_distributions": [1000, 10_000],
+        "panel_entities": [1000, 10_000],
+        "panel_alert_cards": [1000, 10_000],
+        "panel_event_cards": [1000, 10_000],
+    },
+    "full": {
+        "load_packs": [100, 1000, 10_000],
+        "load_packs_cached": [100, 1000, 10_000],
+        "pattern_matches": [10, 100, 1000],
+        "find_matching_pattern": [10, 100, 1000, 10_000],
+        "condition_network": [10, 100, 1000, 10_000],
+        "engine_batch": [1000, 10_000, 100_000],
+        "engine_batch_instrumented": [1000, 10_000, 100_000],
+        "engine_event": [10, 100, 1000],
+        "sharded_batch": [1, 2, 4],
+        "entity_scores": [1000, 100_000, 1_000_000],
+        "panel_trend": [1000, 10_000, 100_000],
+        "panel_distributions": [1000, 10_000, 100_000],
+        "panel_entities": [1000, 10_000, 100_000],
+        "panel_alert_cards": [1000, 10_000, 100_000],
+        "panel_event_cards": [1000, 10_000, 100_000],
+    },
+}
+
+# A benchmark is slower than its baseline when its median grew by more than this
+DEFAULT_THRESHOLD = 0.2
+
+
+def synthetic_patterns(n, seed=0, selective=False):
+    """``n`` reproducible patterns using the stateless condition types.
+
+    Condition mixes follow the shipped packs: hour windows, location and
+    role lists, event types, private-range ``ip_range`` conditions and
+    occasional ``compound`` ORs. ``selective`` patterns always check a
+    single event type and deny all but one or two locations, so few
+    match any given event and first-match scans run deep into the list.
+    """
+    rng = np.random.default_rng(seed)
+    patterns = []
+    for i in range(n):
+        conditions = []
+        if rng.random() < 0.5:
+            start = int(rng.integers(0, 12))
+            conditions.append({"type": "time_window",
+                               "not_between": [f"{start:02d}:00", f"{start + int(rng.integers(4, 12)):02d}:00"]})
+        if selective:
+            denied = len(LOCATIONS) - int(rng.integers(1, 3))
+        elif rng.random() < 0.5:
+            denied = int(rng.integers(1, len(LOCATIONS)))
+        else:
+            denied = 0
+        if denied:
+            locations = rng.choice(LOCATIONS, size=denied, replace=False)
+            conditions.append({"type": "geo_location", "not_in_locations": locations.tolist()})
+        if rng.random() < 0.3:
+            conditions.append({"type": "role_check", "roles": [ROLES[int(rng.integers(0, len(ROLES)))]]})
+        if selective or rng.random() < 0.6:
+            size = 1 if selective else int(rng.integers(1, 4))
+            event_types = rng.choice(EVENT_TYPES, size=size, replace=False)
+            conditions.append({"type": "event_type", "types": event_types.tolist()})
+        if rng.random() < 0.3:
+            conditions.append({"type": "ip_range", "not_in_ranges": PRIVATE_RANGES})
+        if rng.random() < 0.1:
+            conditions.append({"type": "compound", "operator": "OR", "conditions": [
+                {"type": "role_check", "roles": ["admin"]},
+                {"type": "ip_range", "not_in_ranges": PRIVATE_RANGES},
+            ]})
+        patterns.append({
+            "name": f"synthetic_{i:05d}",
+            "description": "Synthetic benchmark pattern",
+            "conditions": conditions,
+            "score_modifier": round(float(rng.uniform(0.1, 0.9)), 2),
+            "severity": ["low", "medium", "high"][int(rng.integers(0, 3))],
+            "recommended_actions": ["Review activity"],
+        })
+    return patterns
+
+
+def write_pack_directory(directory, n_patterns, seed=0, patterns_per_pack=PATTERNS_PER_PACK):
+    """Write ``n_patterns`` synthetic patterns as YAML packs into ``directory``."""
+    patterns = synthetic_patterns(n_patterns, seed)
+    for start in range(0, n_patterns, patterns_per_pack):
+        pack = {
+            "name": f"Synthetic Pack {start // patterns_per_pack}",
+            "version": "1.0",
+            "patterns": patterns[start:start + patterns_per_pack],
+        }
+        with open(os.path.join(directory, f"pack_{start // patterns_per_pack:05d}.yaml"), "w") as f:
+            yaml.safe_dump(pack, f, sort_keys=False)
+
+
+def _engine_with_packs(n_patterns, engine_class=DetectionEngine, **kwargs):
+    engine = engine_class(**kwargs)
+    patterns = synthetic_patterns(n_patterns)
+    engine.load_packs([{"name": "Synthetic", "patterns": patterns,
+                        "compiled_patterns": compile_patterns(patterns)}])
+    return engine
+
+
+# Setup functions take a size and return ``(run, items, cleanup)``: a
+# callable to time, the number of items it processes, and None or a
+# callable releasing the setup's resources
+
+def _setup_load_packs(n_patterns):
+    directory = tempfile.TemporaryDirectory(prefix="skyfracture-bench-")
+    write_pack_directory(directory.name, n_patterns)
+    return lambda: load_detection_packs(directory.name), n_patterns, directory.cleanup
+
+
+def _setup_load_packs_cached(n_patterns):
+    # Cold start of a new loader over a warm parsed-pack cache
+    directory = tempfile.TemporaryDirectory(prefix="skyfracture-bench-")
+    packs = os.path.join(directory.name, "packs")
+    cache = os.path.join(directory.name, "cache")
+    os.makedirs(packs)
+    write_pack_directory(packs, n_patterns)
+    PackLoader(packs, cache_dir=cache).scan()
+    return lambda: PackLoader(packs, cache_dir=cache).scan(), n_patterns, directory.cleanup
+
+
+# Matching benchmarks use selective patterns, so their cost grows with the
+# pattern count; a fixed event count keeps the reference matcher affordable
+MATCH_EVENTS = 1000
+
+
+def _setup_pattern_matches(n_patterns):
+    patterns = synthetic_patterns(n_patterns, selective=True)
+    events = LoadGenerator(seed=1).events(MATCH_EVENTS)
+
+    def run():
+        for event in events:
+            for pattern in patterns:
+                if pattern_matches(event, pattern):
+                    break
+    return run, MATCH_EVENTS, None
+
+
+def _setup_find_matching_pattern(n_patterns):
+    compiled = compile_patterns(synthetic_patterns(n_patterns, selective=True))
+    events = LoadGenerator(seed=1).events(MATCH_EVENTS)
+
+    def run():
+        for event in events:
+            find_matching_pattern(event, compiled)
+    return run, MATCH_EVENTS, None
+
+
+def _setup_condition_network(n_patterns):
+    network = ConditionNetwork(compile_patterns(synthetic_patterns(n_patterns, selective=True)))
+    events = LoadGenerator(seed=1).events(MATCH_EVENTS)
+
+    def run():
+        for event in events:
+            network.matches(event)
+    return run, MATCH_EVENTS, None
+
+
+def _setup_engine_batch(n_events):
+    engine = _engine_with_packs(100)
+    events = LoadGenerator(seed=1, users=1000).events(n_events)
+    return lambda: engine.process_batch(events), n_events, None
+
+
+def _setup_engine_batch_instrumented(n_events):
+    engine = _engine_with_packs(100, metrics=True)
+    events = LoadGenerator(seed=1, users=1000).events(n_events)
+    return lambda: engine.process_batch(events), n_events, None
+
+
+# Per-event latency: each timed run is one process_event() call
+ENGINE_EVENT_WARMUP = 1000
+
+
+def _setup_engine_event(n_patterns):
+    engine = _engine_with_packs(n_patterns)
+    events = LoadGenerator(seed=1, users=1000).events(ENGINE_EVENT_WARMUP)
+    engine.process_batch(events)
+    events = cycle(events)
+    return lambda: engine.process_event(next(events)), 1, None
+
+
+# Scaling across shard processes: each timed run is one batch of SHARDED_BATCH events
+SHARDED_BATCH = 10_000
+
+
+def _setup_sharded_batch(n_shards):
+    engine = _engine_with_packs(100, ShardedEngine, shards=n_shards)
+    events = LoadGenerator(seed=1, users=1000).events(SHARDED_BATCH)
+    return lambda: engine.process_batch(events), SHARDED_BATCH, engine.close
+
+
+# Per-entity score updates: each timed run folds one batch into n_entities known entities
+ENTITY_BATCH = 10_000
+
+
+def _setup_entity_scores(n_entities):
+    rng = np.random.default_rng(1)
+    # No limit, so every size keeps all of its entities
+    scores = EntityScores(max_entities=None)
+    events = [
+        {"user_id": f"user{i:07d}", "location": f"location{i % 100}", "ip_address": f"ip{i:07d}"}
+        for i in range(n_entities)
+    ]
+    scores.update(events, np.zeros(n_entities), rng.random(n_entities))
+    batch = [events[i] for i in rng.integers(0, n_entities, ENTITY_BATCH).tolist()]
+    times = np.sort(rng.random(ENTITY_BATCH)) * 60
+    batch_scores = rng.random(ENTITY_BATCH)
+    return lambda: scores.update(batch, times, batch_scores), ENTITY_BATCH, None
+
+
+# Dashboard panels render from one snapshot of n_events, shared by the
+# panel benchmarks at the same size; each timed run renders one panel once
+@functools.lru_cache(maxsize=None)
+def _panel_snapshot(n_events):
+    engine = _engine_with_packs(100, max_scores=n_events, snapshot_scores=n_events)
+    generator = LoadGenerator(seed=1, users=1000, attacks={"password_spray": 0.001})
+    for batch in generator.batches(n_events, 10_000):
+        engine.process_batch(batch.to_events())
+    return engine.snapshot(rollup_window=3600)
+
+
+# Render functions are imported inside the setups so the other benchmarks
+# run without pandas and Plotly
+
+def _setup_panel_trend(n_events):
+    from skyfracture.render import score_trend_figure
+
+    snapshot = _panel_snapshot(n_events)
+    return lambda: score_trend_figure(snapshot), 1, None
+
+
+def _setup_panel_distributions(n_events):
+    from skyfracture.render import count_bar_figure, distribution_counts, event_type_pie_figure
+
+    snapshot = _panel_snapshot(n_events)
+
+    def run():
+        events_by_user, events_by_type, events_by_location = distribution_counts(snapshot)
+        count_bar_figure(events_by_user, "user", "events", "Events by User", "User", "Event Count")
+        event_type_pie_figure(events_by_type)
+        count_bar_figure(events_by_location, "location", "events", "Events by Location", "Location", "Event Count")
+        count_bar_figure(snapshot.events_by_ip, "ip_address", "events", "Top Source IPs", "Source IP",
+                         "Event Count", sort=True)
+    return run, 1, None
+
+
+def _setup_panel_entities(n_events):
+    from skyfracture.render import entity_scores_figure, entity_scores_frame
+
+    snapshot = _panel_snapshot(n_events)
+    return lambda: entity_scores_figure(entity_scores_frame(snapshot.entity_scores)), 1, None
+
+
+def _setup_panel_alert_cards(n_events):
+    from skyfracture.render import alert_cards_html, count_bar_figure
+
+    snapshot = _panel_snapshot(n_events)
+
+    def run():
+        alert_cards_html(snapshot.alerts.records(10))
+        count_bar_figure(snapshot.alert_by_pattern, "pattern", "alerts", "Alerts by Pattern", "Pattern",
+                         "Alert Count", color_scale="Reds", sort=True)
+    return run, 1, None
+
+
+def _setup_panel_event_cards(n_events):
+    from skyfracture.render import event_cards_html
+
+    snapshot = _panel_snapshot(n_events)
+    return lambda: event_cards_html(snapshot.events.records(5)), 1, None
+
+
+BENCHMARKS = {
+    "load_packs": ("patterns", _setup_load_packs),
+    "load_packs_cached": ("patterns", _setup_load_packs_cached),
+    "pattern_matches": ("patterns", _setup_pattern_matches),
+    "find_matching_pattern": ("patterns", _setup_find_matching_pattern),
+    "condition_network": ("patterns", _setup_condition_network),
+    "engine_batch": ("events", _setup_engine_batch),
+    "engine_batch_instrumented": ("events", _setup_engine_batch_instrumented),
+    "engine_event": ("patterns", _setup_engine_event),
+    "sharded_batch": ("shards", _setup_sharded_batch),
+    "entity_scores": ("entities", _setup_entity_scores),
+    "panel_trend": ("events", _setup_panel_trend),
+    "panel_distributions": ("events", _setup_panel_distributions),
+    "panel_entities": ("events", _setup_panel_entities),
+    "panel_alert_cards": ("events", _setup_panel_alert_cards),
+    "panel_event_cards": ("events", _setup_panel_event_cards),
+}
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_benchmark(name, size, repeat=5):
+    """Time one benchmark at one size and return its result dict.
+
+    Timings are in seconds per run; ``items_per_second`` divides the items
+    a run processes by the median run time.
+    """
+    parameter, setup = BENCHMARKS[name]
+    run, items, cleanup = setup(size)
+    try:
+        run()  # Warm-up
+        seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - started)
+    finally:
+        if cleanup is not None:
+            cleanup()
+    median = statistics.median(seconds)
+    return {
+        "name": name,
+        "params": {parameter: size},
+        "items": items,
+        "repeat": repeat,
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": median,
+        "p95": _percentile(seconds, 95),
+        "p99": _percentile(seconds, 99),
+        "items_per_second": items / median if median > 0 else 0.0,
+    }
+
+
+def result_key(result):
+    """Identity of a result across runs: its name and parameters."""
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def run_suite(suite="quick", only=None, repeat=5, progress=None):
+    """Run every benchmark of a suite; ``only`` restricts it to some names."""
+    results = []
+    for name, sizes in SUITES[suite].items():
+        if only and name not in only:
+            continue
+        # Single-event latency needs many samples to give stable percentiles
+        runs = repeat * 200 if name == "engine_event" else repeat
+        for size in sizes:
+            result = run_benchmark(name, size, runs)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "suite": suite,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare two ``run_suite()`` outputs by median run time.
+
+    Returns ``(key, baseline_median, current_median, ratio, regressed)``
+    rows for results present in both; ``regressed`` is True when the
+    current median is more than ``threshold`` slower.
+    """
+    previous = {result_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = result_key(result)
+        if key not in previous:
+            continue
+        before = previous[key]["median"]
+        after = result["median"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((key, before, after, ratio, ratio > 1.0 + threshold))
+    return rows
+
+
+def check_scaling(results):
+    """Check that sharding pays off: ``sharded_batch`` must run faster with
+    2 shards than with 1.
+
+    Returns None when a ``run_suite()`` output lacks either result, else
+    ``(passed, message)``. ``passed`` is None on machines with fewer than
+    two CPUs, where the shard processes only take turns.
+    """
+    medians = {result["params"]["shards"]: result["median"]
+               for result in results["results"] if result["name"] == "sharded_batch"}
+    if 1 not in medians or 2 not in medians:
+        return None
+    one, two = medians[1], medians[2]
+    if (results.get("cpus") or 1) < 2:
+        return None, f"sharded_batch scaling not checked on {results.get('cpus')} CPU"
+    speedup = one / two if two > 0 else float("inf")
+    message = f"sharded_batch: 2 shards run x{speedup:.2f} as fast as 1 ({one * 1e3:.3f}ms -> {two * 1e3:.3f}ms)"
+    return two < one, message
@@ -0,0 +1,413 @@
+"""Headless command line entry point.
+
+Streams JSONL or CSV event files through the detection engine in chunks and
+writes alerts as JSONL, without Streamlit, Plotly or pandas::
+
+    python -m skyfracture replay events.jsonl --packs ./detection_packs/ --output alerts.jsonl
+
+The replay engine keeps only detection state by default. Memory is then
+bounded by ``--chunk-size``, the sequence trackers of the packs (at most
+100,000 keys each) and, for packs with ``behavioral_baseline`` conditions,
+one baseline row per distinct user. ``--track`` opts into dashboard state
+such as counters, rollups or per-entity scores, which ``--top-entities``
+turns on by itself. Records that cannot be parsed are skipped and counted.
+
+``generate`` writes a reproducible synthetic workload in the same formats::
+
+    python -m skyfracture generate events.jsonl --events 10000000 --seed 1 --attack password_spray=0.0001
+
+``replay --export`` sends SIEM and alert records to file, Unix socket or
+HTTP sinks as configured by the packs' ``integrations``; ``collect`` runs a
+local HTTP stand-in for a SIEM collector::
+
+    python -m skyfracture collect received.ndjson --port 8088
+    python -m skyfracture replay events.jsonl --output alerts.jsonl --export http://127.0.0.1:8088/ingest
+
+``bench`` times the detection and dashboard hot paths. It fails when two
+shards are no faster than one on a multi-core machine, and on regressions
+against an earlier run::
+
+    python -m skyfracture bench --output after.json --compare before.json
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from skyfracture import bench as benchmarks
+from skyfracture.engine import ALERT_THRESHOLD, COMPONENTS, DetectionEngine
+from skyfracture.iprange import ip_to_int
+from skyfracture.export import OVERFLOW_POLICIES, ExportPipeline, serve_collector
+from skyfracture.loadgen import ATTACK_SCENARIOS, LoadGenerator
+from skyfracture.metrics import write_prometheus
+from skyfracture.packs import load_detection_packs
+from skyfracture.sharded import SHARD_KEYS, ShardedEngine
+
+# Fixed-capacity buffers only back the dashboard; keep them small here
+ENGINE_BUFFER_CAPACITY = 1024
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 string or epoch seconds into a naive datetime.
+
+    ISO strings with a UTC offset are converted to UTC; epoch seconds and
+    missing values give local time. Raises ValueError on anything else.
+    """
+    if value is None or value == "":
+        return datetime.now()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def parse_event(record):
+    """Turn an input record into a raw event for the engine.
+
+    ``user_id`` and ``event_type`` are required; ``hour`` defaults to the
+    timestamp's hour and the remaining fields to neutral values. Raises
+    KeyError or ValueError for a record that cannot be used, such as one
+    with an IPv6 or malformed IPv4 address.
+    """
+    timestamp = parse_timestamp(record.get("timestamp"))
+    ip_address = record.get("ip_address") or "0.0.0.0"
+    hour = record.get("hour")
+    return {
+        "timestamp": timestamp,
+        "user_id": record["user_id"],
+        "event_type": record["event_type"],
+        "location": record.get("location") or "",
+        "ip_address": ip_address,
+        "ip_int": ip_to_int(ip_address),
+        "hour": timestamp.hour if hour in (None, "") else int(hour),
+        "role": record.get("role") or "user",
+    }
+
+
+def read_records(path, file_format, on_error=None):
+    """Lazily yield input records from a JSONL or CSV file ("-" is stdin).
+
+    The file is opened right away, so a missing one exits with a message
+    before any work starts. JSONL lines that are not valid JSON are passed
+    to ``on_error`` and skipped, or raise without it.
+    """
+    if path == "-":
+        f = sys.stdin
+    else:
+        try:
+            f = open(path, "r", newline="")
+        except OSError as e:
+            raise SystemExit(f"Cannot read {path}: {e.strerror}")
+    return _iter_records(f, file_format, on_error)
+
+
+def _iter_records(f, file_format, on_error):
+    try:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    if on_error is None:
+                        raise
+                    on_error(e)
+                    continue
+                yield record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def alert_record(event):
+    record = dict(event)
+    record["timestamp"] = event["timestamp"].isoformat()
+    record.pop("ip_int", None)
+    return record
+
+
+def replay(args):
+    stage_seconds = {"load": 0.0, "parse": 0.0, "detect": 0.0, "write": 0.0}
+    skipped = 0
+    first_error = None
+
+    def skip(error):
+        nonlocal skipped, first_error
+        skipped += 1
+        if first_error is None:
+            first_error = f"{type(error).__name__}: {error}"
+
+    file_format = args.format or ("csv" if args.input.endswith(".csv") else "jsonl")
+    records = read_records(args.input, file_format, on_error=skip)
+
+    started = time.perf_counter()
+    packs = load_detection_packs(args.packs)
+    if not packs:
+        print(f"No detection packs found at {args.packs}", file=sys.stderr)
+        return 1
+    components = set(args.track)
+    if args.top_entities:
+        components.add("entities")
+    if args.shards > 1:
+        engine = ShardedEngine(
+            shards=args.shards,
+            shard_key=args.shard_key,
+            max_alerts=ENGINE_BUFFER_CAPACITY,
+            max_scores=ENGINE_BUFFER_CAPACITY,
+            metrics=bool(args.metrics),
+            components=components,
+        )
+    else:
+        engine = DetectionEngine(
+            max_events=ENGINE_BUFFER_CAPACITY,
+            max_alerts=ENGINE_BUFFER_CAPACITY,
+            max_scores=ENGINE_BUFFER_CAPACITY,
+            metrics=bool(args.metrics),
+            components=components,
+        )
+    patterns = engine.load_packs(packs)
+    stage_seconds["load"] = time.perf_counter() - started
+
+    export = None
+    if args.export:
+        export = ExportPipeline(args.export, queue_size=args.export_queue_size, overflow=args.export_overflow,
+                                spill_dir=args.export_spill)
+        export.start()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    total_events = total_alerts = 0
+    run_started = time.perf_counter()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            chunk = list(islice(records, args.chunk_size))
+            if not chunk:
+                break
+            batch = []
+            for record in chunk:
+                try:
+                    batch.append(parse_event(record))
+                except (KeyError, ValueError) as e:
+                    skip(e)
+            t1 = time.perf_counter()
+            stage_seconds["parse"] += t1 - t0
+            if not batch:
+                continue
+
+            processed = engine.process_batch(batch)
+            t2 = time.perf_counter()
+            stage_seconds["detect"] += t2 - t1
+            if export is not None:
+                export.submit(processed, engine.packs)
+
+            for event in processed:
+                if event["score"] > args.min_score:
+                    output.write(json.dumps(alert_record(event)) + "\n")
+                    total_alerts += 1
+            stage_seconds["write"] += time.perf_counter() - t2
+            total_events += len(batch)
+        if args.metrics:
+            write_prometheus(engine.collect_metrics(), args.metrics)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if isinstance(engine, ShardedEngine):
+            engine.close()
+        if export is not None:
+            export.stop()
+
+    elapsed = time.perf_counter() - run_started
+    rate = total_events / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{total_events} events, {total_alerts} alerts, {len(patterns)} patterns "
+        f"in {elapsed:.3f}s ({rate:,.0f} events/s)",
+        file=sys.stderr,
+    )
+    for stage, seconds in stage_seconds.items():
+        print(f"  {stage:<7} {seconds:8.3f}s", file=sys.stderr)
+    if skipped:
+        print(f"  skipped {skipped} invalid records (first: {first_error})", file=sys.stderr)
+    if export is not None:
+        for stats in export.stats():
+            print(f"  export {stats['sink']}: {stats['sent_records']} sent, {stats['spilled']} spilled, "
+                  f"{stats['dropped']} dropped, {stats['errors']} errors", file=sys.stderr)
+    if args.top_entities:
+        print("Most fractured entities:", file=sys.stderr)
+        for field, entity, score, events, _ in engine.entity_scores.top(args.top_entities):
+            print(f"  {field:<10} {entity:<20} {score:.3f} ({events} events)", file=sys.stderr)
+    return 0
+
+
+GENERATED_FIELDS = ("timestamp", "user_id", "event_type", "location", "ip_address", "hour", "role", "attack")
+
+
+def parse_attack(value):
+    """Parse a ``scenario=rate`` argument."""
+    scenario, _, rate = value.partition("=")
+    if scenario not in ATTACK_SCENARIOS or not rate:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(ATTACK_SCENARIOS)}=RATE, got {value!r}")
+    return scenario, float(rate)
+
+
+def generate(args):
+    generator = LoadGenerator(
+        seed=args.seed,
+        users=args.users,
+        events_per_second=args.rate,
+        attacks=dict(args.attack),
+    )
+    file_format = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    started = time.perf_counter()
+    try:
+        writer = csv.writer(output) if file_format == "csv" else None
+        if writer:
+            writer.writerow(GENERATED_FIELDS)
+        for batch in generator.batches(args.events, args.chunk_size):
+            attacks = batch.attack.tolist()
+            for event, attack in zip(batch.to_events(), attacks):
+                row = (event["timestamp"].isoformat(), event["user_id"], event["event_type"], event["location"],
+                       event["ip_address"], event["hour"], event["role"],
+                       ATTACK_SCENARIOS[attack] if attack >= 0 else "")
+                if writer:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(dict(zip(GENERATED_FIELDS, row))) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - started
+    print(f"{args.events} events in {elapsed:.3f}s", file=sys.stderr)
+    return 0
+
+
+def collect(args):
+    server = serve_collector(args.output, args.port, args.host, args.delay)
+    print(f"Collecting at http://{args.host}:{server.server_address[1]}/ into {args.output}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+def bench(args):
+    def progress(result):
+        print(f"{benchmarks.result_key(result):<40} median {result['median'] * 1e3:10.3f}ms  "
+              f"p99 {result['p99'] * 1e3:10.3f}ms  {result['items_per_second']:14,.0f} items/s",
+              file=sys.stderr)
+
+    results = benchmarks.run_suite(args.suite, args.only, args.repeat, progress)
+    if args.output == "-":
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    status = 0
+    scaling = benchmarks.check_scaling(results)
+    if scaling is not None:
+        passed, message = scaling
+        print(message if passed is not False else f"{message}: sharding does not scale", file=sys.stderr)
+        status = int(passed is False)
+    if not args.compare:
+        return status
+    with open(args.compare, "r") as f:
+        baseline = json.load(f)
+    regressions = 0
+    for key, before, after, ratio, regressed in benchmarks.compare(results, baseline, args.threshold):
+        marker = "REGRESSION" if regressed else ""
+        print(f"{key:<40} {before * 1e3:10.3f}ms -> {after * 1e3:10.3f}ms  x{ratio:5.2f}  {marker}",
+              file=sys.stderr)
+        regressions += regressed
+    if regressions:
+        print(f"{regressions} benchmarks regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return status
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="skyfracture", description="SKYFRACTURE headless detection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="Run an event file through the detection engine")
+    replay_parser.add_argument("input", help="JSONL or CSV event file, or - for stdin")
+    replay_parser.add_argument("--packs", default="./detection_packs/", help="Detection pack directory or file")
+    replay_parser.add_argument("--output", default="-", help="Alert JSONL output file (default: stdout)")
+    replay_parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from extension)")
+    replay_parser.add_argument("--chunk-size", type=int, default=10_000, help="Events per processing batch")
+    replay_parser.add_argument("--min-score", type=float, default=ALERT_THRESHOLD,
+                               help="Write events scoring above this as alerts")
+    replay_parser.add_argument("--shards", type=int, default=1,
+                               help="Worker processes to run detection in (default: 1, in-process)")
+    replay_parser.add_argument("--shard-key", choices=SHARD_KEYS, default="user_id",
+                               help="Event field that assigns events to shards")
+    replay_parser.add_argument("--metrics",
+                               help="Instrument the engine and write Prometheus metrics to this file")
+    replay_parser.add_argument("--track", action="append", default=[], choices=COMPONENTS,
+                               help="Also keep this dashboard state in the engine (repeatable); by default "
+                                    "only detection state is kept")
+    replay_parser.add_argument("--top-entities", type=int, default=0, metavar="N",
+                               help="Report the N users, locations and source IPs with the highest fracture scores")
+    replay_parser.add_argument("--export", action="append", default=[],
+                               help="Export sink: file:PATH, unix:PATH or http(s):// URL (repeatable)")
+    replay_parser.add_argument("--export-queue-size", type=int, default=100_000,
+                               help="Records queued per export sink before overflowing")
+    replay_parser.add_argument("--export-overflow", choices=OVERFLOW_POLICIES, default="spill",
+                               help="What to do with records a slow sink cannot take")
+    replay_parser.add_argument("--export-spill", default="./export_spill/",
+                               help="Directory for spilled export batches")
+    replay_parser.set_defaults(func=replay)
+
+    generate_parser = subparsers.add_parser("generate", help="Write a reproducible synthetic event file")
+    generate_parser.add_argument("output", help="JSONL or CSV output file, or - for stdout")
+    generate_parser.add_argument("--events", type=int, default=1_000_000, help="Number of events")
+    generate_parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    generate_parser.add_argument("--users", type=int, default=1000, help="Number of synthetic users")
+    generate_parser.add_argument("--rate", type=float, default=1000.0,
+                                 help="Average events per second of simulated time")
+    generate_parser.add_argument("--attack", type=parse_attack, action="append", default=[],
+                                 help="Inject attacks: SCENARIO=RATE, expected attacks per event (repeatable)")
+    generate_parser.add_argument("--format", choices=["jsonl", "csv"], help="Output format (default: from extension)")
+    generate_parser.add_argument("--chunk-size", type=int, default=100_000, help="Events generated per batch")
+    generate_parser.set_defaults(func=generate)
+
+    collect_parser = subparsers.add_parser("collect", help="Run a local HTTP stand-in for a SIEM collector")
+    collect_parser.add_argument("output", help="NDJSON file receiving the posted records")
+    collect_parser.add_argument("--port", type=int, default=8088, help="Port to listen on")
+    collect_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    collect_parser.add_argument("--delay", type=float, default=0.0,
+                                help="Seconds to wait per request, to simulate a slow collector")
+    collect_parser.set_defaults(func=collect)
+
+    bench_parser = subparsers.add_parser("bench", help="Benchmark the detection and dashboard hot paths")
+    bench_parser.add_argument("--suite", choices=sorted(benchmarks.SUITES), default="quick",
+                              help="Sizes to run each benchmark at (default: quick)")
+    bench_parser.add_argument("--only", action="append", choices=sorted(benchmarks.BENCHMARKS),
+                              help="Run only this benchmark (repeatable)")
+    bench_parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark and size")
+    bench_parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    bench_parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    bench_parser.add_argument("--threshold", type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                              help="Fail when a median is this fraction slower than in --compare")
+    bench_parser.set_defaults(func=bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,375 @@
+"""Detection engine state, independent of any UI.
+
+``DetectionEngine`` owns everything ``generate_security_event()`` used to
+keep in ``st.session_state``: recent events and alerts, counters, the
+global fracture score and per-entity fracture scores. It is safe to feed
+from a background thread while the dashboard reads consistent snapshots.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from skyfracture.baselines import BaselineEngine, BaselineStore, baseline_bonus
+from skyfracture.entities import MAX_ENTITIES, EntityScores
+from skyfracture.matching import HIGH_RISK_EVENT_TYPES
+from skyfracture.metrics import EngineMetrics
+from skyfracture.network import ConditionNetwork
+from skyfracture.rollups import MultiResolutionRollup
+from skyfracture.sequences import SequenceEngine
+from skyfracture.store import SCORE_DTYPE, EventStore, RingBuffer
+from skyfracture.topk import SpaceSaving
+
+ALERT_THRESHOLD = 0.7
+
+# Dashboard state kept besides detection itself: recent events, recent
+# alerts, the fracture score series, Space-Saving counters, time rollups and
+# per-entity scores
+COMPONENTS = ("events", "alerts", "scores", "counters", "rollups", "entities")
+
+
+def check_components(components):
+    unknown = set(components) - set(COMPONENTS)
+    if unknown:
+        raise ValueError(f"Unknown engine components: {sorted(unknown)}; choose from {COMPONENTS}")
+    return frozenset(components)
+
+EngineSnapshot = namedtuple("EngineSnapshot", [
+    "events",
+    "alerts",
+    "fracture_scores",
+    "current_fracture_score",
+    "total_events",
+    "total_alerts",
+    "alert_by_pattern",
+    "events_by_user",
+    "events_by_type",
+    "events_by_location",
+    "events_by_ip",
+    "entity_scores",
+    "pattern_count",
+    "last_update",
+    "rollup",
+    "version",
+    "alert_version",
+])
+
+
+def stateful_matches(sequence_hits, baseline_hits):
+    """Patterns whose sequence and baseline conditions all fired."""
+    if not sequence_hits and not baseline_hits:
+        return frozenset()
+    hits = {c for c in sequence_hits if not c.baseline_conditions or c in baseline_hits}
+    hits.update(c for c in baseline_hits if not c.sequence_conditions or c in sequence_hits)
+    return hits
+
+
+def score_event(raw, network, stateful_hits=frozenset(), baseline_hits=None, pattern_stats=None):
+    """Score a raw event against every pattern of a ``ConditionNetwork``.
+
+    Returns ``(score, pattern, matches)``: the score and pattern dict of the
+    first match (the pattern is None if nothing matched), and
+    ``(pattern, score)`` pairs for all matches in priority order.
+    ``baseline_hits`` maps compiled patterns to their baseline deviation.
+    With ``pattern_stats`` (a ``PatternStats``), pattern evaluations are
+    counted and timed.
+    """
+    base_score = 0.1 + 0.4 * (raw["event_type"] in HIGH_RISK_EVENT_TYPES)
+    matches = []
+    if pattern_stats is None:
+        found = network.matches(raw, stateful_hits)
+    else:
+        found = network.matches_profiled(raw, stateful_hits, pattern_stats)
+    for compiled, modifier in found:
+        score = base_score + modifier
+        if baseline_hits and compiled in baseline_hits:
+            score += baseline_bonus(compiled.pattern, baseline_hits[compiled])
+        matches.append((compiled.pattern, min(score, 1.0)))
+    if not matches:
+        return min(base_score, 1.0), None, matches
+    pattern, score = matches[0]
+    return score, pattern, matches
+
+
+def processed_event(raw, event_id, score, pattern, matches):
+    """The event dict returned for a raw event and its ``score_event()`` result."""
+    matched_pattern = None
+    recommendations = []
+    severity = "low"
+    if pattern:
+        matched_pattern = pattern["name"]
+        recommendations = pattern.get("recommended_actions", [])
+        severity = pattern.get("severity", "medium")
+
+    event = dict(raw)
+    event.update({
+        "event_id": event_id,
+        "score": round(score, 3),
+        "matched_pattern": matched_pattern,
+        "matches": [{"pattern": p["name"], "score": round(s, 3)} for p, s in matches],
+        "recommendations": recommendations,
+        "severity": severity,
+    })
+    return event
+
+
+class DetectionEngine:
+    """Match events against detection packs and keep dashboard state.
+
+    Recent events, alerts and fracture scores are kept in fixed-capacity
+    ring buffers; snapshots copy only the latest ``snapshot_*`` rows of each.
+    Per-user, type, location, source IP and pattern counts are Space-Saving
+    summaries of ``counter_capacity`` keys each: exact until that many
+    distinct keys are seen, and off by at most total / capacity after.
+    Users, locations and source IPs each get a fracture score of their
+    own, updated once per batch; ``entity_half_life_seconds`` sets how fast
+    an idle entity's score fades (None to keep it), and ``max_entities``
+    how many of each kind are kept before faded and low scores are evicted.
+    With an ``event_log`` every processed event is also persisted to disk.
+    Setting ``metrics.enabled`` turns on per-stage and per-pattern timing.
+
+    ``components`` selects which of ``COMPONENTS`` are kept; the rest stay
+    empty in snapshots. Headless jobs that only need the returned events
+    pass ``()``, leaving the sequence trackers and behavioral baselines of
+    the loaded packs as the only state that grows with the input.
+    """
+
+    def __init__(self, max_events=100_000, max_alerts=10_000, max_scores=100_000,
+                 snapshot_events=100, snapshot_alerts=50, snapshot_scores=10_000, event_log=None,
+                 counter_capacity=1000, snapshot_top=50, baseline_half_life_days=None, metrics=False,
+                 entity_half_life_seconds=3600.0, max_entities=MAX_ENTITIES, components=COMPONENTS):
+        self.components = check_components(components)
+        self.snapshot_events = snapshot_events
+        self.snapshot_alerts = snapshot_alerts
+        self.snapshot_scores = snapshot_scores
+        self.counter_capacity = counter_capacity
+        self.snapshot_top = snapshot_top
+        self.baseline_half_life_days = baseline_half_life_days
+        self.event_log = event_log
+        self.lock = threading.Lock()
+        self.metrics = EngineMetrics(enabled=metrics)
+        self.packs = []
+        self.patterns = []
+        self.network = ConditionNetwork(self.patterns)
+        self.events = EventStore(max_events)
+        self.alerts = EventStore(max_alerts)
+        self.fracture_scores = RingBuffer(SCORE_DTYPE, max_scores)
+        self.rollups = MultiResolutionRollup()
+        self.entity_scores = EntityScores(half_life_seconds=entity_half_life_seconds, max_entities=max_entities)
+        # Bumped whenever state changes, so readers can tell what is stale
+        self.version = 0
+        self.alert_version = 0
+        # Latest snapshot per rollup window, shared by every reader
+        self._snapshots = {}
+        self.reset()
+
+    def load_packs(self, packs):
+        """Swap in the compiled patterns of a new set of detection packs.
+
+        The new pattern set is built before the lock is taken, so ingestion
+        only waits for the swap. Sequence trackers of unchanged conditions
+        and the baselines of factors still in use carry over.
+        """
+        patterns = []
+        for pack in packs:
+            patterns.extend(pack.get("compiled_patterns", []))
+        network = ConditionNetwork(patterns)
+        sequence_engine = SequenceEngine(packs, previous=self.sequence_engine)
+        with self.lock:
+            baseline_engine = BaselineEngine(packs, self.baseline_half_life_days, self.baseline_engine.store)
+            self.packs = packs
+            self.patterns = patterns
+            self.network = network
+            self.sequence_engine = sequence_engine
+            self.baseline_engine = baseline_engine
+            self.metrics.patterns.set_patterns([compiled.name for compiled in patterns])
+            self.version += 1
+        return patterns
+
+    def reset(self):
+        """Clear all events, alerts, counters and sequence state."""
+        with self.lock:
+            self.events.clear()
+            self.alerts.clear()
+            self.fracture_scores.clear()
+            self.rollups.clear()
+            self.entity_scores.clear()
+            self._pending = ([], [], [], [])
+            self.current_fracture_score = 0.0
+            self.total_events = 0
+            self.total_alerts = 0
+            self.alert_by_pattern = SpaceSaving(self.counter_capacity)
+            self.events_by_user = SpaceSaving(self.counter_capacity)
+            self.events_by_type = SpaceSaving(self.counter_capacity)
+            self.events_by_location = SpaceSaving(self.counter_capacity)
+            self.events_by_ip = SpaceSaving(self.counter_capacity)
+            self.last_update = datetime.now()
+            self.sequence_engine = SequenceEngine(self.packs)
+            self.baseline_engine = BaselineEngine(self.packs, self.baseline_half_life_days)
+            self.metrics.clear()
+            self.version += 1
+            self.alert_version += 1
+
+    def process_batch(self, raw_events):
+        """Run detection for a batch of raw events under a single lock."""
+        with self.lock:
+            process = self._process_event_profiled if self.metrics.enabled else self._process_event
+            events = [process(raw) for raw in raw_events]
+            self._flush_batch()
+            self.version += 1
+            return events
+
+    def process_event(self, raw):
+        with self.lock:
+            process = self._process_event_profiled if self.metrics.enabled else self._process_event
+            event = process(raw)
+            self._flush_batch()
+            self.version += 1
+            return event
+
+    def collect_metrics(self):
+        """Return a copy of the engine's ``EngineMetrics``, taken under the lock."""
+        with self.lock:
+            return self.metrics.copy()
+
+    def _flush_batch(self):
+        # Rollups and entity scores are updated once per batch with vectorized arithmetic
+        timestamps, fracture_scores, events, scores = self._pending
+        if "rollups" in self.components:
+            self.rollups.add_batch(timestamps, fracture_scores, events)
+        if "entities" in self.components:
+            self.entity_scores.update(events, timestamps, scores)
+        self._pending = ([], [], [], [])
+
+    def _process_event(self, raw):
+        stateful_hits, baseline_hits = self._ingest(raw)
+        # Pattern matching; the score comes back clamped
+        score, pattern, matches = score_event(raw, self.network, stateful_hits, baseline_hits)
+        event = self._event(raw, score, pattern, matches)
+        self._alert(event, score)
+        self._update_score(event, score)
+        return event
+
+    def _process_event_profiled(self, raw):
+        # The same steps as _process_event, timed per stage
+        metrics = self.metrics
+        clock = time.perf_counter
+        t0 = clock()
+        stateful_hits, baseline_hits = self._ingest(raw)
+        t1 = clock()
+        score, pattern, matches = score_event(raw, self.network, stateful_hits, baseline_hits, metrics.patterns)
+        event = self._event(raw, score, pattern, matches)
+        t2 = clock()
+        self._alert(event, score)
+        t3 = clock()
+        self._update_score(event, score)
+        t4 = clock()
+        metrics.observe("ingest", t1 - t0)
+        metrics.observe("match", t2 - t1)
+        metrics.observe("alert", t3 - t2)
+        metrics.observe("score", t4 - t3)
+        return event
+
+    def _ingest(self, raw):
+        # Update statistics and the history-dependent detectors
+        if "counters" in self.components:
+            self.events_by_user.add(raw["user_id"])
+            self.events_by_type.add(raw["event_type"])
+            self.events_by_location.add(raw["location"])
+            self.events_by_ip.add(raw["ip_address"])
+        sequence_hits = self.sequence_engine.observe(raw)
+        baseline_hits = self.baseline_engine.observe(raw)
+        return stateful_matches(sequence_hits, baseline_hits), baseline_hits
+
+    def _event(self, raw, score, pattern, matches):
+        self.total_events += 1
+        return processed_event(raw, self.total_events, score, pattern, matches)
+
+    def _alert(self, event, score):
+        # Create alert if score is high enough
+        if score > ALERT_THRESHOLD:
+            if "alerts" in self.components:
+                self.alerts.append(event)
+            self.total_alerts += 1
+            self.alert_version += 1
+            if event["matched_pattern"] and "counters" in self.components:
+                self.alert_by_pattern.add(event["matched_pattern"])
+
+    def _update_score(self, event, score):
+        # Update fracture score (moving average)
+        self.current_fracture_score = 0.7 * self.current_fracture_score + 0.3 * score
+        components = self.components
+        if "scores" in components or "rollups" in components or "entities" in components:
+            timestamp = np.datetime64(event["timestamp"], "us")
+            if "scores" in components:
+                self.fracture_scores.append((timestamp, self.current_fracture_score))
+            if "rollups" in components or "entities" in components:
+                pending_timestamps, pending_fracture_scores, pending_events, pending_scores = self._pending
+                pending_timestamps.append(timestamp.astype(np.int64) / 1e6)
+                pending_fracture_scores.append(self.current_fracture_score)
+                pending_events.append(event)
+                pending_scores.append(score)
+        if "events" in components:
+            self.events.append(event)
+        if self.event_log is not None:
+            self.event_log.append(event, self.current_fracture_score)
+
+        self.last_update = datetime.now()
+
+    def save_baselines(self, path):
+        """Save the per-user behavioral baselines to an ``.npz`` snapshot."""
+        with self.lock:
+            self.baseline_engine.store.save(path)
+
+    def load_baselines(self, path):
+        """Restore behavioral baselines saved with ``save_baselines()``."""
+        store = BaselineStore.load(path)
+        with self.lock:
+            self.baseline_engine = BaselineEngine(self.packs, self.baseline_half_life_days, store)
+
+    def snapshot(self, rollup_window=None):
+        """Return a consistent, read-only copy of the current state.
+
+        ``events`` and ``alerts`` are ``EventTable`` copies, oldest first;
+        ``fracture_scores`` is a structured array of timestamp and score;
+        ``entity_scores`` maps each entity field to its ``snapshot_top``
+        most fractured entities, as ``EntityScores.top()`` rows.
+        With ``rollup_window`` (seconds), ``rollup`` holds the bucketed
+        scores and counts of that trailing window.
+
+        Snapshots are cached until the engine version changes, so many
+        readers polling an idle or slow engine share one copy; treat them
+        as read-only.
+        """
+        with self.lock:
+            cached = self._snapshots.get(rollup_window)
+            if cached is not None and cached.version == self.version and cached.alert_version == self.alert_version:
+                return cached
+            events = self.events.latest(self.snapshot_events)
+            alerts = self.alerts.latest(self.snapshot_alerts)
+            events.rows = events.rows.copy()
+            alerts.rows = alerts.rows.copy()
+            snapshot = EngineSnapshot(
+                events=events,
+                alerts=alerts,
+                fracture_scores=self.fracture_scores.latest(self.snapshot_scores).copy(),
+                current_fracture_score=self.current_fracture_score,
+                total_events=self.total_events,
+                total_alerts=self.total_alerts,
+                alert_by_pattern=self.alert_by_pattern.top_counts(self.snapshot_top),
+                events_by_user=self.events_by_user.top_counts(self.snapshot_top),
+                events_by_type=self.events_by_type.top_counts(self.snapshot_top),
+                events_by_location=self.events_by_location.top_counts(self.snapshot_top),
+                events_by_ip=self.events_by_ip.top_counts(self.snapshot_top),
+                entity_scores=self.entity_scores.top_by_field(self.snapshot_top),
+                pattern_count=len(self.patterns),
+                last_update=self.last_update,
+                rollup=None if rollup_window is None else self.rollups.window(rollup_window),
+                version=self.version,
+                alert_version=self.alert_version,
+            )
+            self._snapshots[rollup_window] = snapshot
+            return snapshot
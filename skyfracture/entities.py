@@ -0,0 +1,209 @@
+"""Per-entity fracture scores in flat NumPy arrays.
+
+``EntityScores`` keeps an exponentially weighted moving average of event
+scores for every user, location and source IP, alongside the engine's one
+global fracture score. Each entity gets a dense integer ID from a
+``Vocabulary`` and its score, event count and last event time live at that
+index in preallocated arrays, so memory is a few dozen bytes per entity.
+
+Updates are applied once per batch. Events are grouped by entity and the
+EWMA recurrence of each group, in arrival order, is solved in closed form:
+with ``f_j = (1 - alpha) * decay_j`` the score after the last event is
+``s0 * prod(f) + alpha * sum_j x_j * prod(f after j)``. The products come
+from one cumulative sum of ``log(f)`` over the batch, so the cost per event
+is constant however many entities there are or however often one repeats.
+
+With ``half_life_seconds`` set, a score also halves for every half-life
+between an entity's event and its previous one (an event older than the
+previous one decays nothing), and queries decay it up to the latest event
+time seen, so entities that went quiet drop down the ranking.
+
+Each field keeps at most ``max_entities`` entities. Past that, entities
+whose decayed score fell below ``min_score`` are forgotten, then the
+lowest-scoring ones, until ``EVICT_TO`` of the limit are left; a forgotten
+entity that comes back starts over from a score and event count of zero.
+"""
+
+import numpy as np
+
+from skyfracture.batch import Vocabulary
+
+ENTITY_FIELDS = ("user_id", "location", "ip_address")
+
+# Floor for log(f), so alpha = 1 or a decay that underflows stays finite
+MIN_LOG_FACTOR = -700.0
+
+MAX_ENTITIES = 100_000
+# Decayed score below which an entity is the first to be forgotten
+MIN_SCORE = 1e-3
+# Share of max_entities left after an eviction, so evictions stay rare
+EVICT_TO = 0.75
+
+
+class EntityScoreTable:
+    """EWMA score, event count and last event time per value of one field."""
+
+    def __init__(self, alpha=0.3, half_life_seconds=None, initial_capacity=1024, max_entities=MAX_ENTITIES,
+                 min_score=MIN_SCORE):
+        self.alpha = alpha
+        self.half_life_seconds = half_life_seconds
+        self.max_entities = max_entities
+        self.min_score = min_score
+        self.ids = Vocabulary()
+        self.score = np.zeros(initial_capacity)
+        self.events = np.zeros(initial_capacity, dtype=np.int64)
+        self.last_seen = np.zeros(initial_capacity)
+
+    def _grow(self, size):
+        capacity = len(self.score)
+        while capacity < size:
+            capacity *= 2
+        for name in ("score", "events", "last_seen"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _decay(self, elapsed):
+        return np.power(0.5, np.maximum(elapsed, 0.0) / self.half_life_seconds)
+
+    def update(self, keys, times, scores):
+        """Fold one batch of events into the scores.
+
+        ``keys`` are the field values, ``times`` the event times in seconds
+        and ``scores`` the event scores, all in arrival order.
+        """
+        n = len(scores)
+        if not n:
+            return
+        codes = self.ids.encode(keys)
+        if len(self.ids) > len(self.score):
+            self._grow(len(self.ids))
+
+        # Group by entity, keeping arrival order within a group
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        times = np.asarray(times, dtype=np.float64)[order]
+        scores = np.asarray(scores, dtype=np.float64)[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        entities = codes[starts]
+
+        factor = np.full(n, 1.0 - self.alpha)
+        if self.half_life_seconds:
+            previous = np.empty(n)
+            previous[1:] = times[:-1]
+            previous[starts] = self.last_seen[entities]
+            factor *= self._decay(times - previous)
+        with np.errstate(divide="ignore"):
+            log_factor = np.maximum(np.log(factor), MIN_LOG_FACTOR)
+        cumulative = np.cumsum(log_factor)
+
+        # Log of the product of the factors after each event, up to its group's end
+        group = np.repeat(np.arange(len(starts)), ends - starts + 1)
+        after = cumulative[ends][group] - cumulative
+        before_first = cumulative[starts] - log_factor[starts]
+        carried = self.score[entities] * np.exp(cumulative[ends] - before_first)
+        added = self.alpha * np.add.reduceat(scores * np.exp(after), starts)
+
+        self.score[entities] = carried + added
+        self.events[entities] += ends - starts + 1
+        self.last_seen[entities] = np.maximum(self.last_seen[entities], np.maximum.reduceat(times, starts))
+        if self.max_entities and len(self.ids) > self.max_entities:
+            self._evict()
+
+    def _evict(self):
+        """Forget faded, then low-scoring, entities down to ``EVICT_TO`` of the limit."""
+        size = len(self.ids)
+        scores = self.current(float(self.last_seen[:size].max()))
+        keep = np.flatnonzero(scores >= self.min_score)
+        target = max(1, int(self.max_entities * EVICT_TO))
+        if len(keep) > target:
+            keep = np.sort(keep[np.argpartition(scores[keep], len(keep) - target)[len(keep) - target:]])
+        # Survivors move to the front under new codes; freed slots are zeroed for reuse
+        self.ids = Vocabulary(self.ids.values[i] for i in keep.tolist())
+        for name in ("score", "events", "last_seen"):
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+            array[len(keep):size] = 0
+
+    def current(self, now=None):
+        """Scores of every entity, decayed up to ``now`` (seconds)."""
+        size = len(self.ids)
+        scores = self.score[:size]
+        if self.half_life_seconds and now is not None:
+            scores = scores * self._decay(now - self.last_seen[:size])
+        return scores
+
+    def top(self, n=10, now=None):
+        """``(entity, score, events, last_seen)`` of the ``n`` highest scores."""
+        scores = self.current(now)
+        if n < len(scores):
+            indices = np.argpartition(scores, len(scores) - n)[len(scores) - n:]
+        else:
+            indices = np.arange(len(scores))
+        indices = indices[np.argsort(scores[indices], kind="stable")[::-1]]
+        return [
+            (self.ids.decode(i), score, events, last_seen)
+            for i, score, events, last_seen in zip(
+                indices.tolist(), scores[indices].tolist(), self.events[indices].tolist(),
+                self.last_seen[indices].tolist(),
+            )
+        ]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class EntityScores:
+    """Per-entity fracture scores for each of ``fields``.
+
+    ``alpha`` is the weight of a new event, as in the global score's
+    ``0.7 * previous + 0.3 * score``. ``half_life_seconds`` (None for no
+    decay) sets how fast the score of an idle entity fades, and
+    ``max_entities`` (None for no limit) how many entities each field keeps.
+    """
+
+    def __init__(self, fields=ENTITY_FIELDS, alpha=0.3, half_life_seconds=3600.0, initial_capacity=1024,
+                 max_entities=MAX_ENTITIES):
+        self.fields = tuple(fields)
+        self.alpha = alpha
+        self.half_life_seconds = half_life_seconds
+        self.initial_capacity = initial_capacity
+        self.max_entities = max_entities
+        self.clear()
+
+    def clear(self):
+        self.tables = {
+            field: EntityScoreTable(self.alpha, self.half_life_seconds, self.initial_capacity, self.max_entities)
+            for field in self.fields
+        }
+        # Latest event time seen, which queries decay scores up to
+        self.now = None
+
+    def update(self, events, times, scores):
+        """Fold a batch of event dicts, their times in seconds and scores in."""
+        if not len(scores):
+            return
+        for field, table in self.tables.items():
+            table.update([event[field] for event in events], times, scores)
+        latest = float(np.max(times))
+        self.now = latest if self.now is None else max(self.now, latest)
+
+    def top(self, n=10, field=None):
+        """The ``n`` most fractured entities as ``(field, entity, score, events, last_seen)``.
+
+        Ranks one field's entities, or all fields' together when ``field``
+        is None.
+        """
+        fields = self.fields if field is None else (field,)
+        rows = [(f, *row) for f in fields for row in self.tables[f].top(n, self.now)]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:n]
+
+    def top_by_field(self, n=10):
+        """``{field: rows}`` with the ``n`` highest-scoring entities of each field."""
+        return {field: self.top(n, field) for field in self.fields}
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
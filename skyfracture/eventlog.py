@@ -0,0 +1,299 @@
+"""Persistent, segmented append-only event log.
+
+Events are written as fixed-size binary rows (``LOG_DTYPE``) into
+preallocated, memory-mapped segment files of ``segment_events`` rows each.
+Every segment has a small JSON sidecar with its row count and a sparse
+index holding the minimum and maximum timestamp of each block of
+``index_interval`` rows, so a time-range query only touches the blocks that
+can contain matching events. String fields are dictionary encoded with
+vocabularies shared by all segments of the log. Every segment may refer to
+any code, so unlike ``EventStore`` the log's vocabularies are never
+compacted: they hold every distinct user, event type, location, role,
+pattern and severity ever logged (source IPs are stored as integers).
+
+Layout of a log directory::
+
+    vocabularies.json
+    segment-000000.bin
+    segment-000000.json
+    ...
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from skyfracture.batch import Vocabulary
+from skyfracture.store import EVENT_DTYPE, STRING_FIELDS, EventTable, encode_event
+
+LOG_DTYPE = np.dtype(EVENT_DTYPE.descr + [("fracture_score", np.float64)])
+
+DEFAULT_SEGMENT_EVENTS = 1 << 20
+DEFAULT_INDEX_INTERVAL = 4096
+DEFAULT_FLUSH_EVENTS = 1024
+
+
+def _to_micros(value):
+    """Convert a datetime / datetime64 / None bound to int64 microseconds."""
+    if value is None:
+        return None
+    return int(np.datetime64(value, "us").astype(np.int64))
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class _Segment:
+    """One memory-mapped segment file and its sparse timestamp index."""
+
+    def __init__(self, directory, number, capacity, index_interval):
+        self.number = number
+        self.capacity = capacity
+        self.index_interval = index_interval
+        self.data_path = os.path.join(directory, f"segment-{number:06d}.bin")
+        self.meta_path = os.path.join(directory, f"segment-{number:06d}.json")
+        self.count = 0
+        self.block_min = []
+        self.block_max = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.count = meta["count"]
+            self.block_min = meta["block_min"]
+            self.block_max = meta["block_max"]
+        self._rows = None
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def rows(self, writable=False):
+        if self._rows is None or (writable and self._rows.mode != "r+"):
+            if not os.path.exists(self.data_path):
+                # Preallocate; on most filesystems this is a sparse file
+                with open(self.data_path, "wb") as f:
+                    f.truncate(self.capacity * LOG_DTYPE.itemsize)
+            mode = "r+" if writable else "r"
+            self._rows = np.memmap(self.data_path, dtype=LOG_DTYPE, mode=mode, shape=(self.capacity,))
+        return self._rows
+
+    def write(self, rows):
+        """Append rows, update the block index and persist the sidecar."""
+        start = self.count
+        end = start + len(rows)
+        data = self.rows(writable=True)
+        data[start:end] = rows
+        data.flush()
+
+        timestamps = data["timestamp"].view(np.int64)
+        interval = self.index_interval
+        for block in range(start // interval, (end - 1) // interval + 1):
+            block_ts = timestamps[block * interval:min(end, (block + 1) * interval)]
+            low, high = int(block_ts.min()), int(block_ts.max())
+            if block < len(self.block_min):
+                self.block_min[block] = low
+                self.block_max[block] = high
+            else:
+                self.block_min.append(low)
+                self.block_max.append(high)
+        self.count = end
+        _write_json(self.meta_path, {
+            "count": self.count,
+            "block_min": self.block_min,
+            "block_max": self.block_max,
+        })
+
+    def overlaps(self, start, end):
+        """Whether any row may fall in the window, judged from the index alone."""
+        if not self.block_min:
+            return False
+        return (start is None or max(self.block_max) >= start) and (end is None or min(self.block_min) <= end)
+
+    def row_ranges(self, start, end):
+        """Yield ``(first, last)`` row ranges whose blocks overlap the window."""
+        interval = self.index_interval
+        run_start = None
+        for block, (low, high) in enumerate(zip(self.block_min, self.block_max)):
+            overlaps = (start is None or high >= start) and (end is None or low <= end)
+            if overlaps and run_start is None:
+                run_start = block
+            elif not overlaps and run_start is not None:
+                yield run_start * interval, min(block * interval, self.count)
+                run_start = None
+        if run_start is not None:
+            yield run_start * interval, self.count
+
+    def close(self):
+        if self._rows is not None:
+            if self._rows.mode == "r+":
+                self._rows.flush()
+            self._rows = None
+
+
+class EventLog:
+    """Append-only on-disk event log with time-range queries and replay."""
+
+    def __init__(self, directory, segment_events=DEFAULT_SEGMENT_EVENTS,
+                 index_interval=DEFAULT_INDEX_INTERVAL, flush_events=DEFAULT_FLUSH_EVENTS):
+        self.directory = directory
+        self.segment_events = segment_events
+        self.index_interval = index_interval
+        self.flush_events = flush_events
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.vocabularies_path = os.path.join(directory, "vocabularies.json")
+        self.vocabularies = {field: Vocabulary() for field in STRING_FIELDS}
+        if os.path.exists(self.vocabularies_path):
+            with open(self.vocabularies_path) as f:
+                for field, values in json.load(f).items():
+                    self.vocabularies[field] = Vocabulary(values)
+        self._vocabulary_sizes = self._current_vocabulary_sizes()
+
+        numbers = sorted(
+            int(name[len("segment-"):-len(".json")])
+            for name in os.listdir(directory)
+            if name.startswith("segment-") and name.endswith(".json")
+        )
+        self.segments = [_Segment(directory, n, segment_events, index_interval) for n in numbers]
+        if not self.segments or self.segments[-1].full:
+            self._new_segment()
+        self._pending = []
+
+    def _current_vocabulary_sizes(self):
+        return {field: len(vocabulary) for field, vocabulary in self.vocabularies.items()}
+
+    def _new_segment(self):
+        number = self.segments[-1].number + 1 if self.segments else 0
+        if self.segments:
+            self.segments[-1].close()
+        self.segments.append(_Segment(self.directory, number, self.segment_events, self.index_interval))
+
+    def _code(self, field, value):
+        return -1 if value is None else self.vocabularies[field].code(value)
+
+    def append(self, event, fracture_score=0.0):
+        """Buffer one processed event; rows are written every ``flush_events``."""
+        with self.lock:
+            self._pending.append(encode_event(event, self._code) + (fracture_score,))
+            if len(self._pending) >= self.flush_events:
+                self.flush()
+
+    def flush(self):
+        """Write buffered rows to the active segment(s)."""
+        with self.lock:
+            if not self._pending:
+                return
+            rows = np.array(self._pending, dtype=LOG_DTYPE)
+            self._pending = []
+            # Persist new vocabulary entries before the rows that use them
+            sizes = self._current_vocabulary_sizes()
+            if sizes != self._vocabulary_sizes:
+                _write_json(self.vocabularies_path, {
+                    field: vocabulary.values for field, vocabulary in self.vocabularies.items()
+                })
+                self._vocabulary_sizes = sizes
+            while len(rows):
+                segment = self.segments[-1]
+                room = segment.capacity - segment.count
+                segment.write(rows[:room])
+                rows = rows[room:]
+                if segment.full:
+                    self._new_segment()
+
+    def _filter_mask(self, rows, start, end, filters):
+        timestamps = rows["timestamp"].view(np.int64)
+        mask = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps <= end
+        for field, value in (filters or {}).items():
+            if field == "min_score":
+                mask &= rows["score"] >= value
+            elif field in STRING_FIELDS:
+                values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+                codes = [self.vocabularies[field].codes[v] for v in values if v in self.vocabularies[field].codes]
+                mask &= np.isin(rows[field], codes)
+            else:
+                values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+                mask &= np.isin(rows[field], values)
+        return mask
+
+    def iter_query(self, start=None, end=None, filters=None, chunk_events=65536, reverse=False):
+        """Yield ``EventTable`` chunks of matching events in log order.
+
+        ``filters`` maps field names to a value or list of values; string
+        fields are matched by their decoded value and ``min_score`` keeps
+        events scoring at least that much. Alerts are ``min_score`` 0.7+.
+        With ``reverse``, chunks come newest first (rows within a chunk
+        stay in log order). Segments whose index rules out the window are
+        skipped without being mapped.
+        """
+        start, end = _to_micros(start), _to_micros(end)
+        with self.lock:
+            self.flush()
+            plan = [(segment.rows(), list(segment.row_ranges(start, end)))
+                    for segment in self.segments if segment.overlaps(start, end)]
+        if reverse:
+            plan = [(data, ranges[::-1]) for data, ranges in plan[::-1]]
+        for data, ranges in plan:
+            for first, last in ranges:
+                chunk_starts = range(first, last, chunk_events)
+                for chunk_start in (reversed(chunk_starts) if reverse else chunk_starts):
+                    rows = data[chunk_start:min(last, chunk_start + chunk_events)]
+                    selected = rows[self._filter_mask(rows, start, end, filters)]
+                    if len(selected):
+                        yield EventTable(np.array(selected), self.vocabularies)
+
+    def query(self, start=None, end=None, filters=None, limit=None):
+        """Return matching events as one ``EventTable``.
+
+        With ``limit``, only the latest ``limit`` matching events are
+        returned, and the log is read backwards only until they are found.
+        """
+        if limit is None:
+            chunks = [table.rows for table in self.iter_query(start, end, filters)]
+        else:
+            chunks = []
+            found = 0
+            for table in self.iter_query(start, end, filters, chunk_events=max(limit, 4096), reverse=True):
+                chunks.append(table.rows)
+                found += len(table)
+                if found >= limit:
+                    break
+            chunks.reverse()
+        rows = np.concatenate(chunks) if chunks else np.zeros(0, dtype=LOG_DTYPE)
+        if limit is not None:
+            rows = rows[len(rows) - min(limit, len(rows)):]
+        return EventTable(rows, self.vocabularies)
+
+    def replay(self, engine, start=None, end=None, filters=None, chunk_events=65536):
+        """Run logged events back through ``engine`` in batches.
+
+        Events are re-detected from their raw fields, so replaying under
+        updated detection packs shows what they would have flagged. Returns
+        the number of events replayed.
+        """
+        replayed = 0
+        for table in self.iter_query(start, end, filters, chunk_events):
+            batch = table.raw_events()
+            engine.process_batch(batch)
+            replayed += len(batch)
+        return replayed
+
+    def __len__(self):
+        with self.lock:
+            return sum(segment.count for segment in self.segments) + len(self._pending)
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            for segment in self.segments:
+                segment.close()
@@ -0,0 +1,485 @@
+"""Batched alert and SIEM export driven by the packs' ``integrations``.
+
+Each pack may declare::
+
+    integrations:
+      siem:
+        event_mapping: {failed_login: ACCESS_FAILURE, ...}
+        severity_mapping: {high: Alert, ...}
+        min_score: 0.5
+      alerts:
+        min_score: 0.7
+        destinations: {high: [...], ...}   # or one list for every severity
+
+An event is exported under the pack of its matched pattern: as a ``siem``
+record when its score reaches the SIEM ``min_score``, and as an ``alert``
+record, carrying the destinations for its severity, when it reaches the
+alerts ``min_score``.
+
+``ExportPipeline.submit()`` only filters events and hands the records to a
+bounded queue per sink, so detection never waits on a sink. A thread per
+sink batches records by count or age, encodes them as (gzip compressed)
+NDJSON and writes them out. When a sink's queue is full, the overflow is
+handed to a second bounded queue that a spill thread writes to disk, and
+batches the sink fails to take are spilled by its own thread; spilled
+batches are redelivered once the sink catches up. Records that find the
+hand-off queue full too, or any overflow with ``overflow="drop"``, are
+shed and counted.
+"""
+
+import gzip
+import itertools
+import json
+import os
+import queue
+import re
+import socket
+import struct
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from skyfracture.engine import ALERT_THRESHOLD
+
+OVERFLOW_POLICIES = ("spill", "drop")
+
+# Overflowing submissions waiting for the spill thread, per sink
+SPILL_QUEUE_SIZE = 64
+
+
+class ExportRules:
+    """Per-pattern export settings from the ``integrations`` of a pack list.
+
+    A pattern name present in several packs follows the first one, as
+    pattern matching does.
+    """
+
+    def __init__(self, packs):
+        self.by_pattern = {}
+        for pack in packs:
+            integrations = pack.get("integrations") or {}
+            rule = (pack.get("name"), integrations.get("siem"), integrations.get("alerts"))
+            if rule[1] is None and rule[2] is None:
+                continue
+            for pattern in pack.get("patterns", []):
+                self.by_pattern.setdefault(pattern.get("name"), rule)
+
+    def records(self, event):
+        """Export records for one processed event, possibly none."""
+        rule = self.by_pattern.get(event.get("matched_pattern"))
+        if rule is None:
+            return []
+        pack_name, siem, alerts = rule
+        score = event["score"]
+        severity = event.get("severity") or "medium"
+        records = []
+        if siem is not None and score >= float(siem.get("min_score", 0.0)):
+            record = _base_record(event, pack_name)
+            record["type"] = "siem"
+            record["category"] = (siem.get("event_mapping") or {}).get(event["event_type"], event["event_type"])
+            record["siem_severity"] = (siem.get("severity_mapping") or {}).get(severity, severity)
+            records.append(record)
+        if alerts is not None and score >= float(alerts.get("min_score", ALERT_THRESHOLD)):
+            destinations = alerts.get("destinations") or []
+            if isinstance(destinations, dict):
+                destinations = destinations.get(severity, [])
+            record = _base_record(event, pack_name)
+            record["type"] = "alert"
+            record["destinations"] = list(destinations)
+            record["recommendations"] = event.get("recommendations", [])
+            records.append(record)
+        return records
+
+
+def _base_record(event, pack_name):
+    timestamp = event["timestamp"]
+    return {
+        "event_id": event.get("event_id"),
+        "timestamp": timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp,
+        "user_id": event["user_id"],
+        "event_type": event["event_type"],
+        "location": event.get("location"),
+        "ip_address": event.get("ip_address"),
+        "role": event.get("role"),
+        "score": event["score"],
+        "pattern": event.get("matched_pattern"),
+        "severity": event.get("severity"),
+        "pack": pack_name,
+    }
+
+
+def encode_records(records, compress=True):
+    """NDJSON bytes for a batch of records, as one gzip member if ``compress``."""
+    data = "".join(json.dumps(record, default=str) + "\n" for record in records).encode()
+    return gzip.compress(data, compresslevel=6) if compress else data
+
+
+class FileSink:
+    """Append payloads to a local file.
+
+    Compressed payloads are complete gzip members, so the file reads back
+    as one ``.ndjson.gz`` stream.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, payload, compressed):
+        with open(self.path, "ab") as f:
+            f.write(payload)
+
+
+class UnixSocketSink:
+    """Send payloads over a Unix stream socket as length-prefixed frames."""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.name = f"unix:{path}"
+        self._socket = None
+
+    def write(self, payload, compressed):
+        if self._socket is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._socket = sock
+        try:
+            self._socket.sendall(struct.pack(">I", len(payload)) + payload)
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            raise
+
+
+class HTTPSink:
+    """POST payloads as NDJSON to an HTTP endpoint."""
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+        self.name = url
+
+    def write(self, payload, compressed):
+        headers = {"Content-Type": "application/x-ndjson"}
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+        request = urllib.request.Request(self.url, data=payload, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def sink_from_url(url):
+    """Build a sink from ``file:PATH``, ``unix:PATH``, an ``http(s)://`` URL
+    or a plain file path."""
+    if url.startswith(("http://", "https://")):
+        return HTTPSink(url)
+    if url.startswith("unix:"):
+        return UnixSocketSink(url[len("unix:"):])
+    if url.startswith("file:"):
+        return FileSink(url[len("file:"):])
+    return FileSink(url)
+
+
+class _SinkWorker:
+    """Bounded record queue, batching thread and spill directory of one sink."""
+
+    def __init__(self, sink, queue_size, batch_size, flush_interval, compress, overflow, spill_dir,
+                 max_spill_bytes, retry_interval):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.overflow = overflow
+        self.spill_dir = os.path.join(spill_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", sink.name))
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_interval = retry_interval
+        self._spill_ids = itertools.count()
+        self._spill_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        # Overflow goes to disk on its own thread, so offer() never waits on I/O
+        self.spill_queue = queue.Queue(maxsize=SPILL_QUEUE_SIZE)
+        self._spill_thread = None
+        self.sent_records = 0
+        self.sent_batches = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.last_error = None
+        if overflow == "spill":
+            os.makedirs(self.spill_dir, exist_ok=True)
+        # Batches left over from an earlier run count towards the limit
+        self.spill_bytes = self._disk_spill_bytes()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"skyfracture-export-{self.sink.name}", daemon=True)
+        self._thread.start()
+        if self.overflow == "spill":
+            self._spill_thread = threading.Thread(target=self._run_spill,
+                                                  name=f"skyfracture-spill-{self.sink.name}", daemon=True)
+            self._spill_thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in (self._thread, self._spill_thread):
+            if thread is not None:
+                thread.join(timeout)
+        self._thread = None
+        self._spill_thread = None
+
+    def offer(self, records):
+        """Queue records without blocking or I/O; the overflow is handed to
+        the spill thread, or shed when that is behind too."""
+        for i, record in enumerate(records):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self._overflow(records[i:])
+                return
+
+    def _overflow(self, records):
+        if self.overflow == "spill":
+            try:
+                self.spill_queue.put_nowait(records)
+                return
+            except queue.Full:
+                pass
+        self.dropped += len(records)
+
+    def _run_spill(self):
+        while True:
+            try:
+                records = self.spill_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            self._spill(encode_records(records, self.compress), len(records))
+
+    def _spill_files(self):
+        try:
+            return sorted(name for name in os.listdir(self.spill_dir) if not name.endswith(".tmp"))
+        except OSError:
+            return []
+
+    def _disk_spill_bytes(self):
+        total = 0
+        for name in self._spill_files():
+            try:
+                total += os.path.getsize(os.path.join(self.spill_dir, name))
+            except OSError:
+                continue
+        return total
+
+    def _spill(self, payload, n):
+        with self._spill_lock:
+            if self.spill_bytes + len(payload) > self.max_spill_bytes:
+                self.dropped += n
+                return
+            # Named by time so redelivery keeps the original order
+            name = f"{time.time_ns():020d}-{next(self._spill_ids):06d}-{n}"
+            path = os.path.join(self.spill_dir, name)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(payload)
+            os.replace(f"{path}.tmp", path)
+            self.spill_bytes += len(payload)
+            self.spilled += n
+
+    def _deliver(self, payload, n):
+        """Write a payload to the sink; True on success."""
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            self.sink.write(payload, self.compress)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+        self.sent_records += n
+        self.sent_batches += 1
+        self.sent_bytes += len(payload)
+        return True
+
+    def _flush(self, batch):
+        payload = encode_records(batch, self.compress)
+        if not self._deliver(payload, len(batch)):
+            if self.overflow == "spill":
+                self._spill(payload, len(batch))
+            else:
+                self.dropped += len(batch)
+
+    def _drain_spill(self):
+        """Redeliver the oldest spilled batch; True if one was delivered."""
+        files = self._spill_files()
+        if not files:
+            return False
+        path = os.path.join(self.spill_dir, files[0])
+        with open(path, "rb") as f:
+            payload = f.read()
+        if not self._deliver(payload, int(files[0].rsplit("-", 1)[1])):
+            return False
+        os.remove(path)
+        with self._spill_lock:
+            self.spill_bytes -= len(payload)
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            stopping = self._stop.is_set()
+            timeout = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                # Take whatever else is already waiting, up to a full batch
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or stopping):
+                self._flush(batch)
+                batch = []
+                deadline = None
+            elif not batch:
+                if stopping:
+                    return
+                if self.overflow == "spill" and self.queue.empty():
+                    # Idle: catch up on spilled batches
+                    self._drain_spill()
+
+    def stats(self):
+        return {
+            "sink": self.sink.name,
+            "queued": self.queue.qsize(),
+            "spill_queued": self.spill_queue.qsize(),
+            "sent_records": self.sent_records,
+            "sent_batches": self.sent_batches,
+            "sent_bytes": self.sent_bytes,
+            "spilled": self.spilled,
+            "spill_bytes": self.spill_bytes,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class ExportPipeline:
+    """Asynchronous export of processed events to one or more sinks.
+
+    ``sinks`` are sink objects or URLs for ``sink_from_url()``. Records
+    are batched per sink up to ``batch_size`` or ``flush_interval``
+    seconds. Each sink queues at most ``queue_size`` records; beyond that,
+    or while the sink is failing, batches go to ``spill_dir`` (up to
+    ``max_spill_bytes`` per sink) from background threads with
+    ``overflow="spill"``, or are dropped with ``overflow="drop"``. Up to
+    ``SPILL_QUEUE_SIZE`` overflowing submissions per sink wait to be
+    spilled; further ones are dropped.
+    """
+
+    def __init__(self, sinks, batch_size=500, flush_interval=1.0, queue_size=10_000, compress=True,
+                 overflow="spill", spill_dir="./export_spill/", max_spill_bytes=256 * 1024 * 1024,
+                 retry_interval=5.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        self.workers = [
+            _SinkWorker(sink_from_url(sink) if isinstance(sink, str) else sink, queue_size, batch_size,
+                        flush_interval, compress, overflow, spill_dir, max_spill_bytes, retry_interval)
+            for sink in sinks
+        ]
+        self.rules = ExportRules([])
+        self._packs = None
+        self.submitted = 0
+        self.records = 0
+
+    @property
+    def running(self):
+        return any(worker._thread is not None and worker._thread.is_alive() for worker in self.workers)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=5.0):
+        """Flush what is queued and stop; spilled batches stay on disk."""
+        for worker in self.workers:
+            worker.stop(timeout)
+
+    def submit(self, events, packs):
+        """Export processed events under the ``integrations`` of ``packs``.
+
+        Never blocks or touches the disk: records a sink cannot queue are
+        handed to its spill thread, or shed.
+        """
+        if packs is not self._packs:
+            self.rules = ExportRules(packs)
+            self._packs = packs
+        records = []
+        for event in events:
+            records.extend(self.rules.records(event))
+        self.submitted += len(events)
+        self.records += len(records)
+        if records:
+            for worker in self.workers:
+                worker.offer(records)
+        return len(records)
+
+    def queued(self):
+        return sum(worker.queue.qsize() for worker in self.workers)
+
+    def stats(self):
+        """Counters per sink, as a list of dicts."""
+        return [worker.stats() for worker in self.workers]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def serve_collector(output, port=8088, host="127.0.0.1", delay=0.0):
+    """Local HTTP stand-in for a SIEM collector, served from a daemon thread.
+
+    POSTed NDJSON (gzip or plain) is appended to ``output``. ``delay``
+    seconds per request simulate a slow collector. Returns the server.
+    """
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            if delay:
+                time.sleep(delay)
+            with lock, open(output, "ab") as f:
+                f.write(body)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="skyfracture-collector", daemon=True).start()
+    return server
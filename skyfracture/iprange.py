@@ -0,0 +1,98 @@
+"""Integer interval index for IPv4 ranges.
+
+CIDR blocks are parsed once into ``[start, end]`` integer intervals, sorted
+and merged, so membership is a binary search over the interval starts. The
+same index answers scalar lookups with ``bisect`` and batch lookups with
+``numpy.searchsorted``.
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+
+MAX_IPV4 = (1 << 32) - 1
+
+
+def ip_to_int(ip_address):
+    """Convert a dotted-quad IPv4 string to an integer."""
+    a, b, c, d = ip_address.split(".")
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+
+def int_to_ip(value):
+    """Convert an integer back to a dotted-quad IPv4 string."""
+    value = int(value)
+    return f"{value >> 24 & 255}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def parse_range(value):
+    """Parse a CIDR block, a single address or an ``a-b`` range.
+
+    Host bits set in a CIDR block are ignored, so ``10.1.2.3/8`` covers the
+    same addresses as ``10.0.0.0/8``.
+    """
+    value = value.strip()
+    if "-" in value:
+        first, last = value.split("-", 1)
+        return ip_to_int(first.strip()), ip_to_int(last.strip())
+    if "/" in value:
+        address, prefix = value.split("/", 1)
+        prefix = int(prefix)
+        if not 0 <= prefix <= 32:
+            raise ValueError(f"Invalid CIDR prefix length: {value}")
+        host_bits = 32 - prefix
+        start = (ip_to_int(address) >> host_bits) << host_bits
+        return start, start + (1 << host_bits) - 1
+    address = ip_to_int(value)
+    return address, address
+
+
+class IPRangeIndex:
+    """Sorted, merged IPv4 intervals searched by binary search."""
+
+    __slots__ = ("starts", "ends", "_start_array", "_end_array")
+
+    def __init__(self, ranges=()):
+        intervals = sorted(parse_range(r) if isinstance(r, str) else tuple(r) for r in ranges)
+        starts, ends = [], []
+        for start, end in intervals:
+            if starts and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts = starts
+        self.ends = ends
+        self._start_array = np.array(starts, dtype=np.uint32)
+        self._end_array = np.array(ends, dtype=np.uint32)
+
+    def __contains__(self, ip):
+        i = bisect_right(self.starts, ip) - 1
+        return i >= 0 and ip <= self.ends[i]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def contains_many(self, ips):
+        """Vectorized membership test for an array of uint32 addresses."""
+        ips = np.asarray(ips, dtype=np.uint32)
+        if not self.starts:
+            return np.zeros(ips.shape, dtype=bool)
+        i = np.searchsorted(self._start_array, ips, side="right") - 1
+        return (i >= 0) & (ips <= self._end_array[np.maximum(i, 0)])
+
+    def __repr__(self):
+        return f"IPRangeIndex({len(self)} intervals)"
+
+
+def event_ip(event):
+    """Return the event source address as an integer.
+
+    Events produced by the engine carry ``ip_int`` so no string parsing is
+    needed; other events fall back to parsing ``ip_address``.
+    """
+    ip = event.get('ip_int')
+    if ip is None:
+        ip = ip_to_int(event['ip_address'])
+    return ip
@@ -0,0 +1,250 @@
+"""Seeded, vectorized synthetic load with scripted attack injection.
+
+``simulate_event()`` draws one event at a time with the ``random`` module,
+which is fine for the live demo but far too slow to stress the engine.
+``LoadGenerator`` draws whole batches as NumPy columns from a seeded
+``numpy.random.Generator``: the same seed, parameters and batch sizes
+always give the same events, so workloads of tens of millions of events
+can be regenerated instead of stored.
+
+Scripted attacks are written over the background traffic at a chosen rate
+per generated event. Each one is a short run of events interleaved with
+normal traffic, shaped to trip the shipped detection packs:
+
+``password_spray``
+    failed logins for several different users from one external address.
+``privilege_escalation``
+    two failed logins, a successful login and admin access by one user.
+``exfiltration``
+    a burst of data exports by one user from an external address.
+
+The ``attack`` column labels every injected row with its scenario, which
+gives regression tests and capacity runs a ground truth.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from skyfracture.iprange import int_to_ip, parse_range
+from skyfracture.simulation import EVENT_TYPES, LOCATIONS, USERS
+
+DEFAULT_NETWORKS = (("10.0.0.0/8", 0.7), ("203.0.0.0/8", 0.3))
+DEFAULT_ROLE_WEIGHTS = {"user": 0.9, "admin": 0.07, "executive": 0.03}
+EXTERNAL_NETWORK = "203.0.0.0/8"
+
+ATTACK_SCENARIOS = ("password_spray", "privilege_escalation", "exfiltration")
+SPRAY_USERS = 8
+ESCALATION_STEPS = ("failed_login", "failed_login", "successful_login", "admin_access")
+EXFILTRATION_EVENTS = 20
+
+
+def _weights(values, weights):
+    """Normalized probabilities for ``values`` from a dict or sequence."""
+    if weights is None:
+        return np.full(len(values), 1.0 / len(values))
+    if isinstance(weights, dict):
+        weights = [weights.get(value, 0.0) for value in values]
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(weights) != len(values) or weights.sum() <= 0:
+        raise ValueError("weights must give a positive weight to at least one value")
+    return weights / weights.sum()
+
+
+class GeneratedBatch:
+    """One generated batch as columns.
+
+    ``user``, ``event_type``, ``location`` and ``attack`` are codes into the
+    generator's ``user_ids``, ``event_types``, ``locations`` and
+    ``ATTACK_SCENARIOS`` lists (``attack`` is -1 for background traffic);
+    ``ip`` holds IPv4 addresses as uint32 and ``timestamp`` datetime64[us].
+    """
+
+    def __init__(self, generator, timestamp, user, event_type, location, ip, attack):
+        self.generator = generator
+        self.timestamp = timestamp
+        self.user = user
+        self.event_type = event_type
+        self.location = location
+        self.ip = ip
+        self.attack = attack
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @property
+    def hour(self):
+        return ((self.timestamp.astype(np.int64) // 3_600_000_000) % 24).astype(np.uint8)
+
+    @property
+    def role(self):
+        return self.generator.user_roles[self.user]
+
+    def ip_addresses(self):
+        """Dotted-quad strings, formatting each distinct address once."""
+        unique, inverse = np.unique(self.ip, return_inverse=True)
+        formatted = np.array([int_to_ip(ip) for ip in unique.tolist()], dtype=object)
+        return formatted[inverse]
+
+    def to_events(self):
+        """Raw event dicts, as ``simulate_event()`` returns them."""
+        generator = self.generator
+        users = np.asarray(generator.user_ids, dtype=object)[self.user]
+        roles = np.asarray(generator.roles, dtype=object)[self.role]
+        event_types = np.asarray(generator.event_types, dtype=object)[self.event_type]
+        locations = np.asarray(generator.locations, dtype=object)[self.location]
+        columns = zip(
+            self.timestamp.tolist(), users.tolist(), event_types.tolist(), locations.tolist(),
+            self.ip_addresses().tolist(), self.ip.tolist(), self.hour.tolist(), roles.tolist(),
+        )
+        return [
+            {
+                "timestamp": timestamp,
+                "user_id": user_id,
+                "event_type": event_type,
+                "location": location,
+                "ip_address": ip_address,
+                "ip_int": ip_int,
+                "hour": hour,
+                "role": role,
+            }
+            for timestamp, user_id, event_type, location, ip_address, ip_int, hour, role in columns
+        ]
+
+
+class LoadGenerator:
+    """Reproducible synthetic event batches drawn with NumPy.
+
+    ``users`` is a number of synthetic users (with roles drawn from
+    ``role_weights``) or a list of user dicts like ``simulation.USERS``.
+    Users stay at their normal location with probability ``home_share``.
+    ``networks`` is a list of ``(cidr, weight)`` source networks and
+    ``event_type_weights`` a dict or sequence of weights. Events are
+    ``events_per_second`` apart on average, starting at ``start``.
+    ``attacks`` maps scenario names to expected attacks per event.
+    """
+
+    def __init__(self, seed=0, users=USERS, locations=LOCATIONS, event_types=EVENT_TYPES,
+                 event_type_weights=None, networks=DEFAULT_NETWORKS, role_weights=None,
+                 home_share=0.8, events_per_second=1000.0, start=None, attacks=None):
+        self.rng = np.random.default_rng(seed)
+        self.locations = list(locations)
+        self.event_types = list(event_types)
+        self.event_type_probabilities = _weights(self.event_types, event_type_weights)
+        for event_type in ESCALATION_STEPS + ("data_export",):
+            if event_type not in self.event_types:
+                self.event_types.append(event_type)
+                self.event_type_probabilities = np.append(self.event_type_probabilities, 0.0)
+        self.event_type_codes = {event_type: i for i, event_type in enumerate(self.event_types)}
+
+        if isinstance(users, int):
+            role_weights = role_weights or DEFAULT_ROLE_WEIGHTS
+            self.roles = list(role_weights)
+            self.user_ids = [f"user{i:06d}" for i in range(users)]
+            self.user_roles = self.rng.choice(len(self.roles), size=users,
+                                              p=_weights(self.roles, role_weights)).astype(np.int32)
+            self.home_locations = self.rng.integers(0, len(self.locations), size=users, dtype=np.int32)
+        else:
+            self.roles = sorted({user["role"] for user in users})
+            self.user_ids = [user["user_id"] for user in users]
+            self.user_roles = np.array([self.roles.index(user["role"]) for user in users], dtype=np.int32)
+            for user in users:
+                if user["normal_location"] not in self.locations:
+                    self.locations.append(user["normal_location"])
+            self.home_locations = np.array([self.locations.index(user["normal_location"]) for user in users],
+                                           dtype=np.int32)
+        self.home_share = home_share
+
+        ranges = [parse_range(cidr) for cidr, _ in networks]
+        self.network_starts = np.array([start for start, _ in ranges], dtype=np.int64)
+        self.network_sizes = np.array([end - start + 1 for start, end in ranges], dtype=np.int64)
+        self.network_probabilities = _weights(ranges, [weight for _, weight in networks])
+        self.external_network = parse_range(EXTERNAL_NETWORK)
+
+        self.mean_gap_us = 1e6 / events_per_second
+        start = start or datetime(2025, 1, 1)
+        self.clock = np.datetime64(start, "us").astype(np.int64)
+        self.attacks = dict(attacks or {})
+        unknown = set(self.attacks) - set(ATTACK_SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown attack scenarios: {sorted(unknown)}")
+
+    def _background(self, n):
+        rng = self.rng
+        gaps = rng.exponential(self.mean_gap_us, size=n)
+        timestamp = self.clock + np.cumsum(gaps).astype(np.int64)
+        if n:
+            self.clock = int(timestamp[-1])
+        user = rng.integers(0, len(self.user_ids), size=n, dtype=np.int32)
+        event_type = rng.choice(len(self.event_types), size=n, p=self.event_type_probabilities).astype(np.int32)
+        away = rng.random(n) >= self.home_share
+        location = np.where(away, rng.integers(0, len(self.locations), size=n, dtype=np.int32),
+                            self.home_locations[user])
+        network = rng.choice(len(self.network_starts), size=n, p=self.network_probabilities)
+        offset = (rng.random(n) * self.network_sizes[network]).astype(np.int64)
+        ip = (self.network_starts[network] + offset).astype(np.uint32)
+        return timestamp, user, event_type, location.astype(np.int32), ip
+
+    def _external_ips(self, n):
+        start, end = self.external_network
+        return self.rng.integers(start, end + 1, size=n, dtype=np.int64).astype(np.uint32)
+
+    def _inject(self, columns, attack, scenario, n_attacks):
+        """Overwrite rows of the batch with ``n_attacks`` scripted attacks."""
+        _, user, event_type, location, ip = columns
+        rng = self.rng
+        n = len(user)
+        codes = self.event_type_codes
+        if scenario == "password_spray":
+            steps = min(SPRAY_USERS, len(self.user_ids))
+            first = rng.integers(0, len(self.user_ids), size=(n_attacks, 1))
+            step_users = (first + np.arange(steps)) % len(self.user_ids)
+            step_types = np.full(steps, codes["failed_login"])
+            step_ips = np.repeat(self._external_ips(n_attacks)[:, None], steps, axis=1)
+        elif scenario == "privilege_escalation":
+            steps = len(ESCALATION_STEPS)
+            step_users = np.repeat(rng.integers(0, len(self.user_ids), size=(n_attacks, 1)), steps, axis=1)
+            step_types = np.array([codes[event_type] for event_type in ESCALATION_STEPS])
+            step_ips = rng.integers(0, 255, size=(n_attacks, steps)).astype(np.uint32) | (10 << 24)
+        else:
+            steps = EXFILTRATION_EVENTS
+            step_users = np.repeat(rng.integers(0, len(self.user_ids), size=(n_attacks, 1)), steps, axis=1)
+            step_types = np.full(steps, codes["data_export"])
+            step_ips = np.repeat(self._external_ips(n_attacks)[:, None], steps, axis=1)
+
+        # Steps are spread over the following rows, interleaved with normal traffic
+        spacing = max(1, min(3, n // steps))
+        span = (steps - 1) * spacing + 1
+        if span > n:
+            return
+        starts = rng.integers(0, n - span + 1, size=(n_attacks, 1))
+        rows = (starts + np.arange(steps) * spacing).ravel()
+        user[rows] = step_users.ravel()
+        event_type[rows] = np.broadcast_to(step_types, (n_attacks, steps)).ravel()
+        location[rows] = self.home_locations[user[rows]]
+        ip[rows] = step_ips.ravel()
+        attack[rows] = ATTACK_SCENARIOS.index(scenario)
+
+    def batch(self, n):
+        """Generate the next ``n`` events as a ``GeneratedBatch``."""
+        columns = self._background(n)
+        attack = np.full(n, -1, dtype=np.int8)
+        for scenario in ATTACK_SCENARIOS:
+            rate = self.attacks.get(scenario)
+            if rate:
+                n_attacks = int(self.rng.poisson(rate * n))
+                if n_attacks:
+                    self._inject(columns, attack, scenario, n_attacks)
+        timestamp, user, event_type, location, ip = columns
+        return GeneratedBatch(self, timestamp.astype("datetime64[us]"), user, event_type, location, ip, attack)
+
+    def batches(self, total, batch_size=100_000):
+        """Yield ``GeneratedBatch`` objects covering ``total`` events."""
+        while total > 0:
+            n = min(batch_size, total)
+            yield self.batch(n)
+            total -= n
+
+    def events(self, n):
+        """Generate ``n`` events as raw event dicts."""
+        return self.batch(n).to_events()
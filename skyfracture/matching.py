@@ -0,0 +1,330 @@
+"""Pattern matching: the reference matcher and precompiled matchers.
+
+Detection pack patterns are plain YAML dicts. Interpreting those dicts for
+every event means string-comparing condition types and re-parsing time
+strings over and over, so patterns are compiled once at load time into
+``CompiledPattern`` objects that only hold what matching actually needs.
+"""
+
+import ipaddress
+
+from skyfracture.iprange import IPRangeIndex, event_ip
+
+ALL_HOURS_MASK = (1 << 24) - 1
+HIGH_RISK_EVENT_TYPES = ("admin_access", "vpn_connection", "data_export")
+DEFAULT_SCORE_MODIFIER = 0.6
+
+
+def _hour_of(value):
+    """Return the hour component of an "HH:MM" string."""
+    return int(value.split(":")[0])
+
+
+def _range_index(ranges, range_cache=None):
+    key = frozenset(ranges)
+    if range_cache is None:
+        return IPRangeIndex(key)
+    index = range_cache.get(key)
+    if index is None:
+        index = range_cache[key] = IPRangeIndex(key)
+    return index
+
+
+def combine(operator, values):
+    """Combine subcondition results with a ``compound`` operator.
+
+    Results are True, False or None for conditions that cannot be evaluated
+    (unsupported types). Those are left out; a compound of only such
+    conditions is None itself.
+    """
+    known = [value for value in values if value is not None]
+    if not known:
+        return None
+    if str(operator).upper() == "OR":
+        return any(known)
+    return all(known)
+
+
+def compile_condition(cond, range_cache=None):
+    """Compile one condition dict into a function of an event.
+
+    The function returns True, False, or None when the condition type is
+    not supported, matching ``condition_value()``.
+    """
+    cond_type = cond['type']
+    if cond_type == "time_window":
+        start, end = [_hour_of(t) for t in cond['not_between']]
+        return lambda event: not (start <= event['hour'] <= end)
+    if cond_type == "geo_location":
+        denied = frozenset(cond.get('not_in_locations', []))
+        return lambda event: event['location'] not in denied
+    if cond_type == "ip_range":
+        index = _range_index(cond.get('not_in_ranges', []), range_cache)
+        return lambda event: event_ip(event) not in index
+    if cond_type == "role_check":
+        roles = frozenset(cond.get('roles', []))
+        return lambda event: event['role'] in roles
+    if cond_type == "event_type":
+        types = frozenset(cond.get('types', []))
+        return lambda event: event['event_type'] in types
+    if cond_type == "compound":
+        operator = cond.get('operator', "AND")
+        children = [compile_condition(child, range_cache) for child in cond.get('conditions', [])]
+        return lambda event: combine(operator, [child(event) for child in children])
+    return lambda event: None
+
+
+class CompiledPattern:
+    """A detection pattern reduced to a compact, per-event matcher.
+
+    Conditions of the same type are folded together since all conditions of
+    a pattern must pass: time windows become a single 24-bit mask of the
+    hours that may match, location deny lists become one frozenset and role
+    and event type checks become the intersection of their sets. ``ip_range``
+    ``not_in_ranges`` lists are merged into one ``IPRangeIndex``.
+    ``compound`` conditions are kept as functions from ``compile_condition()``.
+    """
+
+    __slots__ = ("pattern", "name", "hour_mask", "denied_locations", "roles", "event_types",
+                 "denied_ranges", "sequence_conditions", "baseline_conditions", "compounds")
+
+    def __init__(self, pattern, hour_mask=ALL_HOURS_MASK, denied_locations=frozenset(),
+                 roles=None, denied_ranges=None, sequence_conditions=(), baseline_conditions=(),
+                 event_types=None, compounds=()):
+        self.pattern = pattern
+        self.name = pattern.get("name")
+        self.hour_mask = hour_mask
+        self.denied_locations = denied_locations
+        self.roles = roles
+        self.event_types = event_types
+        self.denied_ranges = denied_ranges
+        self.sequence_conditions = sequence_conditions
+        self.baseline_conditions = baseline_conditions
+        self.compounds = compounds
+
+    @property
+    def stateful(self):
+        """True if the pattern has conditions that depend on event history."""
+        return bool(self.sequence_conditions or self.baseline_conditions)
+
+    def matches(self, event, stateful_hits=None):
+        """Return True if the event satisfies every compiled condition.
+
+        Patterns with ``event_sequence`` or ``behavioral_baseline``
+        conditions only match when they are in ``stateful_hits``, the
+        patterns whose history-dependent conditions all fired for this event.
+        """
+        if self.stateful and (stateful_hits is None or self not in stateful_hits):
+            return False
+        if not (self.hour_mask >> event['hour']) & 1:
+            return False
+        if event['location'] in self.denied_locations:
+            return False
+        if self.denied_ranges is not None and event_ip(event) in self.denied_ranges:
+            return False
+        if self.roles is not None and event['role'] not in self.roles:
+            return False
+        if self.event_types is not None and event['event_type'] not in self.event_types:
+            return False
+        for compound in self.compounds:
+            if compound(event) is False:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"CompiledPattern({self.name!r})"
+
+
+def compile_pattern(pattern, range_cache=None):
+    """Compile a pattern dict into a ``CompiledPattern``.
+
+    ``range_cache`` maps range lists to already built ``IPRangeIndex``
+    objects so patterns repeating the same ranges share one index.
+
+    The compiled matcher gives the same result as ``pattern_matches()`` for
+    events with an hour between 0 and 23. ``event_sequence``
+    conditions are kept as-is for the ``SequenceEngine``.
+    """
+    hour_mask = ALL_HOURS_MASK
+    denied_locations = set()
+    roles = None
+    event_types = None
+    denied_ranges = set()
+    sequence_conditions = []
+    baseline_conditions = []
+    compounds = []
+
+    for cond in pattern.get('conditions', []):
+        cond_type = cond['type']
+        if cond_type == "time_window":
+            start, end = [_hour_of(t) for t in cond['not_between']]
+            for hour in range(max(start, 0), min(end, 23) + 1):
+                hour_mask &= ~(1 << hour)
+        elif cond_type == "geo_location":
+            denied_locations.update(cond.get('not_in_locations', []))
+        elif cond_type == "ip_range":
+            denied_ranges.update(cond.get('not_in_ranges', []))
+        elif cond_type == "role_check":
+            allowed = frozenset(cond.get('roles', []))
+            roles = allowed if roles is None else roles & allowed
+        elif cond_type == "event_type":
+            allowed = frozenset(cond.get('types', []))
+            event_types = allowed if event_types is None else event_types & allowed
+        elif cond_type == "event_sequence":
+            sequence_conditions.append(cond)
+        elif cond_type == "behavioral_baseline":
+            baseline_conditions.append(cond)
+        elif cond_type == "compound":
+            compounds.append(compile_condition(cond, range_cache))
+
+    range_index = _range_index(denied_ranges, range_cache) if denied_ranges else None
+
+    return CompiledPattern(
+        pattern,
+        hour_mask=hour_mask,
+        denied_locations=frozenset(denied_locations),
+        roles=roles,
+        event_types=event_types,
+        denied_ranges=range_index,
+        sequence_conditions=tuple(sequence_conditions),
+        baseline_conditions=tuple(baseline_conditions),
+        compounds=tuple(compounds),
+    )
+
+
+def compile_patterns(patterns):
+    """Compile a list of pattern dicts, preserving their order."""
+    range_cache = {}
+    return [compile_pattern(pattern, range_cache) for pattern in patterns]
+
+
+# Function to check if a pattern matches an event
+def pattern_matches(event, pattern):
+    # Reference implementation interpreting the pattern dict directly
+    for cond in pattern.get('conditions', []):
+        if cond['type'] == "time_window":
+            hour = event['hour']
+            start, end = [int(t.split(":")[0]) for t in cond['not_between']]
+            if start <= hour <= end:
+                return False  # Not after hours
+        if cond['type'] == "geo_location":
+            if event['location'] in cond.get('not_in_locations', []):
+                return False
+        if cond['type'] == "ip_range":
+            address = ipaddress.ip_address(event['ip_address'])
+            if any(address in ipaddress.ip_network(r, strict=False) for r in cond.get('not_in_ranges', [])):
+                return False
+        if cond['type'] == "role_check":
+            if event['role'] not in cond.get('roles', []):
+                return False
+        if cond['type'] == "event_type":
+            if event['event_type'] not in cond.get('types', []):
+                return False
+        if cond['type'] == "compound":
+            if condition_value(event, cond) is False:
+                return False
+        if cond['type'] in ("event_sequence", "behavioral_baseline"):
+            return False  # Needs event history, see SequenceEngine / BaselineEngine
+    return True  # All conditions pass
+
+
+def condition_value(event, cond):
+    """Reference evaluation of one condition: True, False or None.
+
+    None stands for condition types that cannot be evaluated from a single
+    event; ``compound`` conditions combine their subconditions with
+    ``combine()``.
+    """
+    cond_type = cond['type']
+    if cond_type == "compound":
+        values = [condition_value(event, child) for child in cond.get('conditions', [])]
+        return combine(cond.get('operator', "AND"), values)
+    if cond_type in ("time_window", "geo_location", "ip_range", "role_check", "event_type"):
+        return pattern_matches(event, {"conditions": [cond]})
+    return None
+
+
+# Function to find matching pattern using the matchers compiled at load time
+def find_matching_pattern(event, patterns, stateful_hits=None):
+    for compiled in patterns:
+        if compiled.matches(event, stateful_hits):
+            return compiled.pattern
+    return None
+
+
+class PatternIndex:
+    """Inverted index from event attributes to candidate patterns.
+
+    For role, event type, location and hour, every value a pattern mentions
+    maps to a bitset of the patterns that value admits, with bit ``i`` for
+    the ``i``-th pattern; patterns without a condition on an attribute admit
+    every value. ANDing the four bitsets gives the candidates for an event,
+    which are then checked lowest bit first with ``CompiledPattern.matches()``,
+    so the first match is the same as a linear scan while the per-event cost
+    follows the number of candidates tried, not the number of patterns.
+
+    Stateful patterns are left out of the bitsets and only considered when
+    they are in ``stateful_hits``.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.bits = {compiled: 1 << i for i, compiled in enumerate(self.patterns)}
+        role_any = type_any = 0
+        self.role_bits = {}
+        self.type_bits = {}
+        self.location_denied = {}
+        self.hour_bits = [0] * 24
+        for i, compiled in enumerate(self.patterns):
+            if compiled.stateful:
+                continue
+            bit = 1 << i
+            if compiled.roles is None:
+                role_any |= bit
+            else:
+                for role in compiled.roles:
+                    self.role_bits[role] = self.role_bits.get(role, 0) | bit
+            if compiled.event_types is None:
+                type_any |= bit
+            else:
+                for event_type in compiled.event_types:
+                    self.type_bits[event_type] = self.type_bits.get(event_type, 0) | bit
+            for location in compiled.denied_locations:
+                self.location_denied[location] = self.location_denied.get(location, 0) | bit
+            for hour in range(24):
+                if (compiled.hour_mask >> hour) & 1:
+                    self.hour_bits[hour] |= bit
+        self.role_any = role_any
+        self.type_any = type_any
+        self.role_bits = {role: bits | role_any for role, bits in self.role_bits.items()}
+        self.type_bits = {event_type: bits | type_any for event_type, bits in self.type_bits.items()}
+
+    def candidates(self, event, stateful_hits=None):
+        """Bitset of the patterns that may match the event."""
+        bits = self.role_bits.get(event['role'], self.role_any)
+        bits &= self.type_bits.get(event['event_type'], self.type_any)
+        denied = self.location_denied.get(event['location'])
+        if denied:
+            bits &= ~denied
+        hour = event['hour']
+        if 0 <= hour < 24:
+            bits &= self.hour_bits[hour]
+        if stateful_hits:
+            for compiled in stateful_hits:
+                bits |= self.bits.get(compiled, 0)
+        return bits
+
+    def find(self, event, stateful_hits=None):
+        """Return the first pattern dict matching the event, or None."""
+        bits = self.candidates(event, stateful_hits)
+        patterns = self.patterns
+        while bits:
+            low = bits & -bits
+            compiled = patterns[low.bit_length() - 1]
+            if compiled.matches(event, stateful_hits):
+                return compiled.pattern
+            bits ^= low
+        return None
+
+    def __len__(self):
+        return len(self.patterns)
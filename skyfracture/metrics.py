@@ -0,0 +1,265 @@
+"""Toggleable engine instrumentation with a Prometheus text export.
+
+``EngineMetrics`` keeps per-stage latency histograms, per-pattern
+evaluation and hit counts with cumulative evaluation time, and gauges read
+on collection (such as the ingestion queue depth). Engines check
+``enabled`` once per event and take an uninstrumented path when it is off,
+so disabled metrics cost one attribute lookup per event.
+
+Stages are ``ingest`` (sequence and baseline tracking, counters),
+``match`` (pattern evaluation and scoring), ``alert``, ``score`` (fracture
+score, buffers, rollups and event log) and ``render`` (dashboard panel
+builds, timed by ``RenderCache``).
+"""
+
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = ("ingest", "match", "alert", "score", "render")
+
+# Latency bucket upper bounds in seconds, from 1 microsecond to 10 seconds
+DEFAULT_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds.
+
+    ``counts[i]`` counts observations up to ``bounds[i]`` and above
+    ``bounds[i - 1]``; the last count is for observations above every bound.
+    """
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds, n=1):
+        """Record ``n`` observations of ``seconds`` each."""
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += n
+        self.count += n
+        self.sum += seconds * n
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile, interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def to_state(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+    @classmethod
+    def from_state(cls, state):
+        histogram = cls(state["bounds"])
+        histogram.counts = list(state["counts"])
+        histogram.count = state["count"]
+        histogram.sum = state["sum"]
+        return histogram
+
+
+class PatternStats:
+    """Evaluation count, hit count and cumulative seconds per pattern name.
+
+    Patterns are addressed by their position in the engine's pattern list;
+    patterns sharing a name (the same pattern in two packs) share a slot.
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self.slot_of = {}
+        self.slots = []
+        self.evaluations = []
+        self.hits = []
+        self.seconds = []
+        self.set_patterns(names)
+
+    def _slot(self, name):
+        slot = self.slot_of.get(name)
+        if slot is None:
+            slot = self.slot_of[name] = len(self.names)
+            self.names.append(name)
+            self.evaluations.append(0)
+            self.hits.append(0)
+            self.seconds.append(0.0)
+        return slot
+
+    def set_patterns(self, names):
+        """Point pattern positions at the slots of ``names``, keeping totals."""
+        self.slots = [self._slot(name) for name in names]
+
+    def record(self, i, hit, seconds):
+        slot = self.slots[i]
+        self.evaluations[slot] += 1
+        self.hits[slot] += hit
+        self.seconds[slot] += seconds
+
+    def rows(self):
+        """``(name, evaluations, hits, seconds)`` per pattern, slowest first."""
+        rows = zip(self.names, self.evaluations, self.hits, self.seconds)
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def merge_rows(self, rows):
+        for name, evaluations, hits, seconds in rows:
+            slot = self._slot(name)
+            self.evaluations[slot] += evaluations
+            self.hits[slot] += hits
+            self.seconds[slot] += seconds
+
+
+class EngineMetrics:
+    """Stage histograms, pattern stats and gauges of one engine."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.patterns = PatternStats()
+        # name -> (help text, function returning the current value)
+        self.gauges = {}
+
+    def observe(self, stage, seconds, n=1):
+        self.stages[stage].observe(seconds, n)
+
+    def register_gauge(self, name, read, help_text=""):
+        """Report ``read()`` as gauge ``skyfracture_<name>`` on collection."""
+        self.gauges[name] = (help_text, read)
+
+    def clear(self):
+        """Zero the histograms and pattern stats; gauges stay registered."""
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        names = [self.patterns.names[slot] for slot in self.patterns.slots]
+        self.patterns = PatternStats(names)
+
+    def to_state(self):
+        """Picklable copy of the histograms and pattern stats."""
+        return {
+            "stages": {stage: histogram.to_state() for stage, histogram in self.stages.items()},
+            "patterns": self.patterns.rows(),
+        }
+
+    def merge_state(self, state):
+        for stage, histogram in state["stages"].items():
+            self.stages[stage].merge(LatencyHistogram.from_state(histogram))
+        self.patterns.merge_rows(state["patterns"])
+
+    def copy(self):
+        metrics = EngineMetrics(self.enabled)
+        metrics.merge_state(self.to_state())
+        metrics.gauges = dict(self.gauges)
+        return metrics
+
+    def gauge_values(self):
+        values = {}
+        for name, (_, read) in self.gauges.items():
+            try:
+                values[name] = float(read())
+            except Exception:
+                continue  # A gauge whose source went away is left out
+        return values
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def to_prometheus(metrics):
+    """Render ``EngineMetrics`` in the Prometheus text exposition format."""
+    lines = [
+        "# HELP skyfracture_stage_latency_seconds Per-event latency of each detection stage.",
+        "# TYPE skyfracture_stage_latency_seconds histogram",
+    ]
+    for stage, histogram in metrics.stages.items():
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+            cumulative += count
+            lines.append(f'skyfracture_stage_latency_seconds_bucket{{stage="{stage}",le="{_number(bound)}"}} '
+                         f'{cumulative}')
+        lines.append(f'skyfracture_stage_latency_seconds_sum{{stage="{stage}"}} {_number(histogram.sum)}')
+        lines.append(f'skyfracture_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+    pattern_rows = metrics.patterns.rows()
+    for name, help_text, column in (
+        ("skyfracture_pattern_evaluations_total", "Times a pattern was evaluated against an event.", 1),
+        ("skyfracture_pattern_hits_total", "Times a pattern matched an event.", 2),
+        ("skyfracture_pattern_seconds_total", "Cumulative time spent evaluating a pattern.", 3),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for row in pattern_rows:
+            value = row[column] if column < 3 else _number(row[column])
+            lines.append(f'{name}{{pattern="{_label(row[0])}"}} {value}')
+
+    for name, value in metrics.gauge_values().items():
+        help_text = metrics.gauges[name][0]
+        if help_text:
+            lines.append(f"# HELP skyfracture_{name} {help_text}")
+        lines.append(f"# TYPE skyfracture_{name} gauge")
+        lines.append(f"skyfracture_{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(metrics, path):
+    """Write the Prometheus text to ``path`` atomically.
+
+    Suitable for the node exporter's textfile collector, which may read
+    the file at any moment.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(to_prometheus(metrics))
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(collect, port=9464, host="127.0.0.1"):
+    """Serve ``to_prometheus(collect())`` at ``/metrics`` from a daemon thread.
+
+    Returns the server; call ``shutdown()`` on it to stop serving.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = to_prometheus(collect()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would flood stderr
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="skyfracture-metrics", daemon=True).start()
+    return server
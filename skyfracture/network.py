@@ -0,0 +1,170 @@
+"""Shared-condition evaluation network returning every matching pattern.
+
+Packs repeat the same conditions across patterns: the same business-hours
+window, the same RFC 1918 ``not_in_ranges``. ``ConditionNetwork`` gives each
+distinct condition one node, so per event a condition is evaluated at most
+once whatever the number of patterns using it, in the spirit of a Rete
+network's shared alpha nodes.
+
+Role, event type, location and hour conditions are already resolved
+exactly by the ``PatternIndex`` bitsets, which act as the network's first
+layer. The remaining nodes (``ip_range`` lists and ``compound`` AND/OR
+conditions, whose subconditions are nodes too) are evaluated lazily for
+candidate patterns only and memoized for the rest of the event.
+"""
+
+import json
+import time
+
+from skyfracture.matching import DEFAULT_SCORE_MODIFIER, PatternIndex, combine, compile_condition
+
+INDEXED_CONDITION_TYPES = ("time_window", "geo_location", "role_check", "event_type")
+_MISSING = object()
+
+
+def condition_key(cond):
+    """Canonical key under which equal conditions share one node."""
+    return json.dumps(cond, sort_keys=True, default=str)
+
+
+def pattern_modifier(pattern, matched_subconditions=0):
+    """Score modifier of a matching pattern.
+
+    With ``score_multiplier_per_condition``, the modifier is multiplied
+    once for every matched ``compound`` subcondition beyond the first.
+    """
+    modifier = pattern.get("score_modifier", DEFAULT_SCORE_MODIFIER)
+    multiplier = pattern.get("score_multiplier_per_condition")
+    if multiplier and matched_subconditions > 1:
+        modifier *= multiplier ** (matched_subconditions - 1)
+    return modifier
+
+
+class ConditionNetwork:
+    """Evaluate compiled patterns through shared condition nodes.
+
+    ``matches()`` returns every matching pattern with its score modifier,
+    in pattern list order, so its first entry is what
+    ``find_matching_pattern()`` returns.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.index = PatternIndex(self.patterns)
+        self.node_ids = {}
+        # Leaf nodes are functions of the event; compound nodes are
+        # (operator, child node ids)
+        self.nodes = []
+        self.pattern_nodes = []
+        self.pattern_compounds = []
+        range_cache = {}
+        for compiled in self.patterns:
+            nodes = []
+            compounds = []
+            for cond in compiled.pattern.get('conditions', []):
+                if cond['type'] in INDEXED_CONDITION_TYPES:
+                    continue
+                if cond['type'] in ("event_sequence", "behavioral_baseline"):
+                    continue  # Resolved through stateful_hits
+                node_id = self._node(cond, range_cache)
+                nodes.append(node_id)
+                if cond['type'] == "compound":
+                    compounds.append(node_id)
+            self.pattern_nodes.append(tuple(nodes))
+            self.pattern_compounds.append(tuple(compounds))
+
+    def _node(self, cond, range_cache):
+        key = condition_key(cond)
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            if cond['type'] == "compound":
+                children = tuple(self._node(child, range_cache) for child in cond.get('conditions', []))
+                node = (cond.get('operator', "AND"), children)
+            else:
+                node = compile_condition(cond, range_cache)
+            node_id = self.node_ids[key] = len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _value(self, node_id, event, values):
+        value = values.get(node_id, _MISSING)
+        if value is not _MISSING:
+            return value
+        node = self.nodes[node_id]
+        if callable(node):
+            value = node(event)
+        else:
+            operator, children = node
+            value = combine(operator, [self._value(child, event, values) for child in children])
+        values[node_id] = value
+        return value
+
+    def matches(self, event, stateful_hits=None):
+        """Return ``[(compiled, score_modifier), ...]`` for every match."""
+        hour = event['hour']
+        if not 0 <= hour < 24:
+            return []
+        bits = self.index.candidates(event, stateful_hits)
+        value_of = self._value
+        values = {}
+        found = []
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            i = low.bit_length() - 1
+            compiled = self.patterns[i]
+            # Stateful patterns only reach here through stateful_hits, but
+            # their stateless conditions were not part of the index lookup
+            if compiled.stateful and not compiled.matches(event, stateful_hits):
+                continue
+            for node_id in self.pattern_nodes[i]:
+                if value_of(node_id, event, values) is False:
+                    break
+            else:
+                matched = 0
+                for node_id in self.pattern_compounds[i]:
+                    for child in self.nodes[node_id][1]:
+                        if value_of(child, event, values) is True:
+                            matched += 1
+                found.append((compiled, pattern_modifier(compiled.pattern, matched)))
+        return found
+
+    def matches_profiled(self, event, stateful_hits, stats):
+        """``matches()``, recording every candidate evaluation in ``stats``.
+
+        ``stats`` is a ``PatternStats`` set up for this network's patterns.
+        Patterns the index rules out are not evaluated and not counted; a
+        shared node's cost is charged to the first pattern evaluating it.
+        """
+        hour = event['hour']
+        if not 0 <= hour < 24:
+            return []
+        bits = self.index.candidates(event, stateful_hits)
+        value_of = self._value
+        clock = time.perf_counter
+        values = {}
+        found = []
+        while bits:
+            started = clock()
+            low = bits & -bits
+            bits ^= low
+            i = low.bit_length() - 1
+            compiled = self.patterns[i]
+            hit = False
+            if not compiled.stateful or compiled.matches(event, stateful_hits):
+                for node_id in self.pattern_nodes[i]:
+                    if value_of(node_id, event, values) is False:
+                        break
+                else:
+                    matched = 0
+                    for node_id in self.pattern_compounds[i]:
+                        for child in self.nodes[node_id][1]:
+                            if value_of(child, event, values) is True:
+                                matched += 1
+                    found.append((compiled, pattern_modifier(compiled.pattern, matched)))
+                    hit = True
+            stats.record(i, hit, clock() - started)
+        return found
@@ -0,0 +1,214 @@
+"""Loading detection packs from YAML.
+
+``PackLoader`` keeps the packs it loaded and on every ``scan()`` re-parses
+and recompiles only the files whose modification time or size changed and
+whose content hash differs. With a ``cache_dir``, parsed packs are also
+stored by content hash, so a cold start with hundreds of packs skips YAML
+parsing for every file seen before. ``PackWatcher`` polls a loader from a
+background thread and swaps changed packs into an engine.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import yaml
+
+from skyfracture.matching import compile_patterns
+
+# The C parser is several times faster; fall back when PyYAML lacks libyaml
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Bump when the cached form of a parsed pack changes
+CACHE_VERSION = 2
+
+
+def _report_error(message):
+    print(message, file=sys.stderr)
+
+
+def _compile_pack(pack):
+    pack["compiled_patterns"] = compile_patterns(pack.get("patterns", []))
+    return pack
+
+
+def _is_pack_file(path):
+    return path.endswith('.yaml') or path.endswith('.yml')
+
+
+class PackLoader:
+    """Incrementally load detection packs from a directory or a single file.
+
+    Files in a directory are loaded in name order. A file that fails to
+    load is reported through ``on_error``; its previously loaded version,
+    if any, stays in use until the file is fixed.
+    """
+
+    def __init__(self, directory_or_file, cache_dir=None, on_error=_report_error):
+        self.path = directory_or_file
+        self.cache_dir = cache_dir
+        self.on_error = on_error
+        self.lock = threading.Lock()
+        # path -> (mtime_ns, size, sha256 digest, pack or None)
+        self.files = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _pack_files(self):
+        """``(display name, path)`` of every pack file, in load order."""
+        if os.path.isdir(self.path):
+            return [(file, os.path.join(self.path, file))
+                    for file in sorted(os.listdir(self.path)) if _is_pack_file(file)]
+        if os.path.isfile(self.path) and _is_pack_file(self.path):
+            return [(self.path, self.path)]
+        return []
+
+    def _cache_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}-v{CACHE_VERSION}.json")
+
+    def _parse(self, data, digest):
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(digest), encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass  # Not cached yet, or a truncated entry
+        pack = yaml.load(data, Loader=YAML_LOADER)
+        if self.cache_dir:
+            self._store(digest, pack)
+        return pack
+
+    def _store(self, digest, pack):
+        """Cache a parsed pack as JSON, which holds plain data only, so
+        reading the cache back never runs code whoever wrote the directory."""
+        try:
+            text = json.dumps(pack)
+        except (TypeError, ValueError):
+            return  # YAML values JSON has no type for, such as dates
+        if json.loads(text) != pack:
+            return  # Would not read back the same, e.g. non-string keys
+        # Written under a temporary name so readers never see a partial entry
+        cache_path = self._cache_path(digest)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+
+    def scan(self, on_error=None):
+        """Bring the packs up to date with the files on disk.
+
+        Returns ``(packs, changed)``: the current pack list and the names of
+        the files added, modified or removed since the last scan. Packs of
+        unchanged files are the same objects as before, compiled patterns
+        included.
+        """
+        on_error = on_error or self.on_error
+        with self.lock:
+            packs = []
+            changed = []
+            seen = set()
+            for name, path in self._pack_files():
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Removed between listing and stat
+                entry = self.files.get(path)
+                if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                    if entry[3] is not None:
+                        packs.append(entry[3])
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                    if entry is not None and entry[2] == digest:
+                        # Touched but not edited
+                        pack = entry[3]
+                    else:
+                        pack = _compile_pack(self._parse(data, digest))
+                        changed.append(name)
+                except Exception as e:
+                    on_error(f"Error loading detection pack {name}: {e}")
+                    # Keep serving the last good version until the file is fixed
+                    pack = entry[3] if entry is not None else None
+                    digest = entry[2] if entry is not None else None
+                self.files[path] = (stat.st_mtime_ns, stat.st_size, digest, pack)
+                if pack is not None:
+                    packs.append(pack)
+            for path in list(self.files):
+                if path not in seen:
+                    del self.files[path]
+                    changed.append(os.path.basename(path))
+            return packs, changed
+
+
+# Function to load detection packs
+def load_detection_packs(directory_or_file, on_error=_report_error):
+    """Load detection packs from a directory or a single YAML file.
+
+    Files in a directory are loaded in name order. Packs that fail to load
+    are reported through ``on_error`` and skipped.
+    """
+    return PackLoader(directory_or_file, on_error=on_error).scan()[0]
+
+
+class PackWatcher:
+    """Poll a ``PackLoader`` and swap changed packs into an engine.
+
+    The engine's ``load_packs()`` builds the new pattern set before taking
+    its lock, so ingestion only pauses for the swap itself.
+    """
+
+    def __init__(self, engine, interval=1.0):
+        self.engine = engine
+        self.interval = interval
+        self.loader = None
+        self.reloads = 0
+        self.last_reload = None
+        self.last_changed = []
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, loader):
+        """Watch ``loader``'s files, replacing any loader watched before."""
+        self.stop()
+        self.loader = loader
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="skyfracture-pack-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def check(self):
+        """Scan once and load the packs if any file changed."""
+        packs, changed = self.loader.scan(on_error=self._record_error)
+        if changed:
+            self.engine.load_packs(packs)
+            self.reloads += 1
+            self.last_reload = datetime.now()
+            self.last_changed = changed
+        return changed
+
+    def _record_error(self, message):
+        self.last_error = message
+        _report_error(message)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self._record_error(f"Error reloading detection packs: {e}")
@@ -0,0 +1,288 @@
+"""Dashboard render layer: cached figures and downsampled series.
+
+Figures and HTML fragments are cached per panel and keyed by the engine's
+data version counters, so a rerun only rebuilds the panels whose data
+changed. Long score series are reduced with LTTB (Largest-Triangle-Three-
+Buckets) before plotting so chart cost stays flat as history grows.
+
+This module imports pandas and Plotly and is only used by the dashboard.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+MAX_CHART_POINTS = 500
+
+ENTITY_LABELS = {"user_id": "User", "location": "Location", "ip_address": "Source IP"}
+
+CHART_LAYOUT = dict(
+    plot_bgcolor="#1e2130",
+    paper_bgcolor="#1e2130",
+    font=dict(color="#ffffff"),
+    margin=dict(l=20, r=20, t=30, b=20),
+)
+
+
+def lttb(x, y, threshold):
+    """Return indices of the points LTTB keeps out of ``x``/``y``.
+
+    Always keeps the first and last point; returns all indices when there
+    are no more than ``threshold`` points.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) as the third vertex
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_scores(df_scores, max_points=MAX_CHART_POINTS):
+    """Downsample a score DataFrame with LTTB on its ``score`` column."""
+    if len(df_scores) <= max_points:
+        return df_scores
+    x = df_scores["timestamp"].to_numpy().astype("datetime64[us]").astype(np.int64)
+    return df_scores.iloc[lttb(x, df_scores["score"].to_numpy(), max_points)]
+
+
+class RenderCache:
+    """Panel outputs cached by key until their data version changes.
+
+    One cache can be shared by concurrent sessions: entries are replaced
+    whole, so a reader sees either the old or the new build. Builds are
+    timed as the ``render`` stage of ``metrics`` while it is enabled.
+    """
+
+    def __init__(self, metrics=None):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.metrics = metrics
+
+    def get(self, key, version, build):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if self.metrics is not None and self.metrics.enabled:
+            started = time.perf_counter()
+            value = build()
+            self.metrics.observe("render", time.perf_counter() - started)
+        else:
+            value = build()
+        self.entries[key] = (version, value)
+        return value
+
+
+def score_frame(snapshot):
+    """Score series for the trend chart: raw EWMA points or rollup buckets."""
+    if snapshot.rollup is None:
+        return pd.DataFrame(snapshot.fracture_scores)
+    return pd.DataFrame(snapshot.rollup.scores).rename(columns={"mean": "score"})
+
+
+MAX_BARS = 50
+
+
+def top_counts(counts, n=MAX_BARS):
+    """The ``n`` largest entries of a counts dict, highest first."""
+    return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True)[:n])
+
+
+def distribution_counts(snapshot):
+    """Per-user, per-type and per-location counts for the selected range.
+
+    The live view reads the engine's heavy-hitter counters, which already
+    hold only the top keys; rollup ranges are trimmed to ``MAX_BARS``.
+    """
+    if snapshot.rollup is None:
+        return snapshot.events_by_user, snapshot.events_by_type, snapshot.events_by_location
+    counts = snapshot.rollup.counts
+    return top_counts(counts["user_id"]), top_counts(counts["event_type"]), top_counts(counts["location"])
+
+
+def score_trend_figure(snapshot, max_points=MAX_CHART_POINTS):
+    df_scores = downsample_scores(score_frame(snapshot), max_points)
+    if not len(df_scores):
+        return None
+    fig = px.line(
+        df_scores,
+        x="timestamp",
+        y="score",
+        title="System Fracture Score Over Time",
+        labels={"timestamp": "Time", "score": "Fracture Score"},
+        line_shape="spline"
+    )
+    fig.update_layout(
+        xaxis_title="Time",
+        yaxis_title="Fracture Score",
+        yaxis_range=[0, 1],
+        **CHART_LAYOUT,
+    )
+    fig.add_shape(
+        type="line",
+        x0=df_scores["timestamp"].min(),
+        x1=df_scores["timestamp"].max(),
+        y0=0.7,
+        y1=0.7,
+        line=dict(color="red", width=2, dash="dash"),
+    )
+    if snapshot.rollup is not None:
+        # Shade the min/max range of each bucket around the mean
+        fig.add_trace(go.Scatter(
+            x=df_scores["timestamp"], y=df_scores["max"], mode="lines",
+            line=dict(width=0), showlegend=False, hoverinfo="skip",
+        ))
+        fig.add_trace(go.Scatter(
+            x=df_scores["timestamp"], y=df_scores["min"], mode="lines", fill="tonexty",
+            line=dict(width=0), fillcolor="rgba(77, 166, 255, 0.2)", showlegend=False, hoverinfo="skip",
+        ))
+    return fig
+
+
+def count_bar_figure(counts, name, value, title, x_title, y_title, color_scale="Viridis", sort=False):
+    if not counts:
+        return None
+    df = pd.DataFrame({name: list(counts.keys()), value: list(counts.values())})
+    if sort:
+        df = df.sort_values(value, ascending=False)
+    fig = px.bar(
+        df,
+        x=name,
+        y=value,
+        title=title,
+        color=value,
+        color_continuous_scale=color_scale
+    )
+    fig.update_layout(xaxis_title=x_title, yaxis_title=y_title, **CHART_LAYOUT)
+    return fig
+
+
+def event_type_pie_figure(counts):
+    if not counts:
+        return None
+    df_types = pd.DataFrame({"type": list(counts.keys()), "events": list(counts.values())})
+    fig = px.pie(
+        df_types,
+        values="events",
+        names="type",
+        title="Events by Type",
+        hole=0.4,
+        color_discrete_sequence=px.colors.sequential.Viridis
+    )
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def entity_scores_frame(entity_scores, field=None, n=10):
+    """The ``n`` most fractured entities of one field, or of all fields."""
+    rows = [row for f, field_rows in entity_scores.items() if field in (None, f) for row in field_rows]
+    rows = sorted(rows, key=lambda row: row[2], reverse=True)[:n]
+    df = pd.DataFrame(rows, columns=["type", "entity", "score", "events", "last_seen"])
+    df["type"] = df["type"].map(lambda f: ENTITY_LABELS.get(f, f))
+    df["score"] = df["score"].round(3)
+    df["last_seen"] = pd.to_datetime(df["last_seen"], unit="s")
+    return df
+
+
+def entity_scores_figure(df):
+    if df.empty:
+        return None
+    df = df.assign(label=df["type"] + ": " + df["entity"].astype(str))
+    fig = px.bar(
+        df.iloc[::-1],
+        x="score",
+        y="label",
+        orientation="h",
+        title="Most Fractured Entities",
+        color="score",
+        color_continuous_scale="Reds",
+        range_color=(0, 1),
+        hover_data=["events", "last_seen"],
+    )
+    fig.update_layout(xaxis_title="Fracture Score", yaxis_title=None, **CHART_LAYOUT)
+    return fig
+
+
+def alert_cards_html(alerts):
+    cards = []
+    for alert in alerts:
+        severity = alert.get("severity") or "medium"
+        cards.append(f"""
+            <div class='alert-card'>
+                <span class='{severity.lower()}'>{severity.upper()}</span>: {alert.get("matched_pattern") or "Unknown Pattern"}
+                <br><strong>User:</strong> {alert.get("user_id")} | <strong>Type:</strong> {alert.get("event_type")}
+                <br><strong>Location:</strong> {alert.get("location")} | <strong>Score:</strong> {alert.get("score")}
+                <br><strong>Time:</strong> {alert.get("timestamp").strftime('%H:%M:%S')}
+            </div>
+            """)
+    return "".join(cards)
+
+
+def event_cards_html(events):
+    cards = []
+    for event in events:
+        if event.get("matched_pattern"):
+            cards.append(f"""
+                <div class='anomaly-card'>
+                    <strong>{event.get("event_type")}</strong> by {event.get("user_id")} ({event.get("role")})
+                    <br><strong>Pattern:</strong> {event.get("matched_pattern")}
+                    <br><strong>Score:</strong> {event.get("score")} | <strong>Location:</strong> {event.get("location")}
+                </div>
+                """)
+        else:
+            cards.append(f"""
+                <div class='event-card'>
+                    <strong>{event.get("event_type")}</strong> by {event.get("user_id")} ({event.get("role")})
+                    <br><strong>Score:</strong> {event.get("score")} | <strong>Location:</strong> {event.get("location")}
+                </div>
+                """)
+    return "".join(cards)
+
+
+def stage_latency_frame(metrics):
+    """Count, mean and estimated percentiles per stage, in milliseconds."""
+    return pd.DataFrame([
+        {
+            "stage": stage,
+            "count": histogram.count,
+            "mean_ms": histogram.mean * 1e3,
+            "p50_ms": histogram.quantile(0.5) * 1e3,
+            "p95_ms": histogram.quantile(0.95) * 1e3,
+            "p99_ms": histogram.quantile(0.99) * 1e3,
+        }
+        for stage, histogram in metrics.stages.items()
+    ])
+
+
+def pattern_stats_frame(metrics, n=20):
+    """The ``n`` patterns with the most cumulative evaluation time."""
+    rows = metrics.patterns.rows()[:n]
+    df = pd.DataFrame(rows, columns=["pattern", "evaluations", "hits", "seconds"])
+    df["us_per_evaluation"] = (df["seconds"] * 1e6 / df["evaluations"].clip(lower=1)).round(2)
+    df["hit_rate"] = (df["hits"] / df["evaluations"].clip(lower=1)).round(4)
+    return df
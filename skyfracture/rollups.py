@@ -0,0 +1,191 @@
+"""Multi-resolution time-bucketed rollups.
+
+Each ``RollupTier`` is a ring of fixed-width time buckets holding the
+min/max/sum/count of the fracture score and per-dimension event counts.
+Buckets are addressed by ``floor(timestamp / resolution) % retention``, so
+updates are O(1) per event, applied a batch at a time, and a tier never
+holds more than ``retention`` buckets.
+``MultiResolutionRollup`` keeps several tiers side by side and answers a
+time-window query from the finest tier that covers it with a bounded number
+of points.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from skyfracture.batch import Vocabulary
+
+# (resolution in seconds, buckets retained): 15 minutes, 1 day, 1 week, 30 days
+DEFAULT_TIERS = ((1, 900), (60, 1440), (600, 1008), (3600, 720))
+DEFAULT_DIMENSIONS = {"user_id": 256, "event_type": 64, "location": 64}
+DEFAULT_MAX_POINTS = 1500
+OTHER_KEY = "(other)"
+
+SCORE_ROLLUP_DTYPE = np.dtype([
+    ("timestamp", "datetime64[s]"),
+    ("min", np.float64),
+    ("max", np.float64),
+    ("mean", np.float64),
+    ("count", np.int64),
+])
+
+RollupWindow = namedtuple("RollupWindow", ["resolution", "scores", "counts"])
+
+
+class RollupTier:
+    """Ring of time buckets at one resolution."""
+
+    def __init__(self, resolution, retention, dimensions):
+        self.resolution = resolution
+        self.retention = retention
+        self.bucket_ids = np.full(retention, -1, dtype=np.int64)
+        self.score_min = np.zeros(retention)
+        self.score_max = np.zeros(retention)
+        self.score_sum = np.zeros(retention)
+        self.score_count = np.zeros(retention, dtype=np.int64)
+        self.counts = {dimension: np.zeros((retention, 8), dtype=np.int32) for dimension in dimensions}
+
+    def add_batch(self, timestamps, scores, codes):
+        """Add events given as arrays of epoch seconds, scores and codes.
+
+        A slot holds the newest bucket mapped to it, from this batch or
+        before; events of older buckets have fallen out of retention and
+        are dropped.
+        """
+        bucket_ids = (timestamps // self.resolution).astype(np.int64)
+        slots = bucket_ids % self.retention
+        newest = self.bucket_ids.copy()
+        np.maximum.at(newest, slots, bucket_ids)
+        advanced = np.flatnonzero(newest != self.bucket_ids)
+        if len(advanced):
+            # Recycle buckets that fell out of retention
+            self.bucket_ids[advanced] = newest[advanced]
+            self.score_min[advanced] = np.inf
+            self.score_max[advanced] = -np.inf
+            self.score_sum[advanced] = 0.0
+            self.score_count[advanced] = 0
+            for counts in self.counts.values():
+                counts[advanced] = 0
+        current = self.bucket_ids[slots] == bucket_ids
+        if not current.all():
+            slots = slots[current]
+            scores = scores[current]
+            codes = {dimension: dimension_codes[current] for dimension, dimension_codes in codes.items()}
+            if not len(slots):
+                return
+
+        np.minimum.at(self.score_min, slots, scores)
+        np.maximum.at(self.score_max, slots, scores)
+        np.add.at(self.score_sum, slots, scores)
+        np.add.at(self.score_count, slots, 1)
+        for dimension, dimension_codes in codes.items():
+            counts = self.counts[dimension]
+            needed = int(dimension_codes.max()) + 1
+            if needed > counts.shape[1]:
+                grown = np.zeros((self.retention, max(needed, counts.shape[1] * 2)), dtype=np.int32)
+                grown[:, :counts.shape[1]] = counts
+                self.counts[dimension] = counts = grown
+            np.add.at(counts, (slots, dimension_codes), 1)
+
+    def _valid_slots(self, start, end):
+        bucket_ids = np.arange(int(start // self.resolution), int(end // self.resolution) + 1)
+        slots = bucket_ids % self.retention
+        valid = self.bucket_ids[slots] == bucket_ids
+        return bucket_ids[valid], slots[valid]
+
+    def scores(self, start, end):
+        """Return a ``SCORE_ROLLUP_DTYPE`` array of the buckets in range."""
+        bucket_ids, slots = self._valid_slots(start, end)
+        result = np.zeros(len(slots), dtype=SCORE_ROLLUP_DTYPE)
+        result["timestamp"] = (bucket_ids * self.resolution).astype("datetime64[s]")
+        result["min"] = self.score_min[slots]
+        result["max"] = self.score_max[slots]
+        result["count"] = self.score_count[slots]
+        result["mean"] = self.score_sum[slots] / np.maximum(result["count"], 1)
+        return result
+
+    def count_totals(self, dimension, start, end):
+        """Return per-code event counts summed over the buckets in range."""
+        _, slots = self._valid_slots(start, end)
+        return self.counts[dimension][slots].sum(axis=0)
+
+    def clear(self):
+        self.bucket_ids[:] = -1
+
+
+class MultiResolutionRollup:
+    """Score and count rollups at several resolutions.
+
+    ``dimensions`` maps event fields to the number of distinct values tracked
+    individually; further values are counted under ``OTHER_KEY``.
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, dimensions=None):
+        self.dimensions = dict(DEFAULT_DIMENSIONS if dimensions is None else dimensions)
+        self.tiers = [RollupTier(resolution, retention, self.dimensions)
+                      for resolution, retention in sorted(tiers)]
+        self.vocabularies = {dimension: Vocabulary() for dimension in self.dimensions}
+        self.other_codes = {dimension: None for dimension in self.dimensions}
+        self.latest = None
+
+    def _code(self, dimension, value):
+        vocabulary = self.vocabularies[dimension]
+        code = vocabulary.codes.get(value)
+        if code is not None:
+            return code
+        if len(vocabulary) < self.dimensions[dimension]:
+            return vocabulary.code(value)
+        if self.other_codes[dimension] is None:
+            self.other_codes[dimension] = vocabulary.code(OTHER_KEY)
+        return self.other_codes[dimension]
+
+    def add_batch(self, timestamps, scores, events):
+        """Record events at ``timestamps`` (epoch seconds) with their scores."""
+        if not len(events):
+            return
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+        codes = {
+            dimension: np.fromiter((self._code(dimension, event[dimension]) for event in events),
+                                   dtype=np.int64, count=len(events))
+            for dimension in self.dimensions
+        }
+        for tier in self.tiers:
+            tier.add_batch(timestamps, scores, codes)
+        latest = float(timestamps.max())
+        if self.latest is None or latest > self.latest:
+            self.latest = latest
+
+    def tier_for(self, window_seconds, max_points=DEFAULT_MAX_POINTS):
+        """Finest tier that covers the window within ``max_points`` buckets."""
+        for tier in self.tiers:
+            covers = tier.resolution * tier.retention >= window_seconds
+            if covers and window_seconds / tier.resolution <= max_points:
+                return tier
+        return self.tiers[-1]
+
+    def window(self, window_seconds, max_points=DEFAULT_MAX_POINTS):
+        """Return score buckets and per-dimension counts for the last window.
+
+        The window ends at the latest recorded event.
+        """
+        tier = self.tier_for(window_seconds, max_points)
+        if self.latest is None:
+            scores = np.zeros(0, dtype=SCORE_ROLLUP_DTYPE)
+            return RollupWindow(tier.resolution, scores, {dimension: {} for dimension in self.dimensions})
+        start = self.latest - window_seconds
+        counts = {}
+        for dimension in self.dimensions:
+            totals = tier.count_totals(dimension, start, self.latest)
+            values = self.vocabularies[dimension].values
+            counts[dimension] = {values[code]: int(n) for code, n in enumerate(totals[:len(values)]) if n}
+        return RollupWindow(tier.resolution, tier.scores(start, self.latest), counts)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+        # A reset frees the per-dimension caps for the values seen from now on
+        self.vocabularies = {dimension: Vocabulary() for dimension in self.dimensions}
+        self.other_codes = {dimension: None for dimension in self.dimensions}
+        self.latest = None
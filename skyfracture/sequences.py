@@ -0,0 +1,262 @@
+"""Incremental evaluation of ``event_sequence`` conditions.
+
+Sequence conditions depend on earlier events, so they cannot be answered by
+looking at a single event. ``SequenceEngine`` keeps a small amount of state
+per key (source IP or user) for every sequence condition and reports, for
+each observed event, which patterns had all of their sequence conditions
+satisfied by that event.
+
+State is bounded: per-key state older than the condition's window is dropped
+as keys go idle, and each tracker holds at most ``max_keys`` keys, evicting
+the least recently seen one first.
+
+When packs are reloaded, trackers of conditions that did not change are
+carried over from the previous ``SequenceEngine``, so in-flight sequences
+survive the reload.
+"""
+
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from skyfracture.network import condition_key
+
+DEFAULT_MAX_KEYS = 100_000
+DEFAULT_MAX_EVENTS_PER_KEY = 10_000
+
+
+def event_time(event):
+    """Return the event timestamp as seconds since the epoch."""
+    timestamp = event['timestamp']
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def _flatten_steps(sequence):
+    """Expand a sequence declaration into one event type per required event.
+
+    Steps are either plain event type strings or dicts with ``event_type``
+    and an optional ``min_count``.
+    """
+    steps = []
+    for step in sequence:
+        if isinstance(step, str):
+            steps.append(step)
+        else:
+            steps.extend([step['event_type']] * int(step.get('min_count', 1)))
+    return steps
+
+
+class _KeyedTracker:
+    """Base class holding per-key state in least-recently-seen order."""
+
+    def __init__(self, key_field, window_seconds, max_keys):
+        self.key_field = key_field
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self.states = OrderedDict()
+
+    def _state_for(self, key, now):
+        states = self.states
+        # Keys at the front have been idle the longest; anything idle for a
+        # whole window can no longer contribute to a match.
+        while states:
+            oldest_key = next(iter(states))
+            if now - states[oldest_key][0] <= self.window:
+                break
+            del states[oldest_key]
+
+        entry = states.get(key)
+        if entry is None:
+            if len(states) >= self.max_keys:
+                states.popitem(last=False)
+            entry = [now, self._new_state()]
+            states[key] = entry
+        else:
+            entry[0] = now
+            states.move_to_end(key)
+        return entry[1]
+
+    def _new_state(self):
+        raise NotImplementedError
+
+    def observe(self, event, now):
+        """Record an event and return True if the condition fired."""
+        raise NotImplementedError
+
+
+class DistinctCountTracker(_KeyedTracker):
+    """``same_source_different_users``: N distinct users from one source.
+
+    Like ``OrderedSequenceTracker``, the source starts over after firing,
+    so the next alert needs another N distinct users.
+    """
+
+    def __init__(self, event_type, min_count, window_seconds, max_keys=DEFAULT_MAX_KEYS,
+                 max_events_per_key=DEFAULT_MAX_EVENTS_PER_KEY):
+        super().__init__("ip_address", window_seconds, max_keys)
+        self.event_types = (event_type,)
+        self.min_count = min_count
+        self.max_events_per_key = max_events_per_key
+
+    def _new_state(self):
+        # Time-ordered (timestamp, user) deque plus per-user counts in window
+        return deque(), {}
+
+    def _drop_oldest(self, events, users):
+        _, user = events.popleft()
+        remaining = users[user] - 1
+        if remaining:
+            users[user] = remaining
+        else:
+            del users[user]
+
+    def observe(self, event, now):
+        events, users = self._state_for(event[self.key_field], now)
+        while events and now - events[0][0] > self.window:
+            self._drop_oldest(events, users)
+        if len(events) >= self.max_events_per_key:
+            self._drop_oldest(events, users)
+
+        user = event['user_id']
+        events.append((now, user))
+        users[user] = users.get(user, 0) + 1
+        if len(users) >= self.min_count:
+            events.clear()
+            users.clear()
+            return True
+        return False
+
+
+class OrderedSequenceTracker(_KeyedTracker):
+    """Ordered steps for one key, all within the window.
+
+    For every prefix of the flattened step list the tracker remembers the
+    latest start time at which that prefix has been completed, so each event
+    only updates the steps of its own type.
+    """
+
+    def __init__(self, steps, key_field, window_seconds, max_keys=DEFAULT_MAX_KEYS):
+        super().__init__(key_field, window_seconds, max_keys)
+        self.steps = steps
+        self.event_types = tuple(sorted(set(steps)))
+        self.positions = {
+            event_type: [i + 1 for i in reversed(range(len(steps))) if steps[i] == event_type]
+            for event_type in self.event_types
+        }
+
+    def _new_state(self):
+        return [None] * (len(self.steps) + 1)
+
+    def observe(self, event, now):
+        starts = self._state_for(event[self.key_field], now)
+        horizon = now - self.window
+        # Walk positions from last to first so one event fills one step only
+        for position in self.positions[event['event_type']]:
+            previous = now if position == 1 else starts[position - 1]
+            if previous is not None and previous >= horizon:
+                if starts[position] is None or previous > starts[position]:
+                    starts[position] = previous
+
+        completed = starts[-1]
+        if completed is not None and completed >= horizon:
+            starts[:] = [None] * len(starts)
+            return True
+        return False
+
+
+def sequence_key_field(cond):
+    """The event field an ``event_sequence`` condition groups events by."""
+    if cond.get('same_user') and cond.get('sequence_type') != "same_source_different_users":
+        return "user_id"
+    return "ip_address"
+
+
+def build_tracker(cond, memory_minutes=None, max_keys=DEFAULT_MAX_KEYS):
+    """Build a tracker for an ``event_sequence`` condition dict.
+
+    The pack's ``tuning.event_memory_minutes`` caps how far back any
+    sequence may reach.
+    """
+    minutes = float(cond.get('max_minutes', memory_minutes or 0))
+    if memory_minutes:
+        minutes = min(minutes, float(memory_minutes))
+    window_seconds = minutes * 60.0
+
+    if cond.get('sequence_type') == "same_source_different_users":
+        return DistinctCountTracker(
+            cond['event_type'], int(cond.get('min_count', 1)), window_seconds, max_keys=max_keys
+        )
+    if 'sequence' in cond:
+        return OrderedSequenceTracker(
+            _flatten_steps(cond['sequence']), sequence_key_field(cond), window_seconds, max_keys=max_keys
+        )
+    raise ValueError(f"Unsupported event_sequence condition: {cond}")
+
+
+class SequenceEngine:
+    """Evaluate the sequence conditions of a set of compiled patterns.
+
+    ``packs`` are detection pack dicts as returned by
+    ``load_detection_packs()``, carrying their ``compiled_patterns``.
+    With ``include``, only patterns for which it returns True are tracked.
+    Trackers of a ``previous`` engine are reused, state included, for
+    conditions with the same definition and event memory.
+    """
+
+    def __init__(self, packs, max_keys=DEFAULT_MAX_KEYS, include=None, previous=None):
+        self.trackers_by_type = {}
+        self.pattern_trackers = []
+        self.patterns_by_tracker = {}
+        self.tracker_keys = {}
+        reusable = previous.reusable_trackers(max_keys) if previous is not None else {}
+        for pack in packs:
+            memory = (pack.get('tuning') or {}).get('event_memory_minutes')
+            for compiled in pack.get('compiled_patterns', []):
+                if not compiled.sequence_conditions or (include is not None and not include(compiled)):
+                    continue
+                trackers = []
+                for cond in compiled.sequence_conditions:
+                    key = (condition_key(cond), memory)
+                    candidates = reusable.get(key)
+                    tracker = candidates.pop() if candidates else build_tracker(cond, memory, max_keys)
+                    self.tracker_keys[id(tracker)] = key
+                    trackers.append(tracker)
+                entry = (compiled, trackers)
+                self.pattern_trackers.append(entry)
+                for tracker in trackers:
+                    self.patterns_by_tracker[id(tracker)] = entry
+                    for event_type in tracker.event_types:
+                        self.trackers_by_type.setdefault(event_type, []).append(tracker)
+
+    def reusable_trackers(self, max_keys):
+        """Trackers by ``(condition key, event memory)``, for a successor."""
+        reusable = {}
+        for _, trackers in self.pattern_trackers:
+            for tracker in trackers:
+                if tracker.max_keys == max_keys:
+                    reusable.setdefault(self.tracker_keys[id(tracker)], []).append(tracker)
+        return reusable
+
+    def observe(self, event):
+        """Record an event and return the compiled patterns it completed.
+
+        Only trackers interested in the event's type are touched.
+        """
+        trackers = self.trackers_by_type.get(event['event_type'])
+        if not trackers:
+            return frozenset()
+        now = event_time(event)
+        fired = {id(tracker) for tracker in trackers if tracker.observe(event, now)}
+        if not fired:
+            return frozenset()
+        completed = set()
+        for tracker_id in fired:
+            compiled, pattern_trackers = self.patterns_by_tracker[tracker_id]
+            if all(id(tracker) in fired for tracker in pattern_trackers):
+                completed.add(compiled)
+        return frozenset(completed)
+
+    def tracked_keys(self):
+        """Total number of keys currently holding sequence state."""
+        return sum(len(tracker.states) for _, trackers in self.pattern_trackers for tracker in trackers)
@@ -0,0 +1,751 @@
+"""Detection sharded across worker processes by entity key.
+
+The GIL keeps ``DetectionEngine`` on one core. ``ShardedEngine`` partitions
+every batch by ``user_id`` or source IP across ``shards`` worker processes.
+Each shard owns the sequence, baseline and counter state of its keys,
+scores its events and builds the event dicts returned for them. The
+coordinator only routes, puts the shards' results back in arrival order and
+updates the global fracture score, alerts and rollups with array
+arithmetic. Counters are merged from the shards' Space-Saving summaries when
+a snapshot is taken.
+
+Routing is vectorized: the key column is hashed once per distinct key and
+the batch is split into per-shard index arrays with one stable argsort.
+Each batch is encoded as NumPy columns once; a shard gets its rows of each
+column as raw bytes over its pipe, with only columns of mixed types
+pickled, and sends back arrays of scores and pattern indexes with its
+events. A shard sees its events in arrival order, so per-key sequences
+fire exactly as in ``DetectionEngine``.
+
+Stateful conditions keyed on another field than the shard key (a source-IP
+sequence when sharding by user, or baselines when sharding by IP) are split
+off into a condition group per key field. Before a batch is processed its
+events are also routed by each such field; the shard owning the key tracks
+that field's groups and reports the events they fired on, and those hits go
+to the shard processing each event, which fires a pattern once all of its
+groups did.
+"""
+
+import functools
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+from skyfracture.baselines import BaselineEngine
+from skyfracture.engine import (
+    ALERT_THRESHOLD,
+    COMPONENTS,
+    EngineSnapshot,
+    check_components,
+    processed_event,
+    score_event,
+    stateful_matches,
+)
+from skyfracture.entities import MAX_ENTITIES, EntityScores
+from skyfracture.matching import compile_patterns
+from skyfracture.metrics import EngineMetrics
+from skyfracture.network import ConditionNetwork
+from skyfracture.rollups import MultiResolutionRollup
+from skyfracture.sequences import SequenceEngine, sequence_key_field
+from skyfracture.store import SCORE_DTYPE, EventStore, RingBuffer
+from skyfracture.topk import SpaceSaving
+
+SHARD_KEYS = ("user_id", "ip_address")
+COUNTER_FIELDS = {
+    "events_by_user": "user_id",
+    "events_by_type": "event_type",
+    "events_by_location": "location",
+    "events_by_ip": "ip_address",
+}
+
+
+def shard_index(key, shards):
+    """Stable shard number of an entity key."""
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def shard_indexes(keys, shards):
+    """``shard_index()`` of every key in a column, hashing each distinct key once."""
+    unique, inverse = np.unique(np.array(keys, dtype=str), return_inverse=True)
+    hashes = np.fromiter((zlib.crc32(key.encode()) for key in unique.tolist()), dtype=np.int64, count=len(unique))
+    return (hashes % shards)[inverse]
+
+
+def is_shard_local(compiled, shard_key):
+    """Whether a pattern's stateful conditions only need one shard's events."""
+    if compiled.baseline_conditions and shard_key != "user_id":
+        return False
+    return all(sequence_key_field(cond) == shard_key for cond in compiled.sequence_conditions)
+
+
+# Scores per closed-form block of fracture_series(); 0.7**-64 is about 8e9
+FRACTURE_BLOCK = 64
+
+
+def fracture_series(scores, current):
+    """The fracture score (``0.7 * previous + 0.3 * score``) after each score.
+
+    Computed blockwise in closed form: the i-th score of a block leaves
+    ``0.7**i * (start + 0.3 * sum(score_j * 0.7**-j for j <= i))``, with
+    blocks short enough for ``0.7**-j`` to keep full precision.
+    """
+    fracture = np.empty(len(scores), dtype=np.float64)
+    for start in range(0, len(scores), FRACTURE_BLOCK):
+        block = scores[start:start + FRACTURE_BLOCK]
+        powers = 0.7 ** np.arange(1, len(block) + 1)
+        fracture[start:start + len(block)] = powers * (current + np.cumsum(0.3 * block / powers))
+        current = fracture[start + len(block) - 1]
+    return fracture
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# NumPy dtype of a column whose present values all have one of these types;
+# datetimes only when naive, as NumPy drops time zones
+COLUMN_DTYPES = {str: str, int: np.int64, float: np.float64, bool: np.bool_, datetime: "datetime64[us]"}
+MISSING_FILL = {str: "", int: 0, float: 0.0, bool: False, datetime: EPOCH}
+
+
+def _encode_column(events, field):
+    missing = None
+    try:
+        values = list(map(itemgetter(field), events))
+    except KeyError:
+        values = [event.get(field) for event in events]
+        missing = np.fromiter((field not in event for event in events), dtype=bool, count=len(events))
+    kinds = set(map(type, values))
+    if missing is not None and values.count(None) == missing.sum():
+        # Every None stands for an absent field
+        kinds.discard(type(None))
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind in COLUMN_DTYPES and not (
+                kind is datetime and any(value.tzinfo is not None for value in values if value is not None)):
+            if missing is not None:
+                fill = MISSING_FILL[kind]
+                values = [fill if value is None else value for value in values]
+            if kind is datetime:
+                # Much faster than NumPy's own conversion of datetime objects
+                micros = np.fromiter(((value - EPOCH) // MICROSECOND for value in values), dtype=np.int64,
+                                     count=len(values))
+                return micros.view(COLUMN_DTYPES[kind]), missing
+            try:
+                return np.array(values, dtype=COLUMN_DTYPES[kind]), missing
+            except OverflowError:
+                pass
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column, missing
+
+
+def encode_batch(events):
+    """Columnar form of raw events: ``(fields, columns, missing)``.
+
+    Every column is a NumPy array: str, int64, float64, bool or
+    datetime64 when the field's values share that type, else object.
+    ``missing`` holds, per column, None or a boolean mask of the events
+    without the field.
+    """
+    # Fields in the order events list them, which decoded events keep
+    fields = list(dict.fromkeys(chain.from_iterable(events)))
+    columns = []
+    missing = []
+    for field in fields:
+        column, mask = _encode_column(events, field)
+        columns.append(column)
+        missing.append(mask)
+    return tuple(fields), columns, missing
+
+
+def decode_batch(fields, columns, missing=None):
+    """Rebuild raw event dicts from ``encode_batch()`` output."""
+    events = [dict(zip(fields, row)) for row in zip(*(column.tolist() for column in columns))]
+    for field, mask in zip(fields, missing or ()):
+        if mask is not None:
+            for i in np.flatnonzero(mask).tolist():
+                del events[i][field]
+    return events
+
+
+def send_columns(conn, message, columns, missing):
+    """Send ``message``, then every column and mask as raw array bytes.
+
+    ``message`` is extended with the columns' layout so ``recv_columns()``
+    can rebuild them; only object columns are pickled.
+    """
+    layout = [(None if column.dtype == object else column.dtype.str, mask is not None)
+              for column, mask in zip(columns, missing)]
+    conn.send(message + (layout,))
+    for column, mask in zip(columns, missing):
+        if column.dtype == object:
+            conn.send(column.tolist())
+        else:
+            conn.send_bytes(np.ascontiguousarray(column).view(np.uint8))
+        if mask is not None:
+            conn.send_bytes(np.ascontiguousarray(mask))
+
+
+def recv_columns(conn, layout):
+    """Receive the columns and masks ``send_columns()`` sent with ``layout``."""
+    columns = []
+    missing = []
+    for dtype, masked in layout:
+        if dtype is None:
+            values = conn.recv()
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        else:
+            column = np.frombuffer(conn.recv_bytes(), dtype=dtype)
+        columns.append(column)
+        missing.append(np.frombuffer(conn.recv_bytes(), dtype=bool) if masked else None)
+    return columns, missing
+
+
+def _pack_definitions(packs):
+    # Compiled patterns are rebuilt on the other side rather than pickled
+    return [{key: value for key, value in pack.items() if key != "compiled_patterns"} for pack in packs]
+
+
+def _compile_packs(definitions):
+    packs = []
+    for definition in definitions:
+        pack = dict(definition)
+        pack["compiled_patterns"] = compile_patterns(pack.get("patterns", []))
+        packs.append(pack)
+    return packs
+
+
+class _ConditionGroup:
+    """The stateful conditions of a pattern that are keyed on one field.
+
+    Stands in for the compiled pattern in a ``SequenceEngine`` and a
+    ``BaselineEngine``, so that they track only these conditions.
+    """
+
+    __slots__ = ("index", "sequence_conditions", "baseline_conditions")
+
+    def __init__(self, index, sequence_conditions, baseline_conditions):
+        self.index = index
+        self.sequence_conditions = sequence_conditions
+        self.baseline_conditions = baseline_conditions
+
+
+def condition_groups(packs, shard_key):
+    """Split the stateful conditions of patterns that are not shard-local.
+
+    Returns ``(groups, fields)``: per key field, pack dicts whose
+    ``compiled_patterns`` are the ``_ConditionGroup``s keyed on it, and per
+    pattern index the fields its groups are keyed on. Baselines are keyed
+    on ``user_id``.
+    """
+    groups = {}
+    fields = {}
+    index = 0
+    for pack in packs:
+        by_field = {}
+        for compiled in pack.get("compiled_patterns", []):
+            if not is_shard_local(compiled, shard_key):
+                for field in SHARD_KEYS:
+                    sequence = tuple(cond for cond in compiled.sequence_conditions
+                                     if sequence_key_field(cond) == field)
+                    baseline = compiled.baseline_conditions if field == "user_id" else ()
+                    if sequence or baseline:
+                        by_field.setdefault(field, []).append(_ConditionGroup(index, sequence, baseline))
+                        fields[index] = fields.get(index, ()) + (field,)
+            index += 1
+        for field, field_groups in by_field.items():
+            groups.setdefault(field, []).append({"tuning": pack.get("tuning"), "compiled_patterns": field_groups})
+    return groups, fields
+
+
+class _GroupTracker:
+    """Sequence and baseline state of the condition groups keyed on one field."""
+
+    def __init__(self, packs, half_life_days=None, previous=None):
+        self.sequence_engine = SequenceEngine(
+            packs, previous=None if previous is None else previous.sequence_engine)
+        self.baseline_engine = BaselineEngine(
+            packs, half_life_days, None if previous is None else previous.baseline_engine.store)
+
+    def observe(self, raw):
+        """Map the pattern indexes of the groups an event completed to their
+        baseline deviation, or None without baseline conditions."""
+        sequence_hits = self.sequence_engine.observe(raw)
+        baseline_hits = self.baseline_engine.observe(raw)
+        if not sequence_hits and not baseline_hits:
+            return {}
+        return {group.index: baseline_hits.get(group) for group in stateful_matches(sequence_hits, baseline_hits)}
+
+
+# Condition group hits of a batch: event positions, pattern indexes and deviations
+NO_GROUP_HITS = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64))
+
+
+class _Shard:
+    """Detection state for the keys routed to one worker process."""
+
+    def __init__(self, shard_key, counter_capacity, baseline_half_life_days, count=True):
+        self.shard_key = shard_key
+        self.count = count
+        self.counter_capacity = counter_capacity
+        self.baseline_half_life_days = baseline_half_life_days
+        self.packs = []
+        self.patterns = []
+        self.network = ConditionNetwork(self.patterns)
+        self.pattern_index = {}
+        self.group_fields = {}
+        self.metrics = EngineMetrics()
+        self.reset()
+
+    def _is_local(self, compiled):
+        return is_shard_local(compiled, self.shard_key)
+
+    def _load_groups(self, previous):
+        groups, self.group_fields = condition_groups(self.packs, self.shard_key)
+        self.groups = {
+            field: _GroupTracker(packs, self.baseline_half_life_days, previous.get(field))
+            for field, packs in groups.items()
+        }
+
+    def load(self, definitions):
+        self.packs = _compile_packs(definitions)
+        self.patterns = [compiled for pack in self.packs for compiled in pack["compiled_patterns"]]
+        self.network = ConditionNetwork(self.patterns)
+        self.pattern_index = {id(compiled.pattern): i for i, compiled in enumerate(self.patterns)}
+        self.metrics.patterns.set_patterns([compiled.name for compiled in self.patterns])
+        # Sequence and baseline state of unchanged conditions carries over
+        self.sequence_engine = SequenceEngine(self.packs, include=self._is_local, previous=self.sequence_engine)
+        self.baseline_engine = BaselineEngine(self.packs, self.baseline_half_life_days,
+                                              self.baseline_engine.store, include=self._is_local)
+        self._load_groups(self.groups)
+
+    def reset(self):
+        self.counters = {name: SpaceSaving(self.counter_capacity) for name in COUNTER_FIELDS}
+        self.sequence_engine = SequenceEngine(self.packs, include=self._is_local)
+        self.baseline_engine = BaselineEngine(self.packs, self.baseline_half_life_days, include=self._is_local)
+        self._load_groups({})
+        self.metrics.clear()
+
+    def observe(self, events, field):
+        """Track the condition groups keyed on ``field`` over events routed by it.
+
+        Returns the hits as the positions, pattern indexes and baseline
+        deviations (NaN for none) of ``NO_GROUP_HITS``.
+        """
+        tracker = self.groups[field]
+        positions = []
+        indexes = []
+        deviations = []
+        for i, raw in enumerate(events):
+            for index, deviation in tracker.observe(raw).items():
+                positions.append(i)
+                indexes.append(index)
+                deviations.append(np.nan if deviation is None else deviation)
+        return (np.array(positions, dtype=np.int64), np.array(indexes, dtype=np.int32),
+                np.array(deviations, dtype=np.float64))
+
+    def _group_matches(self, stateful_hits, baseline_hits, fired, remote):
+        # A pattern split into condition groups fires once every group did
+        stateful_hits = set(stateful_hits)
+        baseline_hits = dict(baseline_hits)
+        for index in fired.keys() | remote.keys():
+            parts = [fired if field == self.shard_key else remote for field in self.group_fields[index]]
+            if all(index in part for part in parts):
+                compiled = self.patterns[index]
+                stateful_hits.add(compiled)
+                deviations = [part[index] for part in parts if part[index] is not None]
+                if deviations:
+                    baseline_hits[compiled] = max(deviations)
+        return stateful_hits, baseline_hits
+
+    def process(self, events, event_ids, remote_hits=NO_GROUP_HITS, profile=False):
+        """Score a batch and build the event dicts returned for it.
+
+        Returns arrays of scores and first-match pattern indexes (-1 for
+        none), and the events. ``remote_hits`` are the condition groups
+        other shards saw fire on these events, as ``observe()`` returns
+        them. With ``profile``, ingest and match stages and pattern
+        evaluations are timed.
+        """
+        scores = np.empty(len(events), dtype=np.float64)
+        matched = np.full(len(events), -1, dtype=np.int32)
+        processed = []
+        remote = {}
+        for i, index, deviation in zip(*(hits.tolist() for hits in remote_hits)):
+            remote.setdefault(i, {})[index] = None if deviation != deviation else deviation
+        own = self.groups.get(self.shard_key)
+        counters = [(self.counters[name], field) for name, field in COUNTER_FIELDS.items()] if self.count else []
+        metrics = self.metrics if profile else None
+        clock = time.perf_counter
+        for i, (raw, event_id) in enumerate(zip(events, event_ids.tolist())):
+            if metrics is not None:
+                t0 = clock()
+            for counter, field in counters:
+                counter.add(raw[field])
+            sequence_hits = self.sequence_engine.observe(raw)
+            baseline_hits = self.baseline_engine.observe(raw)
+            stateful_hits = stateful_matches(sequence_hits, baseline_hits)
+            fired = own.observe(raw) if own is not None else None
+            if fired or i in remote:
+                stateful_hits, baseline_hits = self._group_matches(stateful_hits, baseline_hits, fired or {},
+                                                                   remote.get(i, {}))
+            if metrics is None:
+                score, pattern, matches = score_event(raw, self.network, stateful_hits, baseline_hits)
+            else:
+                t1 = clock()
+                score, pattern, matches = score_event(raw, self.network, stateful_hits, baseline_hits,
+                                                      metrics.patterns)
+            scores[i] = score
+            if pattern:
+                matched[i] = self.pattern_index[id(pattern)]
+            processed.append(processed_event(raw, event_id, score, pattern, matches))
+            if metrics is not None:
+                metrics.observe("ingest", t1 - t0)
+                metrics.observe("match", clock() - t1)
+        return scores, matched, processed
+
+    def counter_states(self):
+        return {name: counter.to_state() for name, counter in self.counters.items()}
+
+
+def _run_shard(conn, shard_key, counter_capacity, baseline_half_life_days, count):
+    shard = _Shard(shard_key, counter_capacity, baseline_half_life_days, count)
+    while True:
+        command, *args = conn.recv()
+        if command == "process":
+            fields, event_ids, remote_hits, profile, layout = args
+            columns, missing = recv_columns(conn, layout)
+            conn.send(shard.process(decode_batch(fields, columns, missing), event_ids, remote_hits, profile))
+        elif command == "observe":
+            fields, field, layout = args
+            columns, missing = recv_columns(conn, layout)
+            conn.send(shard.observe(decode_batch(fields, columns, missing), field))
+        elif command == "load":
+            shard.load(*args)
+            conn.send(None)
+        elif command == "reset":
+            shard.reset()
+            conn.send(None)
+        elif command == "counters":
+            conn.send(shard.counter_states())
+        elif command == "metrics":
+            conn.send(shard.metrics.to_state())
+        elif command == "close":
+            break
+    conn.close()
+
+
+class ShardedEngine:
+    """``DetectionEngine`` counterpart running detection in worker processes.
+
+    It exposes the same ``load_packs``, ``reset``, ``process_batch``,
+    ``process_event`` and ``snapshot`` methods. ``shards`` defaults to the
+    CPU count. Shards match events and build the returned event dicts in
+    parallel; the coordinator's serial share is encoding the batch,
+    unpickling the shards' events and array updates of the fracture score,
+    alerts and rollups (see the ``sharded_batch`` benchmark). Call
+    ``close()`` (or use it as a context manager) to stop the workers.
+
+    With ``metrics.enabled``, shards time the ingest and match stages and
+    pattern evaluations; the coordinator's reordering and updates, alerts
+    included, are reported as the ``score`` stage. ``components`` is as for
+    ``DetectionEngine``; without ``counters`` the shards count nothing.
+    """
+
+    def __init__(self, shards=None, shard_key="user_id", max_alerts=10_000, max_scores=100_000,
+                 snapshot_events=100, snapshot_alerts=50, snapshot_scores=10_000, event_log=None,
+                 counter_capacity=1000, snapshot_top=50, baseline_half_life_days=None, metrics=False,
+                 entity_half_life_seconds=3600.0, max_entities=MAX_ENTITIES, components=COMPONENTS):
+        self.components = check_components(components)
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"shard_key must be one of {SHARD_KEYS}, not {shard_key!r}")
+        self.shard_count = shards or os.cpu_count() or 1
+        self.shard_key = shard_key
+        self.snapshot_events = snapshot_events
+        self.snapshot_alerts = snapshot_alerts
+        self.snapshot_scores = snapshot_scores
+        self.counter_capacity = counter_capacity
+        self.snapshot_top = snapshot_top
+        self.baseline_half_life_days = baseline_half_life_days
+        self.event_log = event_log
+        self.lock = threading.Lock()
+        self.metrics = EngineMetrics(enabled=metrics)
+        self.packs = []
+        self.patterns = []
+        self.remote_fields = {}
+        # Only the rows a snapshot shows are kept for recent events
+        self.events = EventStore(snapshot_events)
+        self.alerts = EventStore(max_alerts)
+        self.fracture_scores = RingBuffer(SCORE_DTYPE, max_scores)
+        self.rollups = MultiResolutionRollup()
+        self.entity_scores = EntityScores(half_life_seconds=entity_half_life_seconds, max_entities=max_entities)
+        self.version = 0
+        self.alert_version = 0
+        self._snapshots = {}
+
+        # Spawned rather than forked: the dashboard process runs threads
+        context = multiprocessing.get_context("spawn")
+        self._connections = []
+        self._processes = []
+        for i in range(self.shard_count):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_run_shard,
+                args=(child, shard_key, counter_capacity, baseline_half_life_days, "counters" in self.components),
+                name=f"skyfracture-shard-{i}", daemon=True,
+            )
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+        self.reset()
+
+    def _broadcast(self, *message):
+        for conn in self._connections:
+            conn.send(message)
+        return [conn.recv() for conn in self._connections]
+
+    def load_packs(self, packs):
+        """Swap in the compiled patterns of a new set of detection packs."""
+        patterns = []
+        for pack in packs:
+            patterns.extend(pack.get("compiled_patterns", []))
+        # Event types each field keyed on elsewhere than the shard key needs, or None for every event
+        remote_fields = {}
+        for field, field_packs in condition_groups(packs, self.shard_key)[0].items():
+            if field != self.shard_key:
+                baselines = any(group.baseline_conditions
+                                for pack in field_packs for group in pack["compiled_patterns"])
+                remote_fields[field] = None if baselines else sorted(SequenceEngine(field_packs).trackers_by_type)
+        with self.lock:
+            self._broadcast("load", _pack_definitions(packs))
+            self.packs = packs
+            self.patterns = patterns
+            self.remote_fields = remote_fields
+            self.version += 1
+        return patterns
+
+    def reset(self):
+        """Clear all events, alerts, counters and sequence state."""
+        with self.lock:
+            self._broadcast("reset")
+            self.events.clear()
+            self.alerts.clear()
+            self.fracture_scores.clear()
+            self.rollups.clear()
+            self.entity_scores.clear()
+            self.current_fracture_score = 0.0
+            self.total_events = 0
+            self.total_alerts = 0
+            self.alert_by_pattern = SpaceSaving(self.counter_capacity)
+            self.last_update = datetime.now()
+            self.metrics.clear()
+            self.version += 1
+            self.alert_version += 1
+
+    def _route(self, keys):
+        # Shard of every event, the batch positions of each shard's events in
+        # arrival order, and every event's position within its shard's part
+        shards = shard_indexes(keys, self.shard_count)
+        order = np.argsort(shards, kind="stable")
+        counts = np.bincount(shards, minlength=self.shard_count)
+        starts = np.cumsum(counts) - counts
+        rank = np.empty(len(keys), dtype=np.int64)
+        rank[order] = np.arange(len(keys)) - np.repeat(starts, counts)
+        return shards, np.split(order, starts[1:]), rank
+
+    @staticmethod
+    def _send_rows(conn, message, columns, missing, rows):
+        send_columns(conn, message, [column[rows] for column in columns],
+                     [None if mask is None else mask[rows] for mask in missing])
+
+    def _remote_hits(self, fields, columns, missing, shards, rank):
+        # Condition groups keyed on other fields, tracked by the shards owning
+        # those keys, then sorted out by the shard of each event
+        found = []
+        for field, event_types in self.remote_fields.items():
+            if event_types is None:
+                rows = np.arange(len(shards))
+            else:
+                rows = np.flatnonzero(np.isin(columns[fields.index("event_type")], event_types))
+            if not len(rows):
+                continue
+            _, positions, _ = self._route(columns[fields.index(field)][rows])
+            busy = []
+            for conn, shard_rows in zip(self._connections, positions):
+                if len(shard_rows):
+                    shard_rows = rows[shard_rows]
+                    self._send_rows(conn, ("observe", fields, field), columns, missing, shard_rows)
+                    busy.append((conn, shard_rows))
+            for conn, shard_rows in busy:
+                local, indexes, deviations = conn.recv()
+                found.append((shard_rows[local], indexes, deviations))
+        remote_hits = [NO_GROUP_HITS] * self.shard_count
+        if not found:
+            return remote_hits
+        events, indexes, deviations = (np.concatenate(hits) for hits in zip(*found))
+        target = shards[events]
+        order = np.argsort(target, kind="stable")
+        splits = np.cumsum(np.bincount(target, minlength=self.shard_count))[:-1]
+        parts = zip(*(np.split(hits[order], splits) for hits in (rank[events], indexes, deviations)))
+        for shard, hits in enumerate(parts):
+            remote_hits[shard] = hits
+        return remote_hits
+
+    def process_batch(self, raw_events):
+        """Run detection for a batch of raw events across the shards."""
+        if not raw_events:
+            return []
+        with self.lock:
+            fields, columns, missing = encode_batch(raw_events)
+            shards, positions, rank = self._route(columns[fields.index(self.shard_key)])
+            remote_hits = self._remote_hits(fields, columns, missing, shards, rank)
+
+            # Every shard works on its part while the others do too
+            profile = self.metrics.enabled
+            busy = []
+            for conn, shard_positions, hits in zip(self._connections, positions, remote_hits):
+                if len(shard_positions):
+                    event_ids = shard_positions + (self.total_events + 1)
+                    self._send_rows(conn, ("process", fields, event_ids, hits, profile), columns, missing,
+                                    shard_positions)
+                    busy.append((conn, shard_positions))
+            scores = np.empty(len(raw_events), dtype=np.float64)
+            matched = np.empty(len(raw_events), dtype=np.int32)
+            shard_events = []
+            for conn, shard_positions in busy:
+                shard_scores, shard_matched, processed = conn.recv()
+                scores[shard_positions] = shard_scores
+                matched[shard_positions] = shard_matched
+                shard_events.extend(processed)
+            started = time.perf_counter()
+            # Where each event sits among the shards' concatenated events
+            source = np.empty(len(raw_events), dtype=np.int64)
+            source[np.concatenate([shard_positions for _, shard_positions in busy])] = np.arange(len(raw_events))
+            events = list(itemgetter(*source.tolist())(shard_events)) if len(source) > 1 else shard_events
+            self._update(raw_events, columns[fields.index("timestamp")], events, scores, matched)
+            if profile:
+                self.metrics.observe("score", (time.perf_counter() - started) / len(events), len(events))
+            return events
+
+    def process_event(self, raw):
+        return self.process_batch([raw])[0]
+
+    def _update(self, raw_events, timestamps, events, scores, matched):
+        fracture = fracture_series(scores, self.current_fracture_score)
+        self.current_fracture_score = float(fracture[-1])
+        components = self.components
+        alerted = np.flatnonzero(scores > ALERT_THRESHOLD)
+        self.total_alerts += len(alerted)
+        self.alert_version += len(alerted)
+        if "alerts" in components:
+            for i in alerted.tolist():
+                self.alerts.append(events[i])
+        if "counters" in components:
+            alerted_patterns = matched[alerted]
+            indexes, counts = np.unique(alerted_patterns[alerted_patterns >= 0], return_counts=True)
+            for index, count in zip(indexes.tolist(), counts.tolist()):
+                self.alert_by_pattern.add(self.patterns[index].name, count)
+        if self.event_log is not None:
+            for event, score in zip(events, fracture.tolist()):
+                self.event_log.append(event, score)
+        self.total_events += len(events)
+
+        if components & {"scores", "rollups", "entities"}:
+            if timestamps.dtype.kind != "M":
+                timestamps = np.array([raw["timestamp"] for raw in raw_events], dtype="datetime64[us]")
+            seconds = timestamps.astype(np.int64) / 1e6
+            if "scores" in components:
+                rows = np.empty(len(events), dtype=SCORE_DTYPE)
+                rows["timestamp"] = timestamps
+                rows["score"] = fracture
+                self.fracture_scores.extend(rows)
+            if "rollups" in components:
+                self.rollups.add_batch(seconds, fracture, events)
+            if "entities" in components:
+                self.entity_scores.update(raw_events, seconds, scores)
+        if "events" in components:
+            for event in events[-self.snapshot_events:]:
+                self.events.append(event)
+        self.last_update = datetime.now()
+        self.version += 1
+
+    def collect_metrics(self):
+        """Return the coordinator's ``EngineMetrics`` merged with every shard's."""
+        with self.lock:
+            metrics = self.metrics.copy()
+            for state in self._broadcast("metrics"):
+                metrics.merge_state(state)
+            return metrics
+
+    def _merged_counters(self):
+        states = self._broadcast("counters")
+        return {
+            name: functools.reduce(SpaceSaving.merge, (SpaceSaving.from_state(state[name]) for state in states))
+            for name in COUNTER_FIELDS
+        }
+
+    def snapshot(self, rollup_window=None):
+        """Return a consistent, read-only copy of the current state.
+
+        Same as ``DetectionEngine.snapshot()``; counters are merged from
+        every shard, so snapshots are cached until the version changes.
+        """
+        with self.lock:
+            cached = self._snapshots.get(rollup_window)
+            if cached is not None and cached.version == self.version and cached.alert_version == self.alert_version:
+                return cached
+            counters = self._merged_counters()
+            events = self.events.latest(self.snapshot_events)
+            alerts = self.alerts.latest(self.snapshot_alerts)
+            events.rows = events.rows.copy()
+            alerts.rows = alerts.rows.copy()
+            snapshot = EngineSnapshot(
+                events=events,
+                alerts=alerts,
+                fracture_scores=self.fracture_scores.latest(self.snapshot_scores).copy(),
+                current_fracture_score=self.current_fracture_score,
+                total_events=self.total_events,
+                total_alerts=self.total_alerts,
+                alert_by_pattern=self.alert_by_pattern.top_counts(self.snapshot_top),
+                events_by_user=counters["events_by_user"].top_counts(self.snapshot_top),
+                events_by_type=counters["events_by_type"].top_counts(self.snapshot_top),
+                events_by_location=counters["events_by_location"].top_counts(self.snapshot_top),
+                events_by_ip=counters["events_by_ip"].top_counts(self.snapshot_top),
+                entity_scores=self.entity_scores.top_by_field(self.snapshot_top),
+                pattern_count=len(self.patterns),
+                last_update=self.last_update,
+                rollup=None if rollup_window is None else self.rollups.window(rollup_window),
+                version=self.version,
+                alert_version=self.alert_version,
+            )
+            self._snapshots[rollup_window] = snapshot
+            return snapshot
+
+    def close(self):
+        """Stop the shard processes."""
+        with self.lock:
+            for conn in self._connections:
+                try:
+                    conn.send(("close",))
+                except (BrokenPipeError, OSError):
+                    pass
+                conn.close()
+            for process in self._processes:
+                process.join(timeout=5)
+            self._connections = []
+            self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,43 @@
+"""Simulated security events for demos and testing."""
+
+import random
+from datetime import datetime
+
+from skyfracture.iprange import int_to_ip
+
+# Constants for simulation
+USERS = [
+    {"user_id": "alice", "normal_location": "New York", "role": "user"},
+    {"user_id": "bob", "normal_location": "Chicago", "role": "user"},
+    {"user_id": "charlie", "normal_location": "San Francisco", "role": "admin"},
+    {"user_id": "dave", "normal_location": "Boston", "role": "user"},
+    {"user_id": "eve", "normal_location": "London", "role": "executive"},
+]
+
+LOCATIONS = ["New York", "Chicago", "San Francisco", "Boston", "London", "Beijing", "Tokyo", "Sydney"]
+EVENT_TYPES = [
+    "successful_login",
+    "failed_login",
+    "admin_access",
+    "file_access",
+    "vpn_connection",
+    "database_query",
+    "config_change",
+    "data_export"
+]
+
+
+def simulate_event():
+    """Return a random raw event, before any detection has run."""
+    user = random.choice(USERS)
+    ip_int = (10 << 24 | random.getrandbits(24)) if random.random() < 0.7 else (203 << 24 | random.getrandbits(24))
+    return {
+        "timestamp": datetime.now(),
+        "user_id": user["user_id"],
+        "event_type": random.choice(EVENT_TYPES),
+        "location": random.choice(LOCATIONS),
+        "ip_address": int_to_ip(ip_int),
+        "ip_int": ip_int,
+        "hour": random.randint(0, 23),
+        "role": user["role"],
+    }
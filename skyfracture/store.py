@@ -0,0 +1,240 @@
+"""Fixed-capacity columnar storage for recent events.
+
+``RingBuffer`` preallocates a NumPy structured array and mirrors every row
+at ``i`` and ``i + capacity``, so the latest N rows are always one
+contiguous slice: appends are O(1) and "latest N" is a zero-copy view.
+``EventStore`` layers dictionary encoding of the string fields on top, which
+keeps the footprint per event fixed and predictable. Vocabularies only need
+the values of the rows still in the ring, so once one passes
+``vocabulary_limit`` values it is rebuilt from those rows; memory stays
+bounded however many distinct users or locations stream through.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from skyfracture.batch import Vocabulary
+from skyfracture.iprange import int_to_ip, ip_to_int
+
+STRING_FIELDS = ("user_id", "event_type", "location", "role", "matched_pattern", "severity")
+
+EVENT_DTYPE = np.dtype([
+    ("event_id", np.int64),
+    ("timestamp", "datetime64[us]"),
+    ("user_id", np.int32),
+    ("event_type", np.int32),
+    ("location", np.int32),
+    ("ip_address", np.uint32),
+    ("hour", np.uint8),
+    ("role", np.int32),
+    ("score", np.float64),
+    ("matched_pattern", np.int32),
+    ("severity", np.int32),
+])
+
+SCORE_DTYPE = np.dtype([
+    ("timestamp", "datetime64[us]"),
+    ("score", np.float64),
+])
+
+
+def encode_event(event, code):
+    """Encode an event dict as an ``EVENT_DTYPE`` row tuple.
+
+    ``code(field, value)`` returns the dictionary code of a string value.
+    """
+    ip = event.get("ip_int")
+    if ip is None:
+        ip = ip_to_int(event["ip_address"])
+    return (
+        event["event_id"],
+        np.datetime64(event["timestamp"], "us"),
+        code("user_id", event["user_id"]),
+        code("event_type", event["event_type"]),
+        code("location", event["location"]),
+        ip,
+        event["hour"],
+        code("role", event["role"]),
+        event["score"],
+        code("matched_pattern", event.get("matched_pattern")),
+        code("severity", event.get("severity")),
+    )
+
+
+class RingBuffer:
+    """Preallocated ring of structured rows with contiguous latest-N views."""
+
+    def __init__(self, dtype, capacity):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=dtype)
+        self.head = 0  # Next write position in [0, capacity)
+        self.size = 0
+
+    def append(self, row):
+        head = self.head
+        self.data[head] = row
+        self.data[head + self.capacity] = row
+        self.head = head + 1 if head + 1 < self.capacity else 0
+        if self.size < self.capacity:
+            self.size += 1
+
+    def extend(self, rows):
+        """Append an array of rows with at most two slice writes."""
+        total = len(rows)
+        rows = rows[-self.capacity:]
+        n = len(rows)
+        if not n:
+            return
+        # Rows that would be overwritten within this call are skipped
+        head = (self.head + total - n) % self.capacity
+        first = min(n, self.capacity - head)
+        for offset in (0, self.capacity):
+            self.data[offset + head:offset + head + first] = rows[:first]
+            self.data[offset:offset + n - first] = rows[first:]
+        self.head = (head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def latest(self, n=None):
+        """Return a view of the latest ``n`` rows, oldest first."""
+        n = self.size if n is None else min(n, self.size)
+        end = self.head + self.capacity
+        return self.data[end - n:end]
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class EventTable:
+    """Rows of ``EVENT_DTYPE`` together with the vocabularies to decode them."""
+
+    def __init__(self, rows, vocabularies):
+        self.rows = rows
+        self.vocabularies = vocabularies
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _decode(self, field, code):
+        return None if code < 0 else self.vocabularies[field].values[code]
+
+    def raw_events(self):
+        """Decode rows into raw event dicts, oldest first, for re-detection."""
+        decode = self._decode
+        return [
+            {
+                "timestamp": row["timestamp"].astype(datetime),
+                "user_id": decode("user_id", row["user_id"]),
+                "event_type": decode("event_type", row["event_type"]),
+                "location": decode("location", row["location"]),
+                "ip_address": int_to_ip(row["ip_address"]),
+                "ip_int": int(row["ip_address"]),
+                "hour": int(row["hour"]),
+                "role": decode("role", row["role"]),
+            }
+            for row in self.rows
+        ]
+
+    def records(self, limit=None):
+        """Decode rows into event dicts, newest first."""
+        rows = self.rows[::-1] if limit is None else self.rows[::-1][:limit]
+        records = []
+        for row in rows:
+            record = {
+                "event_id": int(row["event_id"]),
+                "timestamp": row["timestamp"].astype(datetime),
+                "ip_address": int_to_ip(row["ip_address"]),
+                "hour": int(row["hour"]),
+                "score": float(row["score"]),
+            }
+            for field in STRING_FIELDS:
+                record[field] = self._decode(field, row[field])
+            records.append(record)
+        return records
+
+    def to_frame(self):
+        """Build a pandas DataFrame with categorical string columns."""
+        import pandas as pd
+
+        columns = {name: self.rows[name] for name in self.rows.dtype.names if name not in STRING_FIELDS}
+        for field in STRING_FIELDS:
+            categories = list(self.vocabularies[field].values)
+            columns[field] = pd.Categorical.from_codes(self.rows[field], categories=categories)
+        return pd.DataFrame(columns)
+
+
+class EventStore:
+    """Ring buffer of events with dictionary-encoded string fields.
+
+    A vocabulary holds at most ``vocabulary_limit`` values, or twice the
+    distinct values in the ring if that is more, before it is compacted.
+    """
+
+    def __init__(self, capacity, vocabulary_limit=100_000):
+        self.buffer = RingBuffer(EVENT_DTYPE, capacity)
+        self.vocabulary_limit = vocabulary_limit
+        self.vocabularies = {field: Vocabulary() for field in STRING_FIELDS}
+        self._compact_at = {field: vocabulary_limit for field in STRING_FIELDS}
+        self._compact = []
+
+    def _code(self, field, value):
+        if value is None:
+            return -1
+        code = self.vocabularies[field].code(value)
+        if code >= self._compact_at[field]:
+            self._compact.append(field)
+        return code
+
+    def append(self, event):
+        self.buffer.append(encode_event(event, self._code))
+        if self._compact:
+            for field in self._compact:
+                self._compact_vocabulary(field)
+            self._compact = []
+
+    def _compact_vocabulary(self, field):
+        """Re-encode ``field`` with only the values still in the ring.
+
+        A new ``Vocabulary`` replaces the old one, so tables already handed
+        out keep decoding with the vocabulary they were built with.
+        """
+        old = self.vocabularies[field]
+        data = self.buffer.data[field]
+        live = np.unique(self.buffer.latest()[field])
+        live = live[live >= 0]
+        remap = np.full(len(old) + 1, -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        # Rows outside the live range are stale; they map to -1 like missing values
+        data[:] = remap[np.where((data >= 0) & (data < len(old)), data, len(old))]
+        self.vocabularies = dict(self.vocabularies)
+        self.vocabularies[field] = Vocabulary(old.values[code] for code in live.tolist())
+        self._compact_at[field] = max(self.vocabulary_limit, 2 * len(live))
+
+    def latest(self, n=None):
+        """Zero-copy ``EventTable`` of the latest ``n`` events, oldest first."""
+        return EventTable(self.buffer.latest(n), self.vocabularies)
+
+    def clear(self):
+        """Drop all events and start the vocabularies over.
+
+        Fresh ``Vocabulary`` objects replace the old ones, so tables
+        already handed out still decode.
+        """
+        self.buffer.clear()
+        self.vocabularies = {field: Vocabulary() for field in STRING_FIELDS}
+        self._compact_at = {field: self.vocabulary_limit for field in STRING_FIELDS}
+        self._compact = []
+
+    def __len__(self):
+        return len(self.buffer)
+
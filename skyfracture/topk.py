@@ -0,0 +1,145 @@
+"""Bounded-memory heavy-hitter counting (Space-Saving).
+
+``SpaceSaving`` monitors at most ``capacity`` keys. While fewer distinct keys
+than that have been seen its counts are exact; after that, an unseen key
+replaces one of the keys with the smallest count and inherits that count as
+its error. Every reported count is an upper bound on the true count and
+overestimates it by at most ``total / capacity``.
+
+Keys are grouped into buckets by count so an increment and an eviction are
+both O(1). Summaries with the same capacity can be merged, e.g. to combine
+counts from several workers.
+"""
+
+import heapq
+import math
+
+
+class SpaceSaving:
+    """Top-K counter with a fixed memory budget of ``capacity`` keys."""
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.buckets = {}  # count -> set of keys with that count
+        self.min_count = 0
+        self.total = 0
+
+    @classmethod
+    def for_error(cls, epsilon):
+        """Create a counter whose counts overestimate by at most ``epsilon * total``."""
+        return cls(int(math.ceil(1.0 / epsilon)))
+
+    def _move(self, key, old, new):
+        if old:
+            bucket = self.buckets[old]
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[old]
+        self.buckets.setdefault(new, set()).add(key)
+
+    def _refresh_min(self, emptied, weight):
+        if emptied == self.min_count and emptied not in self.buckets:
+            # A unit increment moves the last minimum key to emptied + 1,
+            # which is then the smallest count; otherwise rescan the buckets
+            self.min_count = emptied + 1 if weight == 1 else min(self.buckets)
+
+    def add(self, key, weight=1):
+        self.total += weight
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + weight
+            self._move(key, count, count + weight)
+            self._refresh_min(count, weight)
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+            self._move(key, 0, weight)
+            if len(self.counts) == 1 or weight < self.min_count:
+                self.min_count = weight
+            return
+
+        # Replace a key with the minimum count; it becomes the new key's error
+        floor = self.min_count
+        victim = self.buckets[floor].pop()
+        if not self.buckets[floor]:
+            del self.buckets[floor]
+        del self.counts[victim]
+        del self.errors[victim]
+        self.counts[key] = floor + weight
+        self.errors[key] = floor
+        self.buckets.setdefault(floor + weight, set()).add(key)
+        self._refresh_min(floor, weight)
+
+    def top(self, n=None):
+        """Return ``(key, count, error)`` tuples, highest count first."""
+        items = self.counts.items()
+        ordered = heapq.nlargest(n, items, key=lambda item: item[1]) if n else \
+            sorted(items, key=lambda item: item[1], reverse=True)
+        return [(key, count, self.errors[key]) for key, count in ordered]
+
+    def top_counts(self, n=None):
+        """Return the top keys as a ``{key: count}`` dict, highest first."""
+        return {key: count for key, count, _ in self.top(n)}
+
+    def merge(self, other):
+        """Return a new summary combining this one with ``other``.
+
+        A key missing from a full summary may still have occurred there up
+        to that summary's minimum count, so that minimum is added to both its
+        count and error; counts stay upper bounds.
+        """
+        if other.capacity != self.capacity:
+            raise ValueError("Can only merge summaries with the same capacity")
+        self_floor = self.min_count if len(self.counts) >= self.capacity else 0
+        other_floor = other.min_count if len(other.counts) >= other.capacity else 0
+        combined = {}
+        for key in set(self.counts) | set(other.counts):
+            count = error = 0
+            for summary, floor in ((self, self_floor), (other, other_floor)):
+                if key in summary.counts:
+                    count += summary.counts[key]
+                    error += summary.errors[key]
+                else:
+                    count += floor
+                    error += floor
+            combined[key] = (count, error)
+
+        merged = SpaceSaving(self.capacity)
+        kept = heapq.nlargest(self.capacity, combined.items(), key=lambda item: item[1][0])
+        for key, (count, error) in kept:
+            merged.counts[key] = count
+            merged.errors[key] = error
+            merged.buckets.setdefault(count, set()).add(key)
+        merged.min_count = min(merged.buckets) if merged.buckets else 0
+        merged.total = self.total + other.total
+        return merged
+
+    def to_state(self):
+        """Plain-dict state, e.g. for sending between processes."""
+        return {"capacity": self.capacity, "total": self.total, "counts": dict(self.counts),
+                "errors": dict(self.errors)}
+
+    @classmethod
+    def from_state(cls, state):
+        summary = cls(state["capacity"])
+        summary.total = state["total"]
+        summary.counts = dict(state["counts"])
+        summary.errors = dict(state["errors"])
+        for key, count in summary.counts.items():
+            summary.buckets.setdefault(count, set()).add(key)
+        summary.min_count = min(summary.buckets) if summary.buckets else 0
+        return summary
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __getitem__(self, key):
+        return self.counts[key]
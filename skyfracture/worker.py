@@ -0,0 +1,130 @@
+"""Background ingestion decoupled from the dashboard rerun loop.
+
+A producer thread generates events at ``events_per_second`` into a bounded
+queue; a consumer thread drains it in batches of up to ``batch_size`` and
+hands each batch to the engine, then to the ``export`` pipeline if one is
+set. The dashboard only reads engine snapshots, so processing rate and
+render rate are independent.
+
+A batch the engine fails on is skipped and counted in ``errors``, with the
+exception kept in ``last_error`` and logged, so one malformed event cannot
+stop ingestion.
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from skyfracture.simulation import simulate_event
+
+logger = logging.getLogger(__name__)
+
+
+class IngestWorker:
+    """Producer/consumer pair feeding a ``DetectionEngine``."""
+
+    def __init__(self, engine, source=simulate_event, events_per_second=5.0, batch_size=256,
+                 queue_size=10_000):
+        self.engine = engine
+        self.source = source
+        self.events_per_second = events_per_second
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        # An ExportPipeline; its submit() never blocks the consumer
+        self.export = None
+        self.errors = 0
+        self.failed_events = 0
+        self.last_error = None
+        self.last_error_at = None
+        engine.metrics.register_gauge("queue_depth", self.queue.qsize, "Events waiting in the ingestion queue.")
+        engine.metrics.register_gauge("ingest_errors", lambda: self.errors, "Batches the engine failed to process.")
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._produce, name="skyfracture-producer", daemon=True),
+            threading.Thread(target=self._consume, name="skyfracture-consumer", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop both threads; one still busy after ``timeout`` stays tracked,
+        so ``running`` stays True and ``start()`` does not add a second."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+    def reset(self):
+        """Stop, discard queued events and reset the engine."""
+        self.stop()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.engine.reset()
+        self.errors = 0
+        self.failed_events = 0
+        self.last_error = None
+        self.last_error_at = None
+
+    def _produce(self):
+        credit = 0.0
+        last = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            credit = min(credit + (now - last) * self.events_per_second, self.batch_size)
+            last = now
+            due = int(credit)
+            if not due:
+                time.sleep(min(0.05, (1.0 - credit) / max(self.events_per_second, 1e-6)))
+                continue
+            credit -= due
+            for _ in range(due):
+                event = self.source()
+                # Block while the queue is full; that is the back-pressure
+                while not self._stop.is_set():
+                    try:
+                        self.queue.put(event, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+    def _consume(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self.queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                events = self.engine.process_batch(batch)
+            except Exception as e:
+                self._record_error(e, len(batch))
+                continue
+            export = self.export
+            if export is not None:
+                export.submit(events, self.engine.packs)
+
+    def _record_error(self, error, n_events):
+        self.errors += 1
+        self.failed_events += n_events
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.last_error_at = datetime.now()
+        logger.error("Error processing a batch of %d events: %s", n_events, self.last_error)
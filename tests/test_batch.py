@@ -0,0 +1,146 @@
+import random
+
+import numpy as np
+import pytest
+
+from skyfracture.batch import BatchMatcher, Vocabulary
+from skyfracture.engine import score_event
+from skyfracture.iprange import ip_to_int
+from skyfracture.matching import (
+    DEFAULT_SCORE_MODIFIER,
+    PatternIndex,
+    compile_patterns,
+    condition_value,
+    find_matching_pattern,
+    pattern_matches,
+)
+from skyfracture.network import ConditionNetwork, pattern_modifier
+from skyfracture.simulation import EVENT_TYPES, LOCATIONS
+
+ROLES = ["user", "admin", "executive"]
+RANGES = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "203.0.113.0/24"]
+ADDRESSES = ["10.1.2.3", "172.20.0.9", "192.168.1.1", "203.0.113.7", "8.8.8.8", "198.51.100.4"]
+STATEFUL_CONDITION = {"type": "event_sequence", "sequence": ["failed_login", "successful_login"], "max_minutes": 5}
+
+
+def _leaf(rng):
+    kind = rng.choice(["time_window", "geo_location", "ip_range", "role_check", "event_type"])
+    if kind == "time_window":
+        start = rng.randrange(0, 20)
+        return {"type": kind, "not_between": [f"{start:02d}:00", f"{rng.randrange(start, 24):02d}:00"]}
+    if kind == "geo_location":
+        return {"type": kind, "not_in_locations": rng.sample(LOCATIONS, rng.randrange(1, 5))}
+    if kind == "ip_range":
+        return {"type": kind, "not_in_ranges": rng.sample(RANGES, rng.randrange(1, 3))}
+    if kind == "role_check":
+        return {"type": kind, "roles": rng.sample(ROLES, rng.randrange(1, 3))}
+    return {"type": kind, "types": rng.sample(EVENT_TYPES, rng.randrange(1, 4))}
+
+
+def _compound(rng, depth):
+    children = [_compound(rng, depth - 1) if depth and rng.random() < 0.3 else _leaf(rng)
+                for _ in range(rng.randrange(1, 4))]
+    return {"type": "compound", "operator": rng.choice(["AND", "OR"]), "conditions": children}
+
+
+def _patterns(rng, n):
+    patterns = []
+    for i in range(n):
+        conditions = [_leaf(rng) for _ in range(rng.randrange(0, 3))]
+        if rng.random() < 0.5:
+            conditions.append(_compound(rng, 2))
+        if rng.random() < 0.1:
+            conditions.append(dict(STATEFUL_CONDITION))
+        pattern = {"name": f"p{i}", "conditions": conditions, "score_modifier": round(rng.uniform(0.1, 0.6), 2)}
+        if rng.random() < 0.3:
+            pattern["score_multiplier_per_condition"] = rng.choice([1.1, 1.5, 2.0])
+        patterns.append(pattern)
+    return patterns
+
+
+def _events(rng, n):
+    return [
+        {
+            "hour": rng.randrange(24),
+            "location": rng.choice(LOCATIONS + ["Nowhere"]),
+            "ip_address": rng.choice(ADDRESSES),
+            "event_type": rng.choice(EVENT_TYPES + ["unknown_type"]),
+            "role": rng.choice(ROLES + ["guest"]),
+        }
+        for _ in range(n)
+    ]
+
+
+def _reference_matches(event, compiled, stateful_hits):
+    """Matching patterns by ``pattern_matches()``, stateful ones through ``stateful_hits``."""
+    matches = []
+    for pattern in compiled:
+        stateless = {"conditions": [cond for cond in pattern.pattern["conditions"]
+                                    if cond["type"] != "event_sequence"]}
+        if pattern.stateful and pattern not in stateful_hits:
+            continue
+        if pattern_matches(event, stateless):
+            matches.append(pattern)
+    return matches
+
+
+def _reference_modifier(event, pattern):
+    matched = sum(condition_value(event, child) is True
+                  for cond in pattern["conditions"] if cond["type"] == "compound"
+                  for child in cond["conditions"])
+    return pattern_modifier(pattern, matched)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matchers_agree_with_reference(seed):
+    rng = random.Random(seed)
+    compiled = compile_patterns(_patterns(rng, 60))
+    events = _events(rng, 400)
+    stateful = [pattern for pattern in compiled if pattern.stateful]
+    hits = [frozenset(p for p in stateful if rng.random() < 0.5) for _ in events]
+
+    network = ConditionNetwork(compiled)
+    index = PatternIndex(compiled)
+    locations, event_types, roles = Vocabulary(), Vocabulary(), Vocabulary()
+    matcher = BatchMatcher(compiled, locations, event_types, roles)
+    positions = {pattern: i for i, pattern in enumerate(compiled)}
+    stateful_matrix = np.array([[pattern in event_hits for pattern in compiled] for event_hits in hits])
+    columns = (
+        [event["hour"] for event in events],
+        locations.encode(event["location"] for event in events),
+        [ip_to_int(event["ip_address"]) for event in events],
+        event_types.encode(event["event_type"] for event in events),
+        roles.encode(event["role"] for event in events),
+    )
+    result = matcher.evaluate(*columns, stateful_hits=stateful_matrix)
+    assert (matcher.match_matrix(*columns, stateful_hits=stateful_matrix) == result.match_matrix).all()
+
+    for i, (event, event_hits) in enumerate(zip(events, hits)):
+        expected = _reference_matches(event, compiled, event_hits)
+        first = expected[0].pattern if expected else None
+
+        assert find_matching_pattern(event, compiled, event_hits) is first
+        assert index.find(event, event_hits) is first
+        found = network.matches(event, event_hits)
+        assert [pattern for pattern, _ in found] == expected
+        for pattern, modifier in found:
+            assert modifier == pytest.approx(_reference_modifier(event, pattern.pattern))
+
+        assert result.match_matrix[i].tolist() == [pattern in expected for pattern in compiled]
+        assert result.first_match[i] == (positions[expected[0]] if expected else -1)
+        score, _, _ = score_event(event, network, event_hits)
+        assert result.scores[i] == pytest.approx(score)
+
+
+def test_unknown_codes_match_like_unmentioned_values():
+    compiled = compile_patterns([
+        {"name": "types", "conditions": [{"type": "event_type", "types": ["data_export"]}]},
+        {"name": "denied", "conditions": [{"type": "geo_location", "not_in_locations": ["Beijing"]}]},
+    ])
+    locations, event_types, roles = Vocabulary(), Vocabulary(), Vocabulary()
+    matcher = BatchMatcher(compiled, locations, event_types, roles)
+    result = matcher.evaluate([3], [locations.code("Atlantis")], [ip_to_int("8.8.8.8")],
+                              [event_types.code("brand_new_type")], [roles.code("user")])
+    assert result.match_matrix.tolist() == [[False, True]]
+    assert result.first_match.tolist() == [1]
+    assert result.scores[0] == pytest.approx(min(0.1 + DEFAULT_SCORE_MODIFIER, 1.0))
@@ -0,0 +1,108 @@
+import pytest
+
+from skyfracture.batch import BatchMatcher, Vocabulary
+from skyfracture.iprange import ip_to_int
+from skyfracture.matching import compile_patterns, find_matching_pattern, pattern_matches
+from skyfracture.network import ConditionNetwork, pattern_modifier
+
+PRIVATE = {"type": "ip_range", "not_in_ranges": ["10.0.0.0/8", "192.168.0.0/16"]}
+ADMIN = {"type": "role_check", "roles": ["admin"]}
+EXPORT = {"type": "event_type", "types": ["data_export"]}
+NIGHT = {"type": "time_window", "not_between": ["08:00", "18:00"]}
+
+
+def _event(hour=3, role="user", event_type="file_access", ip_address="8.8.8.8", location="London"):
+    return {"hour": hour, "role": role, "event_type": event_type, "ip_address": ip_address,
+            "location": location}
+
+
+def _batch_result(compiled, events):
+    locations, event_types, roles = Vocabulary(), Vocabulary(), Vocabulary()
+    matcher = BatchMatcher(compiled, locations, event_types, roles)
+    return matcher.evaluate(
+        [event["hour"] for event in events],
+        locations.encode(event["location"] for event in events),
+        [ip_to_int(event["ip_address"]) for event in events],
+        event_types.encode(event["event_type"] for event in events),
+        roles.encode(event["role"] for event in events),
+    )
+
+
+def _network_matches(compiled, event):
+    return [pattern.name for pattern, _ in ConditionNetwork(compiled).matches(event)]
+
+
+def test_nested_compound():
+    # NIGHT and (ADMIN or (EXPORT and outside the private ranges))
+    pattern = {"name": "nested", "conditions": [{"type": "compound", "operator": "AND", "conditions": [
+        NIGHT,
+        {"type": "compound", "operator": "OR", "conditions": [
+            ADMIN,
+            {"type": "compound", "operator": "AND", "conditions": [EXPORT, PRIVATE]},
+        ]},
+    ]}]}
+    compiled = compile_patterns([pattern])
+    cases = [
+        (_event(role="admin"), True),
+        (_event(event_type="data_export"), True),
+        (_event(event_type="data_export", ip_address="10.1.1.1"), False),
+        (_event(), False),
+        (_event(hour=12, role="admin"), False),
+    ]
+    events = [event for event, _ in cases]
+    result = _batch_result(compiled, events)
+    for i, (event, expected) in enumerate(cases):
+        assert pattern_matches(event, pattern) is expected
+        assert (find_matching_pattern(event, compiled) is pattern) is expected
+        assert (_network_matches(compiled, event) == ["nested"]) is expected
+        assert bool(result.match_matrix[i, 0]) is expected
+
+
+def test_empty_or_does_not_decide_the_match():
+    # A compound without evaluable subconditions is unknown, not False
+    patterns = [
+        {"name": "empty_or", "conditions": [EXPORT, {"type": "compound", "operator": "OR", "conditions": []}]},
+    ]
+    compiled = compile_patterns(patterns)
+    events = [_event(event_type="data_export"), _event()]
+    result = _batch_result(compiled, events)
+    assert [pattern_matches(event, patterns[0]) for event in events] == [True, False]
+    assert [find_matching_pattern(event, compiled) is patterns[0] for event in events] == [True, False]
+    assert [_network_matches(compiled, event) for event in events] == [["empty_or"], []]
+    assert result.match_matrix[:, 0].tolist() == [True, False]
+
+
+def test_pattern_modifier_multiplier():
+    pattern = {"score_modifier": 0.2, "score_multiplier_per_condition": 1.5}
+    assert pattern_modifier(pattern, 0) == pytest.approx(0.2)
+    assert pattern_modifier(pattern, 1) == pytest.approx(0.2)
+    assert pattern_modifier(pattern, 3) == pytest.approx(0.2 * 1.5 ** 2)
+    assert pattern_modifier({"score_modifier": 0.2}, 3) == pytest.approx(0.2)
+
+
+def test_multiplier_counts_matched_subconditions():
+    pattern = {
+        "name": "any_of",
+        "score_modifier": 0.1,
+        "score_multiplier_per_condition": 2.0,
+        "conditions": [{"type": "compound", "operator": "OR", "conditions": [
+            ADMIN, EXPORT, PRIVATE,
+            # A nested compound counts once, however many of its own children match
+            {"type": "compound", "operator": "AND", "conditions": [NIGHT, ADMIN]},
+        ]}],
+    }
+    compiled = compile_patterns([pattern])
+    network = ConditionNetwork(compiled)
+    cases = [
+        (_event(event_type="data_export", ip_address="10.1.1.1"), 1),
+        (_event(event_type="data_export"), 2),
+        (_event(role="admin", event_type="data_export"), 4),
+        (_event(hour=12, role="admin", event_type="data_export"), 3),
+    ]
+    events = [event for event, _ in cases]
+    result = _batch_result(compiled, events)
+    for i, (event, matched) in enumerate(cases):
+        expected = 0.1 * 2.0 ** (matched - 1)
+        [(_, modifier)] = network.matches(event)
+        assert modifier == pytest.approx(expected)
+        assert result.scores[i] == pytest.approx(min(0.5 + expected, 1.0))
@@ -0,0 +1,56 @@
+import numpy as np
+
+from skyfracture.rollups import MultiResolutionRollup, RollupTier
+
+
+def _event(user_id="alice"):
+    return {"user_id": user_id, "event_type": "failed_login", "location": "New York"}
+
+
+def _add(tier, timestamps, scores):
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    codes = {"user_id": np.zeros(len(timestamps), dtype=np.int64)}
+    tier.add_batch(timestamps, np.asarray(scores, dtype=np.float64), codes)
+
+
+def test_buckets_sharing_a_slot_in_one_batch_are_not_merged():
+    tier = RollupTier(1, 900, ["user_id"])
+    _add(tier, [1000, 1900], [0.1, 0.9])
+
+    scores = tier.scores(0, 2000)
+    assert len(scores) == 1
+    assert scores["timestamp"][0] == np.datetime64(1900, "s")
+    assert scores["count"][0] == 1
+    assert scores["min"][0] == scores["max"][0] == 0.9
+    assert tier.count_totals("user_id", 0, 2000)[0] == 1
+
+
+def test_late_event_does_not_reset_a_newer_bucket():
+    tier = RollupTier(1, 900, ["user_id"])
+    _add(tier, [2000], [0.5])
+    _add(tier, [1100], [0.9])
+
+    scores = tier.scores(1400, 2000)
+    assert len(scores) == 1
+    assert scores["count"][0] == 1
+    assert scores["max"][0] == 0.5
+
+
+def test_window_survives_late_events():
+    rollup = MultiResolutionRollup()
+    rollup.add_batch([2000.0, 2001.0], [0.2, 0.4], [_event(), _event("bob")])
+    rollup.add_batch([1100.0], [0.9], [_event("mallory")])
+
+    window = rollup.window(600)
+    assert window.scores["count"].sum() == 2
+    assert window.counts["user_id"] == {"alice": 1, "bob": 1}
+
+
+def test_clear_frees_the_dimension_caps():
+    rollup = MultiResolutionRollup(dimensions={"user_id": 2})
+    rollup.add_batch([1000.0, 1001.0, 1002.0], [0.1, 0.1, 0.1], [_event("a"), _event("b"), _event("c")])
+    assert rollup.window(60).counts["user_id"] == {"a": 1, "b": 1, "(other)": 1}
+
+    rollup.clear()
+    rollup.add_batch([2000.0, 2001.0], [0.1, 0.1], [_event("d"), _event("e")])
+    assert rollup.window(60).counts["user_id"] == {"d": 1, "e": 1}